@@ -3,6 +3,8 @@ import sys
 import yaml
 
 from .api import api_handler as chube_api_handler
+from .api import async_api_handler as chube_async_api_handler
+from .catalog import CatalogCache
 from .plan import Plan
 from .datacenter import Datacenter
 from .kernel import Kernel
@@ -14,12 +16,19 @@ from .dns import Domain
 CHUBE_VERSION = "0.1.18"
 
 def load_chube_config():
-    """Loads the Chube config from ~/.chube."""
+    """Loads the Chube config from ~/.chube.
+
+       If the config has `catalog_cache: true` (or a path), the `avail_*` catalogs are
+       kept on disk between runs; see `help(CatalogCache)`."""
     config_path = os.path.join(os.environ["HOME"], ".chube")
     if os.path.exists(config_path):
         contents = yaml.load(open(config_path, "r"))
         if not hasattr(contents, "__getitem__"):
             raise ValueError("Config file at '%s' must be a valid YAML document; see README.md" % (config_path,))
         chube_api_handler.api_key = contents["api_key"]
+        catalog_cache = contents.get("catalog_cache")
+        if catalog_cache:
+            path = catalog_cache if isinstance(catalog_cache, basestring) else None
+            chube_api_handler.catalog = CatalogCache(path)
         return
     raise OSError("No config file found at '%s'" % (config_path))
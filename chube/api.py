@@ -1,32 +1,621 @@
+import heapq
+import itertools
+import threading
+import time
+import concurrent.futures
+
 from linode import api as linode_api
 
+from .cache import ResponseCache, _cache_key
+from .metrics import Metrics
+from .replay import Recorder, Replayer
+from .session import Session
+from .throttle import AdaptiveThrottle, is_idempotent
+
+
+# API methods whose return values we never need right away. Calls to these can be
+# queued up in a Batch and sent to the API later as part of an `api.batch` request.
+BATCHABLE_SUFFIXES = ("_update", "_delete")
+
 
 class APICallMethod:
     """Imitates a method of the Handler class, and calls a specific API method."""
-    def __init__(self, api_conn, method_name):
-        self._api_conn = api_conn
-        self._method = getattr(self._api_conn, method_name)
+    def __init__(self, handler, method_name):
+        self._handler = handler
+        self._method_name = method_name
     def __call__(self, **kwargs):
-        return self._method(**kwargs)
+        batch = self._handler._current_batch()
+        if batch is not None and batch.accepts(self._method_name):
+            return batch.queue(self._method_name, kwargs)
+        handler, method_name = self._handler, self._method_name
+        if handler.metrics is None:
+            return handler._call(method_name, kwargs)
+        return handler.metrics.measure(method_name, kwargs,
+                                       lambda: handler._call(method_name, kwargs))
+
+
+class BatchError(RuntimeError):
+    """Raised when one or more of the calls sent as part of a Batch failed.
+
+       `failed_calls` is the list of BatchedCall objects whose `error` is set."""
+    def __init__(self, failed_calls):
+        self.failed_calls = failed_calls
+        summary = ", ".join(["%s: %s" % (call.method_name, call.error) for call in failed_calls[:5]])
+        if len(failed_calls) > 5: summary += ", ..."
+        RuntimeError.__init__(self, "%d batched API call(s) failed (%s)" % (len(failed_calls), summary))
+
+
+class BatchedCall:
+    """An API call that has been queued in a Batch.
+
+       Its result becomes available once the Batch has been flushed. If the Batch is
+       discarded instead, the call fails with a RuntimeError."""
+    def __init__(self, method_name, kwargs):
+        self.method_name = method_name
+        self.kwargs = kwargs
+        self.error = None
+        self._data = None
+        self._done = False
+        self._callbacks = []
+
+    def done(self):
+        """Determines whether the call has been sent and its response processed."""
+        return self._done
+
+    def result(self):
+        """Returns the API's response to the call.
+
+           Raises the call's error if it failed, or a `RuntimeError` if the Batch
+           hasn't been flushed yet."""
+        if not self._done:
+            raise RuntimeError("Batched call to '%s' hasn't been sent yet" % (self.method_name,))
+        if self.error is not None:
+            raise self.error
+        return self._data
+
+    def add_done_callback(self, func):
+        """Arranges for `func` to be called with the BatchedCall once it's done,
+           whether it succeeded or not. If it's done already, `func` is called right
+           away."""
+        if self._done: func(self)
+        else: self._callbacks.append(func)
+
+    def _resolve(self, response):
+        """Processes this call's entry in the list returned by an `api.batch` request."""
+        errors = response.get(u"ERRORARRAY", [])
+        if errors and errors[0].get(u"ERRORCODE") != 0:
+            self._fail(linode_api.ApiError(errors))
+            return
+        self._data = response.get(u"DATA")
+        self._finish()
+
+    def _fail(self, error):
+        self.error = error
+        self._finish()
+
+    def _finish(self):
+        self._done = True
+        callbacks, self._callbacks = self._callbacks, []
+        for func in callbacks: func(self)
+
+    def __repr__(self):
+        return "<BatchedCall method_name='%s'>" % (self.method_name,)
+
+
+class Batch:
+    """Collects write calls and sends them to the API in `api.batch` requests.
+
+       Get one from `Handler.batch` and use it as a context manager:
+
+           with chube_api_handler.batch() as b:
+               for node in Linode.search(label_begins="web-"):
+                   node.display_group = "web"
+                   node.save()
+
+       Inside the `with` block, calls to `*_update` and `*_delete` methods are queued
+       instead of being sent. When the block exits, they are sent `chunk_size` at a time,
+       and each queued call's result can be retrieved from `b.calls`. All other API
+       calls go through immediately as usual. If the block raises an exception, the
+       queued calls are discarded (and fail with a RuntimeError).
+
+       A Batch only collects calls made from the thread that entered it, and from the
+       functions that thread runs through `Handler.map`."""
+    def __init__(self, handler, chunk_size=25, raise_errors=True):
+        """Initializes the Batch.
+
+           `handler`: The Handler whose calls are being batched.
+           `chunk_size` (optional): Maximum number of calls to send in one `api.batch`
+               request.
+           `raise_errors` (optional): If True, `flush` raises a BatchError when any of
+               the calls fails. Otherwise, check each call's `error` attribute."""
+        self.chunk_size = chunk_size
+        self.raise_errors = raise_errors
+        self.calls = []
+        self._handler = handler
+        self._pending = []
+
+    def __enter__(self):
+        if self._handler._current_batch() is not None:
+            raise RuntimeError("Batches can't be nested")
+        self._handler._local.batch = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._handler._local.batch = None
+        if exc_type is None:
+            self.flush()
+        else:
+            pending, self._pending = self._pending, []
+            for call in pending:
+                call._fail(RuntimeError("Batched call to '%s' was discarded" % (call.method_name,)))
+        return False
+
+    def accepts(self, method_name):
+        """Determines whether calls to the given API method can be deferred."""
+        return method_name.endswith(BATCHABLE_SUFFIXES)
+
+    def queue(self, method_name, kwargs):
+        """Queues a call to the given API method and returns its BatchedCall."""
+        call = BatchedCall(method_name, kwargs)
+        self.calls.append(call)
+        self._pending.append(call)
+        return call
+
+    def flush(self):
+        """Sends all the queued calls and returns their BatchedCall objects."""
+        pending, self._pending = self._pending, []
+        for i in range(0, len(pending), self.chunk_size):
+            self._send(pending[i:i + self.chunk_size])
+        if self._handler.cache is not None:
+            for call in pending: self._handler.cache.invalidate_for_write(call.method_name)
+        failed_calls = [call for call in pending if call.error is not None]
+        if failed_calls and self.raise_errors:
+            raise BatchError(failed_calls)
+        return pending
+
+    def _send(self, chunk):
+        """Sends a single `api.batch` request and resolves the calls in it."""
+        api = self._handler._new_api(batching=True)
+        for call in chunk:
+            getattr(api, call.method_name)(**call.kwargs)
+        send = lambda: self._handler._throttled("batch", api.batchFlush, {})
+        try:
+            if self._handler.metrics is None: responses = send()
+            else: responses = self._handler.metrics.measure("batch", {}, send)
+        except Exception, e:
+            for call in chunk: call._fail(e)
+            return
+        for call, response in zip(chunk, responses):
+            call._resolve(response)
+        for call in chunk[len(responses):]:
+            call._fail(RuntimeError("API returned no response for batched call to '%s'" % (call.method_name,)))
+
+
+class WorkerPool:
+    """A pool of worker threads that's started the first time it's needed.
+
+       Calls submitted from one of the pool's own threads run right away in that thread,
+       since waiting on the pool from inside the pool could deadlock."""
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def submit(self, func, **kwargs):
+        """Calls `func` with the given keyword arguments in a worker thread.
+
+           Returns a `concurrent.futures.Future` for the result."""
+        if getattr(self._local, "is_worker", False):
+            future = concurrent.futures.Future()
+            try:
+                future.set_result(func(**kwargs))
+            except Exception, e:
+                future.set_exception(e)
+            return future
+        return self._get_executor().submit(self._run, func, kwargs)
+
+    def shutdown(self, wait=True):
+        """Stops the worker threads. They will be started again if they're needed later."""
+        self._lock.acquire()
+        try:
+            executor, self._executor = self._executor, None
+        finally:
+            self._lock.release()
+        if executor is not None: executor.shutdown(wait=wait)
+
+    def _get_executor(self):
+        self._lock.acquire()
+        try:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+        finally:
+            self._lock.release()
+
+    def _run(self, func, kwargs):
+        self._local.is_worker = True
+        return func(**kwargs)
+
+
+class Scheduler:
+    """Calls functions after a delay, all from a single thread that's started the first
+       time it's needed, however many calls are waiting.
+
+       The functions run one after the other in that thread, so they should be quick;
+       anything slow (like an API call) should be handed to a WorkerPool."""
+    def __init__(self):
+        self._queue = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def call_later(self, delay, func):
+        """Calls `func()` in the scheduler's thread after `delay` seconds."""
+        self._condition.acquire()
+        try:
+            heapq.heappush(self._queue, (time.time() + delay, next(self._counter), func))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="chube-scheduler")
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify()
+        finally:
+            self._condition.release()
+
+    def _run(self):
+        while True:
+            self._condition.acquire()
+            try:
+                while not self._queue or self._queue[0][0] > time.time():
+                    if self._queue: self._condition.wait(self._queue[0][0] - time.time())
+                    else: self._condition.wait()
+                func = heapq.heappop(self._queue)[2]
+            finally:
+                self._condition.release()
+            try:
+                func()
+            except Exception:
+                # There's no one to report it to, and the other calls must still run.
+                pass
 
 
 class Handler:
     """Passes on API calls to the linode library.
-    
+
        You must set `api_key` before calling any API methods.
-       
-       The API methods you can call are the same as those offered by `linode.api.Api`."""
+
+       The API methods you can call are the same as those offered by `linode.api.Api`.
+
+       `api_factory` is the callable used to create API connection objects. It's called
+       like `linode.api.Api` (which is the default) and must return an object with the
+       same interface. Set it to `PooledTransport(...).api` (from `chube.transport`) to
+       reuse HTTP connections between calls.
+
+       A Handler may be shared between threads; each thread gets its own API connection
+       object. `submit` and `map` run calls concurrently on the `workers` WorkerPool
+       (16 threads unless you change `workers.max_workers` before using it).
+
+       Every call goes through `throttle`, an AdaptiveThrottle (see `chube.throttle`)
+       that slows down and retries when the API starts rate-limiting us. Set it to
+       `None` to turn throttling off.
+
+       Responses to read-only calls are cached in `cache`, a ResponseCache (see
+       `chube.cache`). By default only the `avail_*` catalogs are cached, for an hour.
+       Set it to `None` to turn caching off.
+
+       `catalog` is an optional CatalogCache (see `chube.catalog`) that keeps the
+       `avail_*` catalogs on disk, so that new processes don't have to fetch them
+       again. It's `None` (off) unless you set it, or `load_chube_config()` does.
+
+       When several threads make the same read-only call (same method, same arguments)
+       at the same time, only the first one goes to the API; the others wait for it and
+       share its response, or its exception. `coalesced_count` counts the calls that
+       were saved that way. Set `coalesce` to False to turn this off.
+
+       Every call's latency, outcome and response size is recorded in `metrics`, a
+       Metrics object (see `chube.metrics`); `stats()` returns what's been recorded.
+       Set it to `None` to turn this off."""
     def __init__(self):
         self.api_key = None
-        self._api = None
+        self.api_factory = linode_api.Api
+        self.throttle = AdaptiveThrottle()
+        self.cache = ResponseCache()
+        self.catalog = None
+        self.coalesce = True
+        self.coalesced_count = 0
+        self.metrics = Metrics()
+        self.workers = WorkerPool(16)
+        self._local = threading.local()
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
     def __getattr__(self, name):
-        return APICallMethod(self._get_api(), name)
+        return APICallMethod(self, name)
+    def submit(self, method, **kwargs):
+        """Runs a call on the worker pool and returns a `concurrent.futures.Future` for it.
+
+           `method`: The name of an API method (like "linode_disk_list") or any callable.
+               The keyword arguments are passed on to it.
+
+           For example, `api_handler.submit("linode_disk_list", linodeid=1234)`.
+
+           The call runs in the calling thread's Session, if it's in one. (Not in its
+           Batch, though, since the Batch may be sent before the call is made.)"""
+        if isinstance(method, basestring): method = getattr(self, method)
+        return self.workers.submit(self._in_caller_context(method, batch=False), **kwargs)
+    def map(self, method, iterable):
+        """Runs `method` once for each item of `iterable` on the worker pool.
+
+           If `method` is the name of an API method, each item must be a dict of keyword
+           arguments for it. Otherwise, `method` is a callable that gets called with each
+           item as its only argument. For example,
+
+               disks = api_handler.map("linode_disk_list",
+                                       [{"linodeid": n.api_id} for n in nodes])
+               disks_and_configs = api_handler.map(lambda n: (n.disks, n.configs), nodes)
+
+           Returns the list of results, in the same order as `iterable`. If any of the
+           calls raised an exception, the first one is re-raised here.
+
+           The calls run in the calling thread's Session and Batch, if it's in them, so
+           for instance the objects they build join the caller's Session."""
+        if isinstance(method, basestring):
+            run = self._in_caller_context(getattr(self, method))
+            future_list = [self.workers.submit(run, **kwargs) for kwargs in iterable]
+        else:
+            run = self._in_caller_context(lambda item: method(item))
+            future_list = [self.workers.submit(run, item=item) for item in iterable]
+        return [future.result() for future in future_list]
+    def shutdown(self, wait=True):
+        """Stops the worker pool. It will be started again if it's needed later."""
+        self.workers.shutdown(wait=wait)
+    def stats(self):
+        """Returns a dict mapping each API method called so far to a dict of counters:
+           `calls`, `errors`, `seconds`, `mean_seconds`, `max_seconds`, `items` (number
+           of records returned) and `buckets` (a latency histogram).
+
+           For example, to see which methods took up the most time,
+
+               stats = chube_api_handler.stats()
+               for name in sorted(stats, key=lambda n: -stats[n]["seconds"]):
+                   print name, stats[name]["calls"], stats[name]["seconds"]"""
+        if self.metrics is None: return {}
+        return self.metrics.stats()
+    def record(self, path):
+        """Starts recording every API call to the given file, and returns the Recorder.
+
+           Call the Recorder's `close()` method when you're done. See `chube.replay`."""
+        recorder = Recorder(path, api_factory=self.api_factory)
+        self.api_factory = recorder.api
+        return recorder
+    def replay(self, path, latency=None):
+        """Answers API calls from a recording made with `record` from now on, without
+           touching the network, and returns the Replayer.
+
+           `latency` (optional): See `help(chube.replay.Replayer.__init__)`."""
+        replayer = Replayer(path, latency=latency)
+        self.api_factory = replayer.api
+        # Recorded calls don't need a real key, but Handler won't call without one.
+        if self.api_key is None: self.api_key = "replay"
+        return replayer
+    def batch(self, chunk_size=25, raise_errors=True):
+        """Returns a Batch for grouping write calls into `api.batch` requests.
+
+           See `help(Batch)` for usage."""
+        return Batch(self, chunk_size=chunk_size, raise_errors=raise_errors)
+    def session(self):
+        """Returns a Session that makes model lookups share instances.
+
+           See `help(chube.session.Session)` for usage."""
+        return Session(self)
+    def _call(self, method_name, kwargs):
+        """Makes an API call through this thread's API connection."""
+        cache = self.cache
+        if cache is not None and cache.ttl_for(method_name) > 0:
+            hit, response = cache.get(method_name, kwargs)
+            if hit: return response
+        catalog = self.catalog
+        if catalog is not None:
+            hit, response = catalog.get(method_name, kwargs)
+            if hit:
+                if cache is not None: cache.put(method_name, kwargs, response)
+                return response
+        if self.coalesce and is_idempotent(method_name):
+            response = self._fetch_once(method_name, kwargs)
+        else:
+            response = self._fetch(method_name, kwargs)
+        if catalog is not None: catalog.put(method_name, kwargs, response)
+        if cache is not None:
+            if is_idempotent(method_name): cache.put(method_name, kwargs, response)
+            else: cache.invalidate_for_write(method_name)
+        return response
+    def _fetch(self, method_name, kwargs):
+        """Makes an API call over the network, bypassing the caches."""
+        return self._throttled(method_name, getattr(self._get_api(), method_name), kwargs)
+    def _fetch_once(self, method_name, kwargs):
+        """Like `_fetch`, but shares the result with identical calls made meanwhile."""
+        key = _cache_key(method_name, kwargs)
+        if key is None: return self._fetch(method_name, kwargs)
+        self._in_flight_lock.acquire()
+        try:
+            shared = self._in_flight.get(key)
+            if shared is not None:
+                self.coalesced_count += 1
+            else:
+                self._in_flight[key] = concurrent.futures.Future()
+        finally:
+            self._in_flight_lock.release()
+        if shared is not None: return shared.result()
+
+        response, error = None, None
+        try:
+            response = self._fetch(method_name, kwargs)
+        except BaseException, error:
+            raise
+        finally:
+            # Stop new callers from joining before handing out the result, so nobody
+            # gets a response that was fetched before they made their call.
+            self._in_flight_lock.acquire()
+            try:
+                shared = self._in_flight.pop(key)
+            finally:
+                self._in_flight_lock.release()
+            if error is None: shared.set_result(response)
+            else: shared.set_exception(error)
+        return response
+    def _throttled(self, method_name, func, kwargs):
+        if self.throttle is None:
+            return func(**kwargs)
+        return self.throttle.call(method_name, func, kwargs)
     def _get_api(self):
+        local = self._local
+        if getattr(local, "api", None) is None or local.api_factory is not self.api_factory:
+            local.api = self._new_api()
+            local.api_factory = self.api_factory
+        return local.api
+    def _new_api(self, batching=False):
         if self.api_key is None:
             raise RuntimeError("You must set the Handler's `api_key` attribute before using it")
-        if self._api is None:
-            self._api = linode_api.Api(self.api_key)
-        return self._api
+        return self.api_factory(self.api_key, batching=batching)
+    def _current_batch(self):
+        return getattr(self._local, "batch", None)
+    def _current_session(self):
+        return getattr(self._local, "session", None)
+    def _in_caller_context(self, func, batch=True):
+        """Wraps `func` so that it runs with the calling thread's Session (and Batch,
+           if `batch` is True), whichever thread it runs in."""
+        session = self._current_session()
+        batch = self._current_batch() if batch else None
+        if session is None and batch is None: return func
+        def run(**kwargs):
+            local = self._local
+            previous = (getattr(local, "session", None), getattr(local, "batch", None))
+            local.session, local.batch = session, batch
+            try:
+                return func(**kwargs)
+            finally:
+                local.session, local.batch = previous
+        return run
+
+
+class AsyncHandler:
+    """Non-blocking counterpart to Handler.
+
+       Every API method returns a `concurrent.futures.Future` right away, and the call
+       itself runs on the AsyncHandler's own `workers` pool:
+
+           future = async_api_handler.linode_list()
+           # ...do other things...
+           print future.result()
+
+       At most `max_concurrency` calls are in flight at a time; the rest wait their turn,
+       so thousands of operations can be started at once. Models offer the same thing
+       through `search_async`, `find_async`, `save_async`, `refresh_async` and
+       `destroy_async`, which convert API responses exactly like their blocking
+       counterparts.
+
+       `scheduler` is a Scheduler for calls that must wait a while before they're
+       submitted, like `Job.wait_async`'s checks."""
+    def __init__(self, handler, max_concurrency=64):
+        """Initializes the AsyncHandler.
+
+           `handler`: The Handler that makes the actual API calls.
+           `max_concurrency` (optional): Maximum number of calls in flight at once."""
+        self.handler = handler
+        self.workers = WorkerPool(max_concurrency)
+        self.scheduler = Scheduler()
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        api_method = getattr(self.handler, name)
+        def submit_call(**kwargs):
+            return self.workers.submit(api_method, **kwargs)
+        submit_call.__name__ = name
+        return submit_call
+    def submit(self, method, **kwargs):
+        """Runs a call without blocking and returns a `concurrent.futures.Future` for it.
+
+           `method`: The name of an API method (like "linode_disk_list") or any callable.
+               The keyword arguments are passed on to it."""
+        if isinstance(method, basestring): method = getattr(self.handler, method)
+        return self.workers.submit(method, **kwargs)
+    def shutdown(self, wait=True):
+        """Stops the worker pool. It will be started again if it's needed later."""
+        self.workers.shutdown(wait=wait)
 
 
 api_handler = Handler()
+async_api_handler = AsyncHandler(api_handler)
+
+
+class BatchTest:
+    """Suite of offline tests to run when `chuber test Batch` is called. They run
+       against a FakeAccount, so they don't need an API key."""
+    @classmethod
+    def run(cls):
+        from .fake_api import FakeAccount
+
+        account = FakeAccount(job_duration=0)
+        account.seed(linodes=60)
+        uninstall = account.install(api_handler)
+        requests = []
+        log_call = lambda method_name, kwargs: requests.append(method_name)
+        api_handler.metrics.before_hooks.append(log_call)
+        try:
+            linode_ids = [d[u"LINODEID"] for d in api_handler.linode_list()]
+
+            print "~~~ Queueing updates and sending them in chunks"
+            print
+            del requests[:]
+            done = []
+            with api_handler.batch(chunk_size=25) as batch:
+                for linode_id in linode_ids:
+                    call = api_handler.linode_update(linodeid=linode_id, label=u"chube-test-%d" % (linode_id,))
+                    assert isinstance(call, BatchedCall) and not call.done()
+                call.add_done_callback(done.append)
+                try:
+                    call.result()
+                    assert False, "result() should raise before the batch is sent"
+                except RuntimeError:
+                    pass
+                assert api_handler.linode_list(linodeid=linode_ids[0])[0][u"LABEL"] != u"chube-test-%d" % (linode_ids[0],)
+                try:
+                    with api_handler.batch():
+                        pass
+                    assert False, "batches shouldn't nest"
+                except RuntimeError:
+                    pass
+            assert requests == ["linode_list", "batch", "batch", "batch"]
+            assert done == [call]
+            assert [c.result() for c in batch.calls] == [{u"LinodeID": linode_id} for linode_id in linode_ids]
+            assert [d[u"LABEL"] for d in api_handler.linode_list()] == \
+                [u"chube-test-%d" % (linode_id,) for linode_id in linode_ids]
+
+            print "~~~ Reporting failed calls"
+            print
+            try:
+                with api_handler.batch():
+                    api_handler.linode_update(linodeid=linode_ids[0], label=u"ok")
+                    api_handler.linode_update(linodeid=-1, label=u"missing")
+                assert False, "a BatchError should have been raised"
+            except BatchError, e:
+                assert [call.kwargs["linodeid"] for call in e.failed_calls] == [-1]
+            with api_handler.batch(raise_errors=False) as batch:
+                api_handler.linode_delete(linodeid=-1)
+            assert isinstance(batch.calls[0].error, linode_api.ApiError)
+
+            print "~~~ Discarding the calls when the block raises"
+            print
+            try:
+                with api_handler.batch() as batch:
+                    api_handler.linode_delete(linodeid=linode_ids[1], skipchecks=True)
+                    raise KeyError("discard the batch")
+            except KeyError:
+                pass
+            assert batch.calls[0].done() and isinstance(batch.calls[0].error, RuntimeError)
+            assert api_handler.linode_list(linodeid=linode_ids[1])
+        finally:
+            api_handler.metrics.before_hooks.remove(log_call)
+            uninstall()
+
+        print "~~~ Tests passed!"
@@ -0,0 +1,335 @@
+"""Benchmarks for chube's own overhead.
+
+   Run them with `chuber bench <name>`. For example, `chuber bench transport` or
+   `chuber bench models --sizes 1000,10000 --json results.json`."""
+import gc
+import os
+import json
+import platform
+import resource
+import shutil
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib2
+import BaseHTTPServer
+import SocketServer
+
+from linode import api as linode_api
+
+from .api import api_handler
+from .dns import Domain, Record
+from .fake_api import FakeAccount
+from .linode_obj import Linode, Config, Disk, Job
+from .nodebalancer import NodebalancerNode
+from .transport import PooledTransport, TransportApi
+
+
+# Numbers of objects ModelBenchmark runs with by default.
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+
+class LocalHTTPSServer:
+    """A local HTTPS stand-in for the Linode API, for use as a context manager.
+
+       It answers every request with an empty successful response, over HTTP/1.1 with
+       keep-alive, using a throwaway self-signed certificate for `localhost`. Requires
+       the `openssl` command."""
+    def __init__(self):
+        self.url = None
+        self.cafile = None
+        self._tmpdir = None
+        self._server = None
+
+    def __enter__(self):
+        self._tmpdir = tempfile.mkdtemp(prefix="chube-bench-")
+        self.cafile = os.path.join(self._tmpdir, "cert.pem")
+        keyfile = os.path.join(self._tmpdir, "key.pem")
+        devnull = open(os.devnull, "w")
+        try:
+            subprocess.check_call(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+                                   "-days", "1", "-subj", "/CN=localhost",
+                                   "-keyout", keyfile, "-out", self.cafile],
+                                  stdout=devnull, stderr=devnull)
+        finally:
+            devnull.close()
+
+        self._server = _ThreadedHTTPServer(("127.0.0.1", 0), _StandInRequestHandler)
+        self._server.socket = ssl.wrap_socket(self._server.socket, certfile=self.cafile,
+                                              keyfile=keyfile, server_side=True)
+        self.url = "https://localhost:%d/" % (self._server.server_address[1],)
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._server.shutdown()
+        self._server.server_close()
+        shutil.rmtree(self._tmpdir)
+        return False
+
+
+class _ThreadedHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up on kept-alive connections isn't worth a traceback.
+        pass
+
+
+class _StandInRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Buffer the response so it goes out in one segment; otherwise Nagle's algorithm
+    # and delayed ACKs add ~40ms to every call on a kept-alive connection.
+    wbufsize = -1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps({"ACTION": "linode.job.list", "ERRORARRAY": [], "DATA": []})
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _time_calls(api, calls):
+    """Calls `linode_job_list` on `api` `calls` times and returns the sorted latencies."""
+    latencies = []
+    for i in range(calls):
+        start = time.time()
+        api.linode_job_list(linodeid=1)
+        latencies.append(time.time() - start)
+    latencies.sort()
+    return latencies
+
+
+def _print_latencies(name, latencies):
+    mean = sum(latencies) / len(latencies)
+    print "%-14s mean %7.2f ms   median %7.2f ms   p95 %7.2f ms" % (
+        name, 1000 * mean, 1000 * latencies[len(latencies) // 2],
+        1000 * latencies[int(len(latencies) * 0.95)])
+    return mean
+
+
+class TransportBenchmark:
+    """Compares per-call latency of linode-python's transport and PooledTransport."""
+    @classmethod
+    def run(cls, calls=200):
+        with LocalHTTPSServer() as server:
+            print "~~~ Timing %d calls through linode-python against %s" % (calls, server.url)
+            print
+            context = ssl.create_default_context(cafile=server.cafile)
+            orig_url = linode_api.LINODE_API_URL
+            orig_bundle = os.environ.get("REQUESTS_CA_BUNDLE")
+            linode_api.LINODE_API_URL = server.url
+            urllib2.install_opener(urllib2.build_opener(urllib2.HTTPSHandler(context=context)))
+            os.environ["REQUESTS_CA_BUNDLE"] = server.cafile
+            try:
+                baseline = _time_calls(linode_api.Api("bench-key"), calls)
+            finally:
+                linode_api.LINODE_API_URL = orig_url
+                urllib2.install_opener(None)
+                if orig_bundle is None: del os.environ["REQUESTS_CA_BUNDLE"]
+                else: os.environ["REQUESTS_CA_BUNDLE"] = orig_bundle
+
+            print "~~~ Timing %d calls through PooledTransport" % (calls,)
+            print
+            transport = PooledTransport(ssl_context=context)
+            pooled = _time_calls(TransportApi("bench-key", transport=transport, url=server.url),
+                                 calls)
+            transport.close()
+
+            baseline_mean = _print_latencies("linode-python", baseline)
+            pooled_mean = _print_latencies("pooled", pooled)
+            print
+            print "connections opened by PooledTransport: %d" % (transport.connections_opened,)
+            print "speedup: %.1fx" % (baseline_mean / pooled_mean,)
+
+
+class ModelBenchmark:
+    """Measures chube's own CPU and memory cost when building and searching models.
+
+       For each size N, it seeds a FakeAccount with N Linodes (each with two disks and
+       a config using them) and a domain with N records, then times:
+
+       - `Linode.from_api_dict` on N `linode.list` entries, eagerly and with
+         `lazy_hydration` (reading one attribute of each),
+       - `Linode.search` with `label_begins` and two more criteria, matching about 100
+         Linodes,
+       - `Domain.search_records` with `name_begins` and `record_type`, matching about
+         100 records, and
+       - `Config.disks` on the configs of the first 1000 Linodes.
+
+       For each case it reports operations per second, the number of container objects
+       still alive when it finished (which is what the case's result holds on to), and
+       the process's peak RSS so far."""
+    @classmethod
+    def run(cls, sizes=DEFAULT_SIZES, json_path=None):
+        """Runs the benchmark.
+
+           `sizes` (optional): The numbers of objects to run with.
+           `json_path` (optional): A file to write the results to, as JSON."""
+        results = []
+        orig_key, orig_factory = api_handler.api_key, api_handler.api_factory
+        try:
+            for size in sizes:
+                print "~~~ Seeding a fake account with %d Linodes and %d DNS records" % (size, size)
+                print
+                account = FakeAccount()
+                account.seed(linodes=size, disks_per_linode=2, configs_per_linode=1,
+                             ips_per_linode=0, domains=1, records_per_domain=size)
+                api_handler.api_key = "bench-key"
+                api_handler.api_factory = account.api
+
+                linode_dicts = api_handler.linode_list()
+                # Labels are like "linode6000"; this prefix matches about 100 of them.
+                label_prefix = linode_dicts[0][u"LABEL"][:-2]
+                domain = Domain.search()[0]
+                name_prefix = domain.search_records()[0].name[:-2]
+                configs = []
+                for api_dict in linode_dicts[:1000]:
+                    configs.extend(Config.search(linode=api_dict[u"LINODEID"]))
+
+                results.append(_measure("from_api_dict", size, len(linode_dicts),
+                    lambda: [Linode.from_api_dict(d) for d in linode_dicts]))
+                results.append(_measure("from_api_dict (lazy)", size, len(linode_dicts),
+                    lambda: _hydrate_lazily(Linode, linode_dicts)))
+                results.append(_measure("Linode.search", size, 1,
+                    lambda: Linode.search(label_begins=label_prefix, status=Linode.STATUS_RUNNING,
+                                          datacenter_id=2)))
+                results.append(_measure("Domain.search_records", size, 1,
+                    lambda: domain.search_records(name_begins=name_prefix, record_type=u"A")))
+                results.append(_measure("Config.disks", size, len(configs),
+                    lambda: [config.disks for config in configs]))
+                # Don't let this size's objects inflate the next size's measurements.
+                linode_dicts = domain = configs = account = None
+        finally:
+            api_handler.api_key, api_handler.api_factory = orig_key, orig_factory
+
+        print "%-22s %8s %14s %10s %12s %14s" % ("case", "size", "ops/sec", "seconds",
+                                                 "gc objects", "peak RSS (MB)")
+        for r in results:
+            print "%-22s %8d %14.1f %10.3f %12d %14.1f" % (
+                r["case"], r["size"], r["ops_per_sec"], r["seconds"], r["gc_objects"],
+                r["peak_rss_kb"] / 1024.0)
+
+        if json_path is not None:
+            from . import CHUBE_VERSION
+            f = open(json_path, "w")
+            try:
+                json.dump({"benchmark": "models", "chube_version": CHUBE_VERSION,
+                           "python_version": platform.python_version(),
+                           "results": results}, f, indent=2, sort_keys=True)
+            finally:
+                f.close()
+            print
+            print "Wrote %s" % (json_path,)
+        return results
+
+
+def _hydrate_lazily(model, api_dicts):
+    orig_lazy = model.__dict__.get("lazy_hydration")
+    model.lazy_hydration = True
+    try:
+        instances = [model.from_api_dict(d) for d in api_dicts]
+        for inst in instances: inst.label
+        return instances
+    finally:
+        if orig_lazy is None: del model.lazy_hydration
+        else: model.lazy_hydration = orig_lazy
+
+
+def _measure(case, size, ops, func):
+    """Calls `func()`, which performs `ops` operations, and returns a dict of results."""
+    gc.collect()
+    gc.disable()
+    try:
+        objects_before = len(gc.get_objects())
+        start = time.time()
+        result = func()
+        seconds = time.time() - start
+        gc_objects = len(gc.get_objects()) - objects_before
+        del result
+    finally:
+        gc.enable()
+    return {"case": case, "size": size, "ops": ops, "seconds": seconds,
+            "ops_per_sec": ops / seconds if seconds > 0 else float("inf"),
+            "gc_objects": gc_objects,
+            "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+class MemoryBenchmark:
+    """Compares the memory taken by model instances with that of the same values kept
+       in a per-instance `__dict__`, which is how models stored them before they had
+       `__slots__`.
+
+       Sizes count each instance and its `__dict__` (if any), not the attribute values
+       themselves, which are the same either way."""
+    @classmethod
+    def run(cls, count=10000, json_path=None):
+        """Runs the benchmark.
+
+           `count` (optional): Number of instances of each model to build.
+           `json_path` (optional): A file to write the results to, as JSON."""
+        print "~~~ Building %d instances of each model from a fake account" % (count,)
+        print
+        account = FakeAccount(job_duration=0)
+        account.seed(linodes=count, disks_per_linode=1, jobs_per_linode=1, domains=1,
+                     records_per_domain=count, nodebalancers=1, configs_per_nodebalancer=1,
+                     nodes_per_config=count)
+        linode_id = account.call("linode_list", {})[0][u"LINODEID"]
+        domain_id = account.call("domain_list", {})[0][u"DOMAINID"]
+        config_id = account.call("nodebalancer_config_list", {
+            "nodebalancerid": account.call("nodebalancer_list", {})[0][u"NODEBALANCERID"]})[0][u"CONFIGID"]
+        samples = [
+            (Linode, account.call("linode_list", {})),
+            (Disk, account.call("linode_disk_list", {"linodeid": linode_id}) * count),
+            (Job, account.call("linode_job_list", {"linodeid": linode_id}) * count),
+            (Record, account.call("domain_resource_list", {"domainid": domain_id})),
+            (NodebalancerNode, account.call("nodebalancer_node_list", {"configid": config_id})),
+        ]
+
+        results = []
+        print "%-18s %10s %16s %16s %8s" % ("model", "instances", "bytes (before)",
+                                            "bytes (after)", "saved")
+        for model, api_dicts in samples:
+            instances = [model.from_api_dict(d) for d in api_dicts]
+            before = sum([_dict_instance_size(model, inst) for inst in instances]) / len(instances)
+            # Instances built by from_api_dict don't have a `__dict__` to add.
+            after = sum([sys.getsizeof(inst) for inst in instances]) / len(instances)
+            results.append({"model": model.__name__, "instances": len(instances),
+                            "bytes_per_instance_before": before,
+                            "bytes_per_instance_after": after})
+            print "%-18s %10d %16d %16d %7.0f%%" % (model.__name__, len(instances), before,
+                                                    after, 100.0 * (before - after) / before)
+
+        if json_path is not None:
+            f = open(json_path, "w")
+            try:
+                json.dump({"benchmark": "memory", "results": results}, f, indent=2,
+                          sort_keys=True)
+            finally:
+                f.close()
+            print
+            print "Wrote %s" % (json_path,)
+        return results
+
+
+class _DictInstance(object):
+    pass
+
+
+def _dict_instance_size(model, inst):
+    """Returns the size `inst` would have if its values were kept in a `__dict__`."""
+    plain = _DictInstance()
+    for attr in model.direct_attrs:
+        setattr(plain, attr.local_name, getattr(inst, attr.local_name))
+    return sys.getsizeof(plain) + sys.getsizeof(plain.__dict__)
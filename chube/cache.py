@@ -0,0 +1,195 @@
+"""Module for caching the responses of read-only API calls."""
+import threading
+import time
+from collections import OrderedDict
+
+from .throttle import is_idempotent
+
+
+# How long, in seconds, to cache each read-only API method's responses by default. Keys
+# are either method names or prefixes ending in "*". Methods not listed here aren't
+# cached unless you add them to `ResponseCache.ttls`.
+DEFAULT_TTLS = {
+    "avail_*": 3600,
+}
+
+
+class ResponseCache(object):
+    """A size-bounded LRU cache of API responses, with a TTL per API method.
+
+       Only read-only methods (`*_list` and `avail_*`) are ever cached, and only those
+       with a TTL in `ttls`. By default that's just the `avail_*` catalogs; to cache
+       `linode_list` responses for 30 seconds, for example, do
+
+           chube_api_handler.cache.ttls["linode_list"] = 30
+
+       Calls to any other method in the same family (e.g. `linode_update` or
+       `linode_disk_create` for `linode_*`) clear the family's cached responses.
+
+       Cached responses are shared between callers, so don't modify them.
+
+       A ResponseCache is safe to share between threads."""
+    def __init__(self, ttls=None, max_entries=256):
+        """Initializes the ResponseCache.
+
+           `ttls` (optional): A dict of TTLs to use instead of DEFAULT_TTLS.
+           `max_entries` (optional): Maximum number of responses to keep. When it's
+               reached, the least recently used response is evicted."""
+        if ttls is None: ttls = DEFAULT_TTLS
+        self.ttls = dict(ttls)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def ttl_for(self, method_name):
+        """Returns the TTL for the given API method, or 0 if it isn't cached."""
+        if not is_idempotent(method_name): return 0
+        if self.ttls.has_key(method_name): return self.ttls[method_name]
+        best_prefix, ttl = "", 0
+        for pattern, pattern_ttl in self.ttls.items():
+            if not pattern.endswith("*"): continue
+            prefix = pattern[:-1]
+            if method_name.startswith(prefix) and len(prefix) >= len(best_prefix):
+                best_prefix, ttl = prefix, pattern_ttl
+        return ttl
+
+    def get(self, method_name, kwargs):
+        """Looks up a cached response.
+
+           Returns a `(hit, response)` tuple; `response` is None if `hit` is False."""
+        key = _cache_key(method_name, kwargs)
+        if key is None: return False, None
+        self._lock.acquire()
+        try:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, response = entry
+                if expires > time.time():
+                    del self._entries[key]
+                    self._entries[key] = entry
+                    self.hits += 1
+                    return True, response
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+        finally:
+            self._lock.release()
+
+    def put(self, method_name, kwargs, response):
+        """Caches a response, if the method has a TTL."""
+        ttl = self.ttl_for(method_name)
+        key = _cache_key(method_name, kwargs)
+        if ttl <= 0 or key is None: return
+        self._lock.acquire()
+        try:
+            if self._entries.has_key(key): del self._entries[key]
+            self._entries[key] = (time.time() + ttl, response)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        finally:
+            self._lock.release()
+
+    def invalidate(self, method_name=None):
+        """Drops the cached responses for the given API method, or all of them."""
+        self._lock.acquire()
+        try:
+            if method_name is None:
+                self._entries.clear()
+                return
+            for key in [k for k in self._entries if k[0] == method_name]:
+                del self._entries[key]
+        finally:
+            self._lock.release()
+
+    def invalidate_for_write(self, method_name):
+        """Drops the cached responses that a call to the given write method may have
+           made stale, i.e. those of every method in the same family."""
+        family = method_name.split("_", 1)[0] + "_"
+        self._lock.acquire()
+        try:
+            for key in [k for k in self._entries if k[0].startswith(family)]:
+                del self._entries[key]
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        """Returns a dict of hit, miss and eviction counts and the current size."""
+        self._lock.acquire()
+        try:
+            return {"hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "entries": len(self._entries)}
+        finally:
+            self._lock.release()
+
+
+def _cache_key(method_name, kwargs):
+    """Returns a hashable key for an API call, or None if the arguments aren't hashable."""
+    key = (method_name, tuple(sorted(kwargs.items())))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+class CacheTest:
+    """Suite of offline tests to run when `chuber test Cache` is called. They run
+       against a FakeAccount, so they don't need an API key."""
+    @classmethod
+    def run(cls):
+        from .api import api_handler
+        from .fake_api import FakeAccount
+        from .linode_obj import Linode
+
+        account = FakeAccount(job_duration=0)
+        account.seed(linodes=2)
+        uninstall = account.install(api_handler)
+        saved_cache = api_handler.cache
+        cache = api_handler.cache = ResponseCache(ttls={"linode_list": 60, "avail_*": 3600},
+                                                  max_entries=2)
+        try:
+            def count_calls(func):
+                account.log = []
+                func()
+                count, account.log = len(account.log), None
+                return count
+
+            print "~~~ Caching list calls"
+            print
+            assert count_calls(Linode.search) == 1
+            assert count_calls(Linode.search) == 0
+            assert cache.stats()["hits"] == 1
+            assert count_calls(lambda: api_handler.linode_disk_list(linodeid=Linode.search()[0].api_id)) == 1
+            assert count_calls(lambda: api_handler.linode_disk_list(linodeid=Linode.search()[0].api_id)) == 1
+
+            print "~~~ Forgetting list calls when their objects change"
+            print
+            linode_obj = Linode.search()[0]
+            linode_obj.label = u"renamed"
+            linode_obj.save()
+            assert [l.label for l in Linode.search() if l.api_id == linode_obj.api_id] == [u"renamed"]
+            assert count_calls(Linode.search) == 0
+            with api_handler.batch():
+                linode_obj.label = u"renamed again"
+                linode_obj.save()
+            assert [l.label for l in Linode.search() if l.api_id == linode_obj.api_id] == [u"renamed again"]
+
+            print "~~~ Expiring and evicting responses"
+            print
+            cache.ttls["linode_list"] = 0.01
+            cache.invalidate("linode_list")
+            Linode.search()
+            time.sleep(0.02)
+            assert count_calls(Linode.search) == 1
+            cache.ttls["linode_list"] = 60
+            for linode_obj in Linode.search(): api_handler.linode_list(linodeid=linode_obj.api_id)
+            assert cache.stats()["entries"] == 2 and cache.stats()["evictions"] >= 1
+        finally:
+            api_handler.cache = saved_cache
+            uninstall()
+
+        print "~~~ Tests passed!"
@@ -0,0 +1,154 @@
+"""Module for keeping the API's catalogs on disk between processes."""
+import json
+import os
+import tempfile
+import threading
+import time
+from decimal import Decimal
+
+
+# The argument-less `avail_*` calls whose responses are kept on disk.
+CATALOG_METHODS = ("avail_datacenters", "avail_linodeplans", "avail_kernels",
+                   "avail_distributions")
+
+# Bumped whenever the file format changes; files with another version are ignored.
+CATALOG_VERSION = 2
+
+DEFAULT_PATH = os.path.join("~", ".chube.d", "catalog.json")
+
+# The key of the objects that Decimals are written as.
+DECIMAL_TAG = "__decimal__"
+
+
+class CatalogCache(object):
+    """Keeps the responses of the catalog calls (see CATALOG_METHODS) in a JSON file.
+
+       With a CatalogCache set as `chube_api_handler.catalog`, a fresh process gets
+       `Plan`, `Datacenter`, `Kernel` and `Distribution` from disk instead of the API,
+       as long as the file's copy is less than `ttl` seconds old:
+
+           chube_api_handler.catalog = CatalogCache()
+           Plan.find(ram=2048)   # no API call if ~/.chube.d/catalog.json is fresh
+
+       The file isn't read until the first catalog call. Putting `catalog_cache: true`
+       (or a path) in `~/.chube` makes `load_chube_config()` set this up, and
+       `chuber catalog refresh` fetches every catalog anew.
+
+       A CatalogCache is safe to share between threads."""
+    def __init__(self, path=None, ttl=86400):
+        """Initializes the CatalogCache.
+
+           `path` (optional): Where to keep the catalogs. Defaults to
+               `~/.chube.d/catalog.json`.
+           `ttl` (optional): How long, in seconds, a catalog is used before it's
+               fetched again."""
+        if path is None: path = DEFAULT_PATH
+        self.path = os.path.expanduser(path)
+        self.ttl = ttl
+        self._catalogs = None
+        self._lock = threading.Lock()
+
+    def get(self, method_name, kwargs):
+        """Looks up a catalog.
+
+           Returns a `(hit, response)` tuple; `response` is None if `hit` is False."""
+        if method_name not in CATALOG_METHODS or kwargs: return False, None
+        self._lock.acquire()
+        try:
+            entry = self._get_catalogs().get(method_name)
+        finally:
+            self._lock.release()
+        if entry is None or entry["fetched_at"] + self.ttl <= time.time():
+            return False, None
+        return True, entry["response"]
+
+    def put(self, method_name, kwargs, response):
+        """Stores a catalog, if the call is one of CATALOG_METHODS.
+
+           Failures to write the file are ignored; the catalog just won't be there for
+           the next process."""
+        if method_name not in CATALOG_METHODS or kwargs: return
+        self._lock.acquire()
+        try:
+            self._get_catalogs()[method_name] = {"fetched_at": time.time(),
+                                                 "response": response}
+            try:
+                self._save()
+            except (IOError, OSError):
+                pass
+        finally:
+            self._lock.release()
+
+    def refresh(self, handler):
+        """Fetches every catalog through the given Handler and writes them to disk."""
+        catalogs = {}
+        for method_name in CATALOG_METHODS:
+            response = handler._fetch(method_name, {})
+            catalogs[method_name] = {"fetched_at": time.time(), "response": response}
+        if handler.cache is not None:
+            for method_name in CATALOG_METHODS: handler.cache.invalidate(method_name)
+        self._lock.acquire()
+        try:
+            self._get_catalogs().update(catalogs)
+            self._save()
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        """Deletes the catalog file."""
+        self._lock.acquire()
+        try:
+            self._catalogs = {}
+            if os.path.exists(self.path): os.remove(self.path)
+        finally:
+            self._lock.release()
+
+    def _get_catalogs(self):
+        if self._catalogs is None:
+            self._catalogs = self._load()
+        return self._catalogs
+
+    def _load(self):
+        try:
+            f = open(self.path, "r")
+            try:
+                contents = json.load(f, parse_float=Decimal, object_hook=_decode_decimal)
+            finally:
+                f.close()
+        except (IOError, OSError, ValueError):
+            return {}
+        if not isinstance(contents, dict) or contents.get("version") != CATALOG_VERSION:
+            return {}
+        return contents.get("catalogs", {})
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory): os.makedirs(directory)
+        # Write to a temporary file and rename it, so that other processes never see a
+        # half-written catalog.
+        fd, tmp_path = tempfile.mkstemp(dir=directory or ".", prefix=".catalog-")
+        try:
+            f = os.fdopen(fd, "w")
+            try:
+                json.dump({"version": CATALOG_VERSION, "catalogs": self._catalogs}, f,
+                          default=_encode_decimal)
+            finally:
+                f.close()
+            os.rename(tmp_path, self.path)
+        except:
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+            raise
+
+
+def _encode_decimal(obj):
+    # The API's responses have Decimals in them (linode-python parses floats that
+    # way). They're written as strings, tagged so that `_decode_decimal` knows to turn
+    # them back into Decimals, so that Decimal("20.00") comes back as it was rather
+    # than as Decimal("20.0").
+    if isinstance(obj, Decimal): return {DECIMAL_TAG: str(obj)}
+    raise TypeError("%r is not JSON serializable" % (obj,))
+
+
+def _decode_decimal(obj):
+    if len(obj) == 1 and obj.has_key(DECIMAL_TAG): return Decimal(obj[DECIMAL_TAG])
+    return obj
@@ -1,4 +1,3 @@
-from .api import api_handler
 from .model import *
 from .util import keywords_only
 
@@ -8,6 +7,8 @@ class Datacenter(Model):
         DirectAttr("location", u"LOCATION", unicode, unicode),
     ]
 
+    list_method = "avail_datacenters"
+
     @classmethod
     @keywords_only
     def search(cls, **kwargs):
@@ -16,14 +17,7 @@ class Datacenter(Model):
            The special paramater `location_begins` allows you to case-insensitively
            match the beginning of the location string. For example,
            `Datacenter.search(location_begins='dallas')`."""
-        a = [cls.from_api_dict(d) for d in api_handler.avail_datacenters()]
-        if kwargs.has_key("location_begins"):
-            a = [datacenter for datacenter in a if
-                 datacenter.location.lower().startswith(kwargs["location_begins"].lower())]
-            del kwargs["location_begins"]
-        for k, v in kwargs.items():
-            a = [datacenter for datacenter in a if getattr(datacenter, k) == v]
-        return a
+        return cls._search(kwargs)
 
     @classmethod
     @keywords_only
@@ -40,10 +34,7 @@ class Datacenter(Model):
 
     def refresh(self):
         """Refreshes the datacenter with a new API call."""
-        new_inst = Datacenter.find(api_id=self.api_id)
-        for attr in self.direct_attrs:
-            setattr(self, attr.local_name, getattr(new_inst, attr.local_name))
-        del new_inst
+        self._refresh_with(lambda: Datacenter.find(api_id=self.api_id))
 
     def __repr__(self):
         return "<Datacenter location='%s'>" % self.location
@@ -1,4 +1,3 @@
-from .api import api_handler
 from .model import *
 from .util import keywords_only
 
@@ -12,6 +11,8 @@ class Distribution(Model):
         DirectAttr("requires_pvops_distro", u"REQUIRESPVOPSKERNEL", bool, int)
     ]
 
+    list_method = "avail_distributions"
+
     @classmethod
     @keywords_only
     def search(cls, **kwargs):
@@ -20,14 +21,7 @@ class Distribution(Model):
            The special paramater `label_begins` allows you to case-insensitively
            match the beginning of the label string. For example,
            `Distribution.search(label_begins='Debian 7')`."""
-        a = [cls.from_api_dict(d) for d in api_handler.avail_distributions()]
-        if kwargs.has_key("label_begins"):
-            a = [distro for distro in a if
-                 distro.label.lower().startswith(kwargs["label_begins"].lower())]
-            del kwargs["label_begins"]
-        for k, v in kwargs.items():
-            a = [distro for distro in a if getattr(distro, k) == v]
-        return a
+        return cls._search(kwargs)
 
     @classmethod
     @keywords_only
@@ -44,10 +38,7 @@ class Distribution(Model):
 
     def refresh(self):
         """Refreshes the distro with a new API call."""
-        new_inst = Distribution.find(api_id=self.api_id)
-        for attr in self.direct_attrs:
-            setattr(self, attr.local_name, getattr(new_inst, attr.local_name))
-        del new_inst
+        self._refresh_with(lambda: Distribution.find(api_id=self.api_id))
 
     def __repr__(self):
         return "<Distribution label='%s'>" % self.label
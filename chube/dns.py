@@ -8,7 +8,7 @@ class Domain(Model):
     direct_attrs = [
         # IDs
         DirectAttr("api_id", u"DOMAINID", int, int,
-                   update_as="domainid"),
+                   update_as="domainid", is_key=True),
 
         # Properties
         DirectAttr("domain", u"DOMAIN", unicode, unicode,
@@ -32,6 +32,9 @@ class Domain(Model):
         DirectAttr("status", u"STATUS", int, int),
     ]
 
+    list_method = "domain_list"
+    list_id_param = "domainid"
+
     # The `master_ips` attribute is based on `master_ips_str`
     def _master_ips_getter(self):
         """Returns the zone's master DNS servers, as an array of IP addresses.
@@ -64,6 +67,17 @@ class Domain(Model):
         self.axfr_ips_str = ";".join(val)
     axfr_ips = property(_axfr_ips_getter, _axfr_ips_setter)
 
+    # The `records` attribute
+    def _records_getter(self):
+        return self.search_records()
+    def _records_setter(self, val):
+        raise NotImplementedError("Cannot set `records` directly; use `add_record` instead.")
+    records = Related(_records_getter, _records_setter, cached=False)
+
+    @classmethod
+    def _prefetch_records(cls, domains):
+        return api_handler.map(lambda domain: domain.search_records(), domains)
+
     @classmethod
     @keywords_only
     def search(cls, **kwargs):
@@ -74,19 +88,11 @@ class Domain(Model):
            `Domain.search(domain_begins='www.')`.
            
            The `domain_ends` parameter is analogous. For example,
-           `Domain.search(domain_ends='.org')`."""
-        a = [cls.from_api_dict(d) for d in api_handler.domain_list()]
-        if kwargs.has_key("domain_begins"):
-            a = [domain for domain in a if
-                 domain.domain.lower().startswith(kwargs["domain_begins"].lower())]
-            del kwargs["domain_begins"]
-        if kwargs.has_key("domain_ends"):
-            a = [domain for domain in a if
-                 domain.domain.lower().endswith(kwargs["domain_ends"].lower())]
-            del kwargs["domain_ends"]
-        for k, v in kwargs.items():
-            a = [domain for domain in a if getattr(domain, k) == v]
-        return a
+           `Domain.search(domain_ends='.org')`.
+
+           `prefetch` (optional): `["records"]` to fetch the records of all the results
+               at once."""
+        return cls._search(kwargs)
 
     @classmethod
     @keywords_only
@@ -138,6 +144,7 @@ class Domain(Model):
         if kwargs.has_key("ttl_sec"): api_args["ttl_sec"] = kwargs["ttl_sec"]
         if kwargs.has_key("priority"): api_args["priority"] = kwargs["priority"]
         rval = api_handler.domain_resource_create(**api_args)
+        self.forget_related("records")
         return Record.find(domain=self.api_id, api_id=rval["ResourceID"])
 
     @keywords_only
@@ -146,13 +153,7 @@ class Domain(Model):
         """Returns the list of Record instances that match the given criteria.
         
            Has a special `name_begins` parameter that does what you'd expect."""
-        a = [Record.from_api_dict(api_dict) for api_dict in api_handler.domain_resource_list(domainid=self.api_id)]
-        if kwargs.has_key("name_begins"):
-            a = [record for record in a if record.name.lower().startswith(kwargs["name_begins"].lower())]
-            del kwargs["name_begins"]
-        for k, v in kwargs.items():
-            a = [record for record in a if getattr(record, k) == v]
-        return a
+        return Record._search(kwargs, domainid=self.api_id)
 
     @keywords_only
     def find_record(self, **kwargs):
@@ -165,16 +166,14 @@ class Domain(Model):
         return a[0]
 
     def save(self):
-        """Saves the Domain object to the API."""
-        api_params = self.api_update_params()
-        api_handler.domain_update(**api_params)
+        """Saves the changes made to the Domain object to the API, if there are any."""
+        if not self.is_dirty: return
+        api_params = self.api_update_params(changed_only=True)
+        self._mark_saved_when_done(api_handler.domain_update(**api_params))
 
     def refresh(self):
         """Refreshes the Domain object with a new API call."""
-        new_inst = Domain.find(api_id=self.api_id)
-        for attr in self.direct_attrs:
-            setattr(self, attr.local_name, getattr(new_inst, attr.local_name))
-        del new_inst
+        self._refresh_with(lambda: Domain.find(api_id=self.api_id))
 
     def destroy(self):
         """Deletes the Domain."""
@@ -188,9 +187,9 @@ class Record(Model):
     direct_attrs = [
         # IDs
         DirectAttr("api_id", u"RESOURCEID", int, int,
-                   update_as="resourceid"),
+                   update_as="resourceid", is_key=True),
         DirectAttr("domain_id", u"DOMAINID", int, int,
-                   update_as="domainid"),
+                   update_as="domainid", is_key=True),
 
         # Properties
         DirectAttr("record_type", u"TYPE", unicode, unicode,
@@ -212,12 +211,16 @@ class Record(Model):
                    update_as="priority", update_only_if_type=int),
     ]
 
+    list_method = "domain_resource_list"
+    list_id_param = "resourceid"
+    list_parent = ("domain_id", "domainid")
+
     # The `domain` attribute is done with a deferred lookup.
     def _domain_getter(self):
-        return Domain.find(api_id=self.domain_id)
+        return Domain.from_session(self.domain_id) or Domain.find(api_id=self.domain_id)
     def _domain_setter(self, val):
         raise NotImplementedError("Cannot assign Record to a different Domain")
-    domain = property(_domain_getter, _domain_setter)
+    domain = Related(_domain_getter, _domain_setter)
 
     # The `weight` attribute needs to be massaged before returning it to the
     # user. It can come back from the API either as an empty string or an int.
@@ -262,12 +265,8 @@ class Record(Model):
            At least `domain` is required. It can be a Domain object or a numeric Domain ID."""
         domain = kwargs["domain"]
         if type(domain) is not int: domain = domain.api_id
-        a = [cls.from_api_dict(d) for d in api_handler.domain_resource_list(domainid=domain)]
         del kwargs["domain"]
-
-        for k, v in kwargs.items():
-            a = [addr for addr in a if getattr(addr, k) == v]
-        return a
+        return cls._search(kwargs, domainid=domain)
 
     @classmethod
     @RequiresParams("domain")
@@ -279,25 +278,24 @@ class Record(Model):
 
            Both parameters are required. `domain` may be a Domain ID or a Domain object."""
         a = cls.search(**kwargs)
-        if len(a) < 1: raise RuntimeError("No Domain found with the given criteria (%s)" % (kwargs,))
-        if len(a) > 1: raise RuntimeError("More than one Domain found with the given criteria (%s)" % (kwargs,))
+        if len(a) < 1: raise RuntimeError("No Record found with the given criteria (%s)" % (kwargs,))
+        if len(a) > 1: raise RuntimeError("More than one Record found with the given criteria (%s)" % (kwargs,))
         return a[0]
 
     def save(self):
-        """Saves the Record object to the API."""
-        api_params = self.api_update_params()
-        api_handler.domain_resource_update(**api_params)
+        """Saves the changes made to the Record object to the API, if there are any."""
+        if not self.is_dirty: return
+        api_params = self.api_update_params(changed_only=True)
+        self._mark_saved_when_done(api_handler.domain_resource_update(**api_params))
 
     def refresh(self):
         """Refreshes the Record object with a new API call."""
-        new_inst = Record.find(api_id=self.api_id, domain=self.domain_id)
-        for attr in self.direct_attrs:
-            setattr(self, attr.local_name, getattr(new_inst, attr.local_name))
-        del new_inst
+        self._refresh_with(lambda: Record.find(api_id=self.api_id, domain=self.domain_id))
 
     def destroy(self):
         """Destroys the DNS record."""
         api_handler.domain_resource_delete(domainid=self.domain_id, resourceid=self.api_id)
+        Domain._forget_related_of(self._remembered_related("domain") or self.domain_id, "records")
 
     def __repr__(self):
         return "<Record api_id=%d, record_type='%s', name='%s'>" % (self.api_id, self.record_type, self.name)
@@ -372,6 +370,22 @@ class DomainTest:
         r.target = "127.0.0.2"
         r.save()
 
+        print "~~~ Saving record 'foo.%s' without changing it, then changing just its TTL" % (domain.domain,)
+        print
+        calls = []
+        log_call = lambda method_name, kwargs: calls.append((method_name, kwargs))
+        api_handler.metrics.before_hooks.append(log_call)
+        try:
+            r.save()
+            assert calls == []
+            r.ttl_sec = 3600
+            r.save()
+            assert calls == [("domain_resource_update", {"resourceid": r.api_id, "domainid": domain.api_id,
+                                                         "ttl_sec": 3600})]
+            assert not r.is_dirty
+        finally:
+            api_handler.metrics.before_hooks.remove(log_call)
+
         print "~~~ Creating CNAME record 'bar.%s' => 'foo.%s'" % (domain.domain,domain.domain,)
         print
         r = domain.add_record(record_type="CNAME", name="bar", target=("foo.%s" % (domain.domain,)))
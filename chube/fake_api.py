@@ -0,0 +1,580 @@
+"""In-memory stand-in for the Linode API, for load-testing code built on chube.
+
+   Plug a FakeAccount into a Handler in place of `linode.api.Api`:
+
+       from chube.fake_api import FakeAccount
+       account = FakeAccount(latency=0.05)
+       account.seed(linodes=100000, disks_per_linode=2, configs_per_linode=1)
+       chube_api_handler.api_key = "fake"
+       chube_api_handler.api_factory = account.api
+
+   Nothing leaves the process; any API key works."""
+import heapq
+import random
+import threading
+import time
+from decimal import Decimal
+
+from linode import api as linode_api
+
+
+DATACENTERS = [
+    {u"DATACENTERID": 2, u"LOCATION": u"Dallas, TX, USA", u"ABBR": u"dallas"},
+    {u"DATACENTERID": 3, u"LOCATION": u"Fremont, CA, USA", u"ABBR": u"fremont"},
+    {u"DATACENTERID": 4, u"LOCATION": u"Atlanta, GA, USA", u"ABBR": u"atlanta"},
+    {u"DATACENTERID": 6, u"LOCATION": u"Newark, NJ, USA", u"ABBR": u"newark"},
+    {u"DATACENTERID": 7, u"LOCATION": u"London, England, UK", u"ABBR": u"london"},
+    {u"DATACENTERID": 8, u"LOCATION": u"Tokyo, JP", u"ABBR": u"tokyo"},
+]
+
+PLANS = [
+    {u"PLANID": 1, u"LABEL": u"Linode 1024", u"RAM": 1024, u"DISK": 24, u"XFER": 2000,
+     u"PRICE": Decimal("20.00")},
+    {u"PLANID": 2, u"LABEL": u"Linode 2048", u"RAM": 2048, u"DISK": 48, u"XFER": 3000,
+     u"PRICE": Decimal("40.00")},
+    {u"PLANID": 4, u"LABEL": u"Linode 4096", u"RAM": 4096, u"DISK": 96, u"XFER": 4000,
+     u"PRICE": Decimal("80.00")},
+    {u"PLANID": 6, u"LABEL": u"Linode 8192", u"RAM": 8192, u"DISK": 192, u"XFER": 8000,
+     u"PRICE": Decimal("160.00")},
+]
+
+KERNELS = [
+    {u"KERNELID": 138, u"LABEL": u"Latest 64 bit (3.9.3-x86_64-linode33)", u"ISXEN": 1,
+     u"ISPVOPS": 1},
+    {u"KERNELID": 137, u"LABEL": u"Latest 32 bit (3.9.3-linode52)", u"ISXEN": 1,
+     u"ISPVOPS": 1},
+    {u"KERNELID": 92, u"LABEL": u"pv-grub-x86_64", u"ISXEN": 1, u"ISPVOPS": 0},
+]
+
+DISTRIBUTIONS = [
+    {u"DISTRIBUTIONID": 98, u"LABEL": u"Ubuntu 12.04 LTS", u"CREATE_DT": u"2012-04-26 17:25:16.0",
+     u"MINIMAGESIZE": 600, u"IS64BIT": 1, u"REQUIRESPVOPSKERNEL": 1},
+    {u"DISTRIBUTIONID": 78, u"LABEL": u"Debian 6", u"CREATE_DT": u"2011-02-08 16:54:31.0",
+     u"MINIMAGESIZE": 550, u"IS64BIT": 1, u"REQUIRESPVOPSKERNEL": 1},
+    {u"DISTRIBUTIONID": 86, u"LABEL": u"CentOS 6.2", u"CREATE_DT": u"2011-12-21 16:25:19.0",
+     u"MINIMAGESIZE": 800, u"IS64BIT": 1, u"REQUIRESPVOPSKERNEL": 1},
+]
+
+# Linode `STATUS` values (see the constants on `chube.Linode`).
+_STATUS_BRANDNEW, _STATUS_RUNNING, _STATUS_OFF = 0, 1, 2
+
+
+class _Kind(object):
+    """Describes one type of object in the account.
+
+       `id_key`, `id_param`: Name of its ID in responses and in API arguments.
+       `result_key`: Name of its ID in the responses to `*_create` calls.
+       `defaults`: Function of `(new_id, parent_id)` returning a new object's fields.
+       `parent`: The `_Kind` name of the object it belongs to, if any.
+       `parent_key`: Name of the parent's ID in responses, if it's not the parent's
+           `id_key`."""
+    def __init__(self, name, id_key, id_param, result_key, defaults, parent=None,
+                 parent_key=None):
+        self.name = name
+        self.id_key = id_key
+        self.id_param = id_param
+        self.result_key = result_key
+        self.defaults = defaults
+        self.parent = parent
+        self.parent_key = parent_key
+
+
+def _now():
+    return unicode(time.strftime("%Y-%m-%d %H:%M:%S.0"))
+
+def _public_ipv4(n):
+    return u"172.%d.%d.%d" % (16 + (n >> 16) % 16, (n >> 8) % 256, n % 256)
+
+def _private_ipv4(n):
+    return u"10.%d.%d.%d" % ((n >> 16) % 256, (n >> 8) % 256, n % 256)
+
+_KINDS = dict([(kind.name, kind) for kind in [
+    _Kind("linode", u"LINODEID", "linodeid", u"LinodeID", lambda i, p: {
+        u"LINODEID": i, u"LABEL": u"linode%d" % (i,), u"DATACENTERID": 2, u"PLANID": 1,
+        u"LPM_DISPLAYGROUP": u"", u"CREATE_DT": _now(), u"TOTALHD": 24576,
+        u"TOTALXFER": 2000, u"TOTALRAM": 1024, u"STATUS": _STATUS_BRANDNEW,
+        u"ALERT_CPU_ENABLED": 1, u"ALERT_CPU_THRESHOLD": 90,
+        u"ALERT_DISKIO_ENABLED": 1, u"ALERT_DISKIO_THRESHOLD": 1000,
+        u"ALERT_BWIN_ENABLED": 1, u"ALERT_BWIN_THRESHOLD": 5,
+        u"ALERT_BWOUT_ENABLED": 1, u"ALERT_BWOUT_THRESHOLD": 5,
+        u"ALERT_BWQUOTA_ENABLED": 1, u"ALERT_BWQUOTA_THRESHOLD": 80,
+        u"BACKUPWEEKLYDAY": 0, u"BACKUPWINDOW": 0, u"WATCHDOG": 1}),
+    _Kind("ip", u"IPADDRESSID", "ipaddressid", u"IPADDRESSID", lambda i, p: {
+        u"IPADDRESSID": i, u"LINODEID": p, u"IPADDRESS": _public_ipv4(i),
+        u"RDNS_NAME": u"li%d-%d.members.linode.com" % (i % 1000, i // 1000),
+        u"ISPUBLIC": 1}, parent="linode"),
+    _Kind("config", u"ConfigID", "configid", u"ConfigID", lambda i, p: {
+        u"ConfigID": i, u"LinodeID": p, u"KernelID": 138, u"Label": u"config%d" % (i,),
+        u"Comments": u"", u"RunLevel": u"default", u"RAMLimit": 0,
+        u"DiskList": u",,,,,,,,", u"RootDeviceCustom": u"", u"RootDeviceRO": 1,
+        u"RootDeviceNum": 1, u"helper_xen": 1, u"helper_libtls": 0, u"helper_depmod": 1,
+        u"helper_disableUpdateDB": 1}, parent="linode", parent_key=u"LinodeID"),
+    _Kind("disk", u"DISKID", "diskid", u"DiskID", lambda i, p: {
+        u"DISKID": i, u"LINODEID": p, u"LABEL": u"disk%d" % (i,), u"ISREADONLY": 0,
+        u"TYPE": u"ext3", u"UPDATE_DT": _now(), u"CREATE_DT": _now(), u"STATUS": 1,
+        u"SIZE": 1024}, parent="linode"),
+    _Kind("job", u"JOBID", "jobid", u"JobID", lambda i, p: {
+        u"JOBID": i, u"LINODEID": p, u"LABEL": u"", u"ACTION": u"",
+        u"ENTERED_DT": _now(), u"HOST_START_DT": u"", u"HOST_FINISH_DT": u"",
+        u"HOST_MESSAGE": u"", u"DURATION": u"", u"HOST_SUCCESS": u""}, parent="linode"),
+    _Kind("domain", u"DOMAINID", "domainid", u"DomainID", lambda i, p: {
+        u"DOMAINID": i, u"DOMAIN": u"domain%d.example.com" % (i,), u"DESCRIPTION": u"",
+        u"TYPE": u"master", u"SOA_EMAIL": u"hostmaster@example.com", u"REFRESH_SEC": 0,
+        u"RETRY_SEC": 0, u"EXPIRE_SEC": 0, u"TTL_SEC": 0, u"MASTER_IPS": u"",
+        u"AXFR_IPS": u"none", u"STATUS": 1}),
+    _Kind("record", u"RESOURCEID", "resourceid", u"ResourceID", lambda i, p: {
+        u"RESOURCEID": i, u"DOMAINID": p, u"TYPE": u"A", u"NAME": u"host%d" % (i,),
+        u"TARGET": _public_ipv4(i), u"TTL_SEC": 0, u"WEIGHT": 5, u"PORT": 80,
+        u"PRIORITY": 10, u"PROTOCOL": u""}, parent="domain"),
+    _Kind("nodebalancer", u"NODEBALANCERID", "nodebalancerid", u"NodeBalancerID", lambda i, p: {
+        u"NODEBALANCERID": i, u"LABEL": u"nodebalancer%d" % (i,), u"DATACENTERID": 2,
+        u"CLIENTCONNTHROTTLE": 0, u"HOSTNAME": u"nb-%s.dallas.nodebalancer.linode.com" %
+        (_public_ipv4(i).replace(u".", u"-"),), u"ADDRESS4": _public_ipv4(i),
+        u"ADDRESS6": u"2600:3c00::%x" % (i,), u"STATUS": u"Active"}),
+    _Kind("nodebalancer_config", u"CONFIGID", "configid", u"ConfigID", lambda i, p: {
+        u"CONFIGID": i, u"NODEBALANCERID": p, u"ALGORITHM": u"roundrobin",
+        u"CHECK": u"connection", u"CHECK_ATTEMPTS": 2, u"CHECK_BODY": u"",
+        u"CHECK_INTERVAL": 5, u"CHECK_PATH": u"/", u"CHECK_TIMEOUT": 3, u"PORT": 80,
+        u"PROTOCOL": u"http", u"STICKINESS": u"table"}, parent="nodebalancer"),
+    _Kind("nodebalancer_node", u"NODEID", "nodeid", u"NodeID", lambda i, p: {
+        u"NODEID": i, u"CONFIGID": p, u"NODEBALANCERID": None, u"WEIGHT": 100,
+        u"ADDRESS": u"%s:80" % (_private_ipv4(i),), u"LABEL": u"node%d" % (i,),
+        u"MODE": u"accept", u"STATUS": u"Unknown"}, parent="nodebalancer_config"),
+    _Kind("stackscript", u"STACKSCRIPTID", "stackscriptid", u"StackScriptID", lambda i, p: {
+        u"STACKSCRIPTID": i, u"DISTRIBUTIONIDLIST": u"98", u"LABEL": u"stackscript%d" % (i,),
+        u"DESCRIPTION": u"", u"SCRIPT": u"#!/bin/bash\n", u"ISPUBLIC": 0, u"REV_NOTE": u"",
+        u"LATESTREV": 1, u"REV_DT": _now(), u"CREATE_DT": _now(), u"USERID": 1,
+        u"DEPLOYMENTSACTIVE": 0, u"DEPLOYMENTSTOTAL": 0}),
+]])
+for _kind in _KINDS.values():
+    if _kind.parent is not None and _kind.parent_key is None:
+        _kind.parent_key = _KINDS[_kind.parent].id_key
+
+# API method prefixes handled generically, most specific first.
+_KIND_PREFIXES = [
+    ("linode_ip_", "ip"), ("linode_config_", "config"), ("linode_disk_", "disk"),
+    ("linode_job_", "job"), ("linode_", "linode"), ("domain_resource_", "record"),
+    ("domain_", "domain"), ("nodebalancer_config_", "nodebalancer_config"),
+    ("nodebalancer_node_", "nodebalancer_node"), ("nodebalancer_", "nodebalancer"),
+    ("stackscript_", "stackscript"),
+]
+
+
+class FakeAccount(object):
+    """An in-memory Linode account that answers API calls like the real API does.
+
+       It implements the `linode_*`, `domain_*`, `nodebalancer_*`, `stackscript_*` and
+       `avail_*` methods chube uses, including `api.batch` requests. Jobs take
+       `job_duration` seconds to finish; Linodes are running once a boot or reboot
+       job finishes and off once a shutdown job does.
+
+       `latency` and error injection (`error_rate`, `inject_error`) make it behave like
+       a slow or flaky API, and `seed` fills it with lots of objects quickly. Set `log`
+       to a list to have every call appended to it as a `(method_name, kwargs)` pair.
+
+       A FakeAccount is safe to share between threads."""
+    def __init__(self, latency=None, error_rate=0, job_duration=2.0, seed=None):
+        """Initializes the FakeAccount.
+
+           `latency` (optional): How long each call takes, in seconds: a number, or a
+               callable that's called with the method name and returns a number.
+           `error_rate` (optional): Fraction of calls (between 0 and 1) that fail with
+               a random API error.
+           `job_duration` (optional): How long jobs take to finish, in seconds.
+           `seed` (optional): Seed for the random numbers behind `error_rate`."""
+        self.latency = latency
+        self.error_rate = error_rate
+        self.job_duration = job_duration
+        self.calls = 0
+        self.log = None
+        self._random = random.Random(seed)
+        self._injected = []
+        self._objects = dict([(name, {}) for name in _KINDS])
+        self._children = dict([(name, {}) for name in _KINDS])
+        self._next_id = dict([(name, 1000 * (n + 1)) for n, name in enumerate(sorted(_KINDS))])
+        self._pending_jobs = []
+        self._lock = threading.RLock()
+
+    def api(self, api_key, batching=False):
+        """Returns an API connection object (see `Handler.api_factory`)."""
+        return _FakeApi(self, batching)
+
+    def install(self, handler):
+        """Points `handler` at this account, and returns a function that puts the
+           handler's API key and factory back the way they were. Responses cached by
+           the handler are dropped."""
+        saved = handler.api_key, handler.api_factory
+        if handler.api_key is None: handler.api_key = "fake"
+        handler.api_factory = self.api
+        if handler.cache is not None: handler.cache.invalidate()
+        def uninstall():
+            handler.api_key, handler.api_factory = saved
+            if handler.cache is not None: handler.cache.invalidate()
+        return uninstall
+
+    def inject_error(self, method_name=None, error=None, count=1):
+        """Makes the next `count` calls to `method_name` (or to any method, if it's None)
+           raise `error`. It defaults to an `ApiError` like the API's own, so to test
+           rate limiting, pass something like
+           `linode.api.ApiError([{"ERRORCODE": 8, "ERRORMESSAGE": "Rate limit exceeded"}])`."""
+        if error is None:
+            error = linode_api.ApiError([{u"ERRORCODE": 8, u"ERRORMESSAGE": u"Injected error"}])
+        self._lock.acquire()
+        try:
+            self._injected.append([method_name, error, count])
+        finally:
+            self._lock.release()
+
+    def seed(self, linodes=0, disks_per_linode=0, configs_per_linode=0, ips_per_linode=1,
+             jobs_per_linode=0, domains=0, records_per_domain=0, nodebalancers=0,
+             configs_per_nodebalancer=0, nodes_per_config=0, stackscripts=0):
+        """Adds objects to the account without going through the API.
+
+           New Linodes are running; their configs use their first disks, and their jobs
+           have finished. For example, `seed(linodes=100000, disks_per_linode=2)` adds
+           100,000 Linodes with two disks and one public IP address each."""
+        self._lock.acquire()
+        try:
+            for n in range(linodes):
+                linode = self._add("linode")
+                linode_id = linode[u"LINODEID"]
+                linode[u"STATUS"] = _STATUS_RUNNING
+                disk_ids = [unicode(self._add("disk", linode_id)[u"DISKID"])
+                            for i in range(disks_per_linode)]
+                for i in range(configs_per_linode):
+                    config = self._add("config", linode_id)
+                    config[u"DiskList"] = u",".join((disk_ids + [u""] * 9)[:9])
+                for i in range(ips_per_linode): self._add("ip", linode_id)
+                for i in range(jobs_per_linode):
+                    job = self._add("job", linode_id)
+                    job.update({u"LABEL": u"System Boot", u"ACTION": u"linode.boot",
+                                u"HOST_START_DT": job[u"ENTERED_DT"],
+                                u"HOST_FINISH_DT": job[u"ENTERED_DT"], u"DURATION": 5,
+                                u"HOST_SUCCESS": 1})
+            for n in range(domains):
+                domain = self._add("domain")
+                for i in range(records_per_domain): self._add("record", domain[u"DOMAINID"])
+            for n in range(nodebalancers):
+                nodebalancer = self._add("nodebalancer")
+                for i in range(configs_per_nodebalancer):
+                    config = self._add("nodebalancer_config", nodebalancer[u"NODEBALANCERID"])
+                    for j in range(nodes_per_config):
+                        self._add("nodebalancer_node", config[u"CONFIGID"])
+            for n in range(stackscripts): self._add("stackscript")
+        finally:
+            self._lock.release()
+
+    def count(self, kind):
+        """Returns the number of objects of the given kind (like "linode" or "disk")."""
+        return len(self._objects[kind])
+
+    def call(self, method_name, kwargs):
+        """Answers a single API call, or raises the ApiError the API would."""
+        self._wait(method_name)
+        return self._answer(method_name, kwargs)
+
+    def batch(self, calls):
+        """Answers a list of `(method_name, kwargs)` calls like an `api.batch` request."""
+        self._wait("batch")
+        responses = []
+        for method_name, kwargs in calls:
+            action = method_name.replace("_", ".")
+            try:
+                data = self._answer(method_name, kwargs)
+            except linode_api.ApiError, e:
+                responses.append({u"ACTION": action, u"ERRORARRAY": e.value, u"DATA": {}})
+            else:
+                responses.append({u"ACTION": action, u"ERRORARRAY": [], u"DATA": data})
+        return responses
+
+    def _wait(self, method_name):
+        delay = self.latency
+        if callable(delay): delay = delay(method_name)
+        if delay: time.sleep(delay)
+
+    def _answer(self, method_name, kwargs):
+        kwargs = dict([(k.lower(), v) for k, v in kwargs.items()])
+        self._lock.acquire()
+        try:
+            self.calls += 1
+            if self.log is not None: self.log.append((method_name, kwargs))
+            self._maybe_fail(method_name)
+            self._finish_jobs()
+            special = getattr(self, "_api_" + method_name, None)
+            if special is not None: return special(kwargs)
+            for prefix, kind in _KIND_PREFIXES:
+                if not method_name.startswith(prefix): continue
+                verb = method_name[len(prefix):]
+                if verb in ("list", "create", "update", "delete"):
+                    return getattr(self, "_" + verb)(_KINDS[kind], kwargs)
+                break
+            raise _error(3, "Action not found: %s" % (method_name,))
+        finally:
+            self._lock.release()
+
+    # Generic handlers, for the `*_list`, `*_create`, `*_update` and `*_delete` methods.
+    def _list(self, kind, kwargs):
+        parent = _KINDS.get(kind.parent)
+        if kwargs.has_key(kind.id_param):
+            # Like the API, a missing object (or a missing parent) is an error rather
+            # than an empty list.
+            parent_id = None
+            if parent is not None and kwargs.has_key(parent.id_param):
+                parent_id = self._parent_id(kind, kwargs)
+            obj = self._get(kind, kwargs)
+            if parent_id is not None and obj[kind.parent_key] != parent_id:
+                raise _error(5, "Object not found")
+            objects = [obj]
+        elif parent is not None and kwargs.has_key(parent.id_param):
+            objects = [self._objects[kind.name][i] for i in
+                       self._children[kind.name].get(self._parent_id(kind, kwargs), [])]
+        elif parent is None or kind.name == "ip":
+            objects = self._objects[kind.name].values()
+        else:
+            raise _error(6, "%s is required" % (parent.id_param.upper(),))
+        if kind.name == "job" and _flag(kwargs.get("pendingonly")):
+            objects = [o for o in objects if o[u"HOST_SUCCESS"] == u""]
+        return [dict(o) for o in objects]
+
+    def _create(self, kind, kwargs):
+        parent_id = None
+        if kind.parent is not None: parent_id = self._parent_id(kind, kwargs)
+        obj = self._add(kind.name, parent_id)
+        self._apply(kind, obj, kwargs)
+        return {kind.result_key: obj[kind.id_key]}
+
+    def _update(self, kind, kwargs):
+        obj = self._get(kind, kwargs)
+        self._apply(kind, obj, kwargs)
+        return {kind.result_key: obj[kind.id_key]}
+
+    def _delete(self, kind, kwargs):
+        obj = self._get(kind, kwargs)
+        self._remove(kind.name, obj[kind.id_key])
+        return {kind.result_key: obj[kind.id_key]}
+
+    # Methods that do more than the generic handlers.
+    def _api_avail_datacenters(self, kwargs): return [dict(d) for d in DATACENTERS]
+    def _api_avail_linodeplans(self, kwargs): return [dict(p) for p in PLANS]
+    def _api_avail_kernels(self, kwargs): return [dict(k) for k in KERNELS]
+    def _api_avail_distributions(self, kwargs): return [dict(d) for d in DISTRIBUTIONS]
+
+    def _api_linode_create(self, kwargs):
+        plan = self._plan(kwargs)
+        linode = self._add("linode")
+        linode[u"DATACENTERID"] = _int(_required(kwargs, "datacenterid"))
+        self._apply_plan(linode, plan)
+        self._add("ip", linode[u"LINODEID"])
+        return {u"LinodeID": linode[u"LINODEID"]}
+
+    def _api_linode_clone(self, kwargs):
+        source = self._get(_KINDS["linode"], kwargs)
+        plan = self._plan(kwargs)
+        linode = self._add("linode")
+        linode[u"DATACENTERID"] = _int(_required(kwargs, "datacenterid"))
+        self._apply_plan(linode, plan)
+        self._add("ip", linode[u"LINODEID"])
+        for disk_id in list(self._children["disk"].get(source[u"LINODEID"], [])):
+            disk = dict(self._objects["disk"][disk_id])
+            copy = self._add("disk", linode[u"LINODEID"])
+            copy.update({u"LABEL": disk[u"LABEL"], u"TYPE": disk[u"TYPE"], u"SIZE": disk[u"SIZE"]})
+        self._add_job(source[u"LINODEID"], u"linode.clone", u"Linode Clone")
+        return {u"LinodeID": linode[u"LINODEID"]}
+
+    def _api_linode_resize(self, kwargs):
+        linode = self._get(_KINDS["linode"], kwargs)
+        self._apply_plan(linode, self._plan(kwargs))
+        self._add_job(linode[u"LINODEID"], u"linode.resize", u"Linode Resize")
+        return {}
+
+    def _api_linode_boot(self, kwargs):
+        return self._power(kwargs, u"linode.boot", u"System Boot", _STATUS_RUNNING)
+
+    def _api_linode_reboot(self, kwargs):
+        return self._power(kwargs, u"linode.reboot", u"System Reboot", _STATUS_RUNNING)
+
+    def _api_linode_shutdown(self, kwargs):
+        return self._power(kwargs, u"linode.shutdown", u"System Shutdown", _STATUS_OFF)
+
+    def _api_linode_ip_addprivate(self, kwargs):
+        linode = self._get(_KINDS["linode"], kwargs)
+        ip = self._add("ip", linode[u"LINODEID"])
+        ip.update({u"IPADDRESS": _private_ipv4(ip[u"IPADDRESSID"]), u"RDNS_NAME": u"",
+                   u"ISPUBLIC": 0})
+        return {u"IPADDRESSID": ip[u"IPADDRESSID"], u"IPADDRESS": ip[u"IPADDRESS"]}
+
+    def _api_linode_disk_create(self, kwargs):
+        return self._create_disk(kwargs, u"Create Filesystem")
+
+    def _api_linode_disk_createfromdistribution(self, kwargs):
+        _required(kwargs, "distributionid")
+        return self._create_disk(kwargs, u"Disk Create From Distribution")
+
+    def _api_linode_disk_createfromstackscript(self, kwargs):
+        stackscript = self._get(_KINDS["stackscript"], kwargs)
+        stackscript[u"DEPLOYMENTSTOTAL"] += 1
+        stackscript[u"DEPLOYMENTSACTIVE"] += 1
+        return self._create_disk(kwargs, u"Disk Create From StackScript")
+
+    def _api_linode_disk_delete(self, kwargs):
+        disk = self._get(_KINDS["disk"], kwargs)
+        self._remove("disk", disk[u"DISKID"])
+        job_id = self._add_job(disk[u"LINODEID"], u"linode.disk.delete", u"Delete Disk")
+        return {u"DiskID": disk[u"DISKID"], u"JobID": job_id}
+
+    def _api_linode_disk_resize(self, kwargs):
+        disk = self._get(_KINDS["disk"], kwargs)
+        disk[u"SIZE"] = _int(_required(kwargs, "size"))
+        job_id = self._add_job(disk[u"LINODEID"], u"linode.disk.resize", u"Disk Resize")
+        return {u"DiskID": disk[u"DISKID"], u"JobID": job_id}
+
+    def _api_linode_disk_duplicate(self, kwargs):
+        disk = self._get(_KINDS["disk"], kwargs)
+        copy = self._add("disk", disk[u"LINODEID"])
+        copy.update({u"LABEL": disk[u"LABEL"], u"TYPE": disk[u"TYPE"], u"SIZE": disk[u"SIZE"]})
+        job_id = self._add_job(disk[u"LINODEID"], u"linode.disk.duplicate", u"Disk Duplicate")
+        return {u"DiskID": copy[u"DISKID"], u"JobID": job_id}
+
+    def _api_nodebalancer_create(self, kwargs):
+        nodebalancer = self._add("nodebalancer")
+        nodebalancer[u"DATACENTERID"] = _int(_required(kwargs, "datacenterid"))
+        return {u"NodeBalancerID": nodebalancer[u"NODEBALANCERID"]}
+
+    # Helpers. These are called with the lock held.
+    def _add(self, kind_name, parent_id=None):
+        kind = _KINDS[kind_name]
+        new_id = self._next_id[kind_name]
+        self._next_id[kind_name] += 1
+        obj = kind.defaults(new_id, parent_id)
+        if kind_name == "nodebalancer_node" and parent_id is not None:
+            config = self._objects["nodebalancer_config"].get(parent_id)
+            if config is not None: obj[u"NODEBALANCERID"] = config[u"NODEBALANCERID"]
+        self._objects[kind_name][new_id] = obj
+        if kind.parent is not None:
+            self._children[kind_name].setdefault(parent_id, []).append(new_id)
+        return obj
+
+    def _remove(self, kind_name, obj_id):
+        kind = _KINDS[kind_name]
+        obj = self._objects[kind_name].pop(obj_id)
+        if kind.parent is not None:
+            siblings = self._children[kind_name].get(obj[kind.parent_key])
+            if siblings is not None: siblings.remove(obj_id)
+        for child in _KINDS.values():
+            if child.parent != kind_name: continue
+            for child_id in self._children[child.name].pop(obj_id, []):
+                self._objects[child.name].pop(child_id, None)
+                for grandchild in _KINDS.values():
+                    if grandchild.parent != child.name: continue
+                    for grandchild_id in self._children[grandchild.name].pop(child_id, []):
+                        self._objects[grandchild.name].pop(grandchild_id, None)
+
+    def _get(self, kind, kwargs):
+        obj = self._objects[kind.name].get(_int(_required(kwargs, kind.id_param)))
+        if obj is None: raise _error(5, "Object not found")
+        return obj
+
+    def _parent_id(self, kind, kwargs):
+        parent = _KINDS[kind.parent]
+        parent_id = _int(_required(kwargs, parent.id_param))
+        if not self._objects[parent.name].has_key(parent_id): raise _error(5, "Object not found")
+        return parent_id
+
+    def _apply(self, kind, obj, kwargs):
+        """Copies the arguments of a create or update call onto an object."""
+        keys = dict([(key.lower(), key) for key in obj])
+        for param, value in kwargs.items():
+            key = keys.get(param)
+            if key is None or key == kind.id_key: continue
+            if key == kind.parent_key: continue
+            if isinstance(value, bool): value = int(value)
+            obj[key] = value
+
+    def _plan(self, kwargs):
+        plan_id = _int(_required(kwargs, "planid"))
+        for plan in PLANS:
+            if plan[u"PLANID"] == plan_id: return plan
+        raise _error(5, "Object not found")
+
+    def _apply_plan(self, linode, plan):
+        linode.update({u"PLANID": plan[u"PLANID"], u"TOTALRAM": plan[u"RAM"],
+                       u"TOTALHD": plan[u"DISK"] * 1024, u"TOTALXFER": plan[u"XFER"]})
+
+    def _power(self, kwargs, action, label, final_status):
+        linode = self._get(_KINDS["linode"], kwargs)
+        def finish(): linode[u"STATUS"] = final_status
+        return {u"JobID": self._add_job(linode[u"LINODEID"], action, label, finish)}
+
+    def _create_disk(self, kwargs, label):
+        linode_id = self._parent_id(_KINDS["disk"], kwargs)
+        disk = self._add("disk", linode_id)
+        self._apply(_KINDS["disk"], disk, kwargs)
+        job_id = self._add_job(linode_id, u"linode.disk.create", label)
+        return {u"DiskID": disk[u"DISKID"], u"JobID": job_id}
+
+    def _add_job(self, linode_id, action, label, on_finish=None):
+        job = self._add("job", linode_id)
+        job.update({u"ACTION": action, u"LABEL": label, u"HOST_START_DT": job[u"ENTERED_DT"]})
+        heapq.heappush(self._pending_jobs, (time.time() + self.job_duration, job[u"JOBID"], on_finish))
+        return job[u"JOBID"]
+
+    def _finish_jobs(self):
+        now = time.time()
+        while self._pending_jobs and self._pending_jobs[0][0] <= now:
+            finish_at, job_id, on_finish = heapq.heappop(self._pending_jobs)
+            job = self._objects["job"].get(job_id)
+            if job is None: continue
+            job.update({u"HOST_FINISH_DT": _now(), u"DURATION": int(round(self.job_duration)),
+                        u"HOST_SUCCESS": 1, u"HOST_MESSAGE": u""})
+            if on_finish is not None and self._objects["linode"].has_key(job[u"LINODEID"]):
+                on_finish()
+
+    def _maybe_fail(self, method_name):
+        for injected in self._injected:
+            injected_method, error, count = injected
+            if injected_method is not None and injected_method != method_name: continue
+            injected[2] -= 1
+            if injected[2] <= 0: self._injected.remove(injected)
+            raise error
+        if self.error_rate and self._random.random() < self.error_rate:
+            raise _error(8, "Simulated error in %s" % (method_name,))
+
+
+class _FakeApi(object):
+    """Stands in for a `linode.api.Api` object; see `FakeAccount.api`."""
+    def __init__(self, account, batching):
+        self._account = account
+        self._batching = batching
+        self._queued = []
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        def call(**kwargs):
+            if self._batching:
+                self._queued.append((name, kwargs))
+                return None
+            return self._account.call(name, kwargs)
+        return call
+
+    def batchFlush(self):
+        queued, self._queued = self._queued, []
+        return self._account.batch(queued)
+
+
+def _error(code, message):
+    return linode_api.ApiError([{u"ERRORCODE": code, u"ERRORMESSAGE": unicode(message)}])
+
+def _required(kwargs, param):
+    if not kwargs.has_key(param): raise _error(6, "%s is required" % (param.upper(),))
+    return kwargs[param]
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise _error(6, "'%s' is not a valid ID" % (value,))
+
+def _flag(value):
+    if isinstance(value, basestring): return value.lower() in ("1", "true", "yes")
+    return bool(value)
@@ -0,0 +1,233 @@
+"""Module for looking up the account's IP addresses by address."""
+import bisect
+import threading
+import time
+
+from .api import api_handler
+from .model import _list_or_nothing
+
+
+class IPIndex:
+    """An index of every IP address on the account, by address and by network.
+
+       Get the shared one from `IPAddress.fleet_index`, or use `IPAddress.lookup`:
+
+           addr = IPAddress.lookup(address="203.0.113.7")
+           addr.linode_id                                   # the owner's ID
+           IPAddress.in_network(network="203.0.113.0/24")   # sorted by address
+
+       The index is built with a single `linode_ip_list` call for the whole account,
+       the first time it's used. After that, lookups don't call the API: looking up an
+       address is a dict lookup, and a network query a binary search of the sorted
+       IPv4 addresses.
+
+       `refresh` fetches the list again and updates the index in place: the
+       IPAddress objects you already have are updated rather than replaced, new
+       addresses are added and deleted ones dropped. `refresh(linode=...)` does that
+       for a single Linode's addresses, which is cheaper when you know what changed.
+
+       An IPIndex is safe to share between threads."""
+    def __init__(self, model, max_age=None):
+        """Initializes the IPIndex.
+
+           `model`: The IPAddress model.
+           `max_age` (optional): How many seconds the index is good for. Once it's
+               older than that, the next lookup refreshes it. By default it's only
+               refreshed when you call `refresh`."""
+        self.model = model
+        self.max_age = max_age
+        self.built_at = None
+        self._by_address = {}
+        self._by_id = {}
+        self._sorted = []
+        self._sorted_keys = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        self._ensure_fresh()
+        return len(self._by_id)
+
+    def __contains__(self, address):
+        return self.lookup(address) is not None
+
+    def lookup(self, address):
+        """Returns the IPAddress object for the given address, or None if there's no
+           such address on the account."""
+        self._ensure_fresh()
+        return self._by_address.get(address)
+
+    def in_network(self, network):
+        """Returns the IPAddress objects in the given IPv4 network, sorted by address.
+
+           `network`: A CIDR network like "203.0.113.0/24". A bare address is the
+               same as a /32."""
+        first, last = _parse_network(network)
+        self._ensure_fresh()
+        keys, addrs = self._sorted_keys, self._sorted
+        start = bisect.bisect_left(keys, first)
+        end = bisect.bisect_right(keys, last)
+        return addrs[start:end]
+
+    def refresh(self, linode=None):
+        """Fetches the account's IP addresses again and updates the index.
+
+           `linode` (optional): Only fetch the addresses of this Linode (a Linode object
+               or a numeric Linode ID). If the Linode no longer exists, its addresses
+               are dropped. An index that hasn't been built yet always fetches
+               everything."""
+        if self.built_at is None: linode = None
+        if linode is not None and type(linode) is not int: linode = linode.api_id
+        if linode is None: api_dicts = api_handler.linode_ip_list()
+        else: api_dicts = _list_or_nothing(api_handler.linode_ip_list, {"linodeid": linode})
+        id_attr = self.model._direct_attrs_by_name["api_id"]
+        self._lock.acquire()
+        try:
+            by_id = dict(self._by_id)
+            if linode is None:
+                by_id.clear()
+            else:
+                for api_id, addr in self._by_id.items():
+                    if addr.linode_id == linode: del by_id[api_id]
+            for api_dict in api_dicts:
+                api_id = id_attr.local_type(api_dict[id_attr.api_name])
+                addr = self._by_id.get(api_id)
+                if addr is None:
+                    addr = self.model.from_api_dict(api_dict)
+                else:
+                    addr._copy_from(self.model._hydrate(api_dict))
+                    addr.forget_related()
+                by_id[api_id] = addr
+            self._rebuild(by_id)
+            if linode is None: self.built_at = time.time()
+        finally:
+            self._lock.release()
+
+    def _rebuild(self, by_id):
+        by_address = {}
+        keyed = []
+        for addr in by_id.itervalues():
+            by_address[addr.address] = addr
+            try:
+                keyed.append((_parse_ipv4(addr.address), addr))
+            except ValueError:
+                pass
+        keyed.sort(key=lambda pair: pair[0])
+        # Readers may be using the old structures, so they're replaced rather than
+        # modified.
+        self._by_id = by_id
+        self._by_address = by_address
+        self._sorted_keys = [key for key, addr in keyed]
+        self._sorted = [addr for key, addr in keyed]
+
+    def _ensure_fresh(self):
+        if self.built_at is None or (self.max_age is not None and
+                                     time.time() - self.built_at > self.max_age):
+            self.refresh()
+
+
+def _parse_ipv4(address):
+    """Returns a dotted-quad IPv4 address as an integer."""
+    parts = address.split(".")
+    if len(parts) != 4: raise ValueError("Not an IPv4 address: '%s'" % (address,))
+    value = 0
+    for part in parts:
+        if not part.isdigit() or int(part) > 255:
+            raise ValueError("Not an IPv4 address: '%s'" % (address,))
+        value = (value << 8) | int(part)
+    return value
+
+
+def _parse_network(network):
+    """Returns the first and last addresses of a CIDR network, as integers."""
+    if "/" in network:
+        address, prefix_len = network.split("/", 1)
+        if not prefix_len.isdigit() or int(prefix_len) > 32:
+            raise ValueError("Invalid prefix length in network '%s'" % (network,))
+        prefix_len = int(prefix_len)
+    else:
+        address, prefix_len = network, 32
+    mask = (0xffffffff << (32 - prefix_len)) & 0xffffffff
+    first = _parse_ipv4(address) & mask
+    return first, first | (~mask & 0xffffffff)
+
+
+class IPIndexTest:
+    """Suite of offline tests to run when `chuber test IPIndex` is called. They run
+       against a FakeAccount, so they don't need an API key."""
+    @classmethod
+    def run(cls):
+        from .fake_api import FakeAccount
+        from .linode_obj import Linode, IPAddress
+
+        account = FakeAccount(job_duration=0)
+        account.seed(linodes=3, ips_per_linode=2)
+        uninstall = account.install(api_handler)
+        try:
+            linodes = Linode.search()
+            addrs = []
+            for linode_obj in linodes: addrs.extend(linode_obj.ipaddresses)
+            index = IPIndex(IPAddress)
+
+            print "~~~ Looking up addresses"
+            print
+            account.log = []
+            for addr in addrs:
+                found = index.lookup(addr.address)
+                assert found.api_id == addr.api_id and found.linode_id == addr.linode_id
+            assert index.lookup("192.0.2.1") is None
+            assert addrs[0].address in index and "192.0.2.1" not in index
+            assert len(index) == len(addrs)
+            assert [method for method, kwargs in account.log] == ["linode_ip_list"]
+            account.log = None
+
+            print "~~~ Querying networks"
+            print
+            def check_network(network):
+                first, last = _parse_network(network)
+                expected = [a for a in addrs if first <= _parse_ipv4(a.address) <= last]
+                expected.sort(key=lambda a: _parse_ipv4(a.address))
+                found = index.in_network(network)
+                assert [a.api_id for a in found] == [a.api_id for a in expected], network
+            for network in ("0.0.0.0/0", "172.16.0.0/12", "10.0.0.0/8", addrs[1].address,
+                            addrs[1].address + "/30", "192.0.2.0/24"):
+                check_network(network)
+            for network in ("10.0.0.0/33", "10.0.0/8", "10.0.0.256"):
+                try:
+                    index.in_network(network)
+                except ValueError:
+                    pass
+                else:
+                    raise AssertionError("'%s' was accepted as a network" % (network,))
+
+            print "~~~ Refreshing the index"
+            print
+            kept = index.lookup(addrs[0].address)
+            api_handler.linode_ip_addprivate(linodeid=linodes[0].api_id)
+            new_addrs = [a for a in linodes[0].ipaddresses if a.address not in index]
+            assert len(new_addrs) == 1
+            index.refresh(linode=linodes[0])
+            assert index.lookup(new_addrs[0].address).linode_id == linodes[0].api_id
+            assert index.lookup(addrs[0].address) is kept
+            assert len(index) == len(addrs) + 1
+
+            api_handler.linode_delete(linodeid=linodes[1].api_id, skipchecks=True)
+            index.refresh(linode=linodes[1].api_id)
+            assert [a for a in addrs if a.linode_id == linodes[1].api_id and a.address in index] == []
+            assert len(index) == len(addrs) - 1
+            api_handler.linode_delete(linodeid=linodes[2].api_id, skipchecks=True)
+            index.refresh()
+            assert len(index) == 3 and index.lookup(addrs[0].address) is kept
+
+            print "~~~ Refreshing an index that's too old"
+            print
+            index = IPIndex(IPAddress, max_age=0)
+            len(index)
+            time.sleep(0.01)
+            account.log = []
+            len(index)
+            assert [method for method, kwargs in account.log] == ["linode_ip_list"]
+            account.log = None
+        finally:
+            uninstall()
+
+        print "~~~ Tests passed!"
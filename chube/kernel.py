@@ -1,4 +1,3 @@
-from .api import api_handler
 from .model import *
 from .util import keywords_only
 
@@ -10,6 +9,8 @@ class Kernel(Model):
         DirectAttr("is_pvops", u"ISPVOPS", bool, int)
     ]
 
+    list_method = "avail_kernels"
+
     @classmethod
     @keywords_only
     def search(cls, **kwargs):
@@ -18,14 +19,7 @@ class Kernel(Model):
            The special paramater `label_begins` allows you to case-insensitively
            match the beginning of the label string. For example,
            `Kernel.search(label_begins='Latest 64 bit')`."""
-        a = [cls.from_api_dict(d) for d in api_handler.avail_kernels()]
-        if kwargs.has_key("label_begins"):
-            a = [kernel for kernel in a if
-                 kernel.label.lower().startswith(kwargs["label_begins"].lower())]
-            del kwargs["label_begins"]
-        for k, v in kwargs.items():
-            a = [kernel for kernel in a if getattr(kernel, k) == v]
-        return a
+        return cls._search(kwargs)
 
     @classmethod
     @keywords_only
@@ -42,10 +36,7 @@ class Kernel(Model):
 
     def refresh(self):
         """Refreshes the kernel with a new API call."""
-        new_inst = Kernel.find(api_id=self.api_id)
-        for attr in self.direct_attrs:
-            setattr(self, attr.local_name, getattr(new_inst, attr.local_name))
-        del new_inst
+        self._refresh_with(lambda: Kernel.find(api_id=self.api_id))
 
     def __repr__(self):
         return "<Kernel label='%s'>" % self.label
@@ -2,12 +2,16 @@
 
    In case you're wondering, this module is called 'linode_obj' instead of 'linode'
    because the latter conflicts with the Python Linode bindings."""
+import math
 import time
+import threading
+import concurrent.futures
 
-from .api import api_handler
+from .api import api_handler, async_api_handler
 from .util import RequiresParams, keywords_only
 from .model import *
 from .datacenter import Datacenter
+from .ip_index import IPIndex
 
 
 class Linode(Model):
@@ -25,7 +29,7 @@ class Linode(Model):
     direct_attrs = [
         # IDs
         DirectAttr("api_id", u"LINODEID", int, int,
-                   update_as="linodeid"),
+                   update_as="linodeid", is_key=True),
         DirectAttr("datacenter_id", u"DATACENTERID", int, int),
 
         # Properties
@@ -68,33 +72,36 @@ class Linode(Model):
                    update_as="watchdog")
     ]
 
+    list_method = "linode_list"
+    list_id_param = "linodeid"
+
     # The `datacenter` attribute is done with a deferred lookup.
     def _datacenter_getter(self):
-        return Datacenter.find(api_id=self.datacenter_id)
+        return Datacenter.from_session(self.datacenter_id) or Datacenter.find(api_id=self.datacenter_id)
     def _datacenter_setter(self, val):
         raise NotImplementedError("You can't just go around changing the `datacenter` property. Who do you think you are?")
-    datacenter = property(_datacenter_getter, _datacenter_setter)
+    datacenter = Related(_datacenter_getter, _datacenter_setter)
 
     # The `ipaddresses` attribute
     def _ipaddresses_getter(self):
         return IPAddress.search(linode=self.api_id)
     def _ipaddresses_setter(self, val):
         raise NotImplementedError("Cannot set `ipaddresses` directly; use `add_private_ip` instead.")
-    ipaddresses = property(_ipaddresses_getter, _ipaddresses_setter)
+    ipaddresses = Related(_ipaddresses_getter, _ipaddresses_setter, cached=False)
 
     # The `configs` attribute
     def _configs_getter(self):
         return Config.search(linode=self.api_id)
     def _configs_setter(self, val):
         raise NotImplementedError("Cannot set `configs` directly; use `add_config` instead.")
-    configs = property(_configs_getter, _configs_setter)
+    configs = Related(_configs_getter, _configs_setter, cached=False)
 
     # The `configs` attribute
     def _disks_getter(self):
         return Disk.search(linode=self.api_id)
     def _disks_setter(self, val):
         raise NotImplementedError("Cannot set `disks` directly; use `create_disk` instead.")
-    disks = property(_disks_getter, _disks_setter)
+    disks = Related(_disks_getter, _disks_setter, cached=False)
 
     # The `all_jobs` attribute
     def _all_jobs_getter(self):
@@ -110,6 +117,25 @@ class Linode(Model):
         raise NotImplementedError("Cannot set `pending_jobs` attribute.")
     pending_jobs = property(_pending_jobs_getter, _pending_jobs_setter)
 
+    # Fetchers for `prefetch`. Each returns the relationship's value for each Linode.
+    @classmethod
+    def _prefetch_datacenter(cls, linodes):
+        datacenters = dict([(datacenter.api_id, datacenter) for datacenter in Datacenter.search()])
+        return [datacenters.get(linode_obj.datacenter_id) for linode_obj in linodes]
+    @classmethod
+    def _prefetch_ipaddresses(cls, linodes):
+        # Without a Linode ID, `linode.ip.list` returns the whole account's addresses.
+        by_linode = {}
+        for addr in IPAddress._select(api_handler.linode_ip_list(), {}):
+            by_linode.setdefault(addr.linode_id, []).append(addr)
+        return [by_linode.get(linode_obj.api_id, []) for linode_obj in linodes]
+    @classmethod
+    def _prefetch_configs(cls, linodes):
+        return api_handler.map(lambda linode_obj: Config.search(linode=linode_obj.api_id), linodes)
+    @classmethod
+    def _prefetch_disks(cls, linodes):
+        return api_handler.map(lambda linode_obj: Disk.search(linode=linode_obj.api_id), linodes)
+
     @classmethod
     @keywords_only
     def search(cls, **kwargs):
@@ -117,15 +143,11 @@ class Linode(Model):
         
            The special paramater `label_begins` allows you to case-insensitively
            match the beginning of the label string. For example,
-           `Linode.search(label_begins='web-')`."""
-        a = [cls.from_api_dict(d) for d in api_handler.linode_list()]
-        if kwargs.has_key("label_begins"):
-            a = [linode_obj for linode_obj in a if
-                 linode_obj.label.lower().startswith(kwargs["label_begins"].lower())]
-            del kwargs["label_begins"]
-        for k, v in kwargs.items():
-            a = [linode_obj for linode_obj in a if getattr(linode_obj, k) == v]
-        return a
+           `Linode.search(label_begins='web-')`.
+
+           `prefetch` (optional): A list of relationships to fetch for all the results
+               at once: any of "datacenter", "ipaddresses", "configs" and "disks"."""
+        return cls._search(kwargs)
 
     @classmethod
     @keywords_only
@@ -159,16 +181,14 @@ class Linode(Model):
         return cls.find(api_id=new_linode_id)
 
     def save(self):
-        """Saves the Linode object to the API."""
-        api_params = self.api_update_params()
-        api_handler.linode_update(**api_params)
+        """Saves the changes made to the Linode object to the API, if there are any."""
+        if not self.is_dirty: return
+        api_params = self.api_update_params(changed_only=True)
+        self._mark_saved_when_done(api_handler.linode_update(**api_params))
 
     def refresh(self):
         """Refreshes the Linode object with a new API call."""
-        new_inst = Linode.find(api_id=self.api_id)
-        for attr in self.direct_attrs:
-            setattr(self, attr.local_name, getattr(new_inst, attr.local_name))
-        del new_inst
+        self._refresh_with(lambda: Linode.find(api_id=self.api_id))
 
     def destroy(self):
         """Deletes the Linode."""
@@ -180,6 +200,7 @@ class Linode(Model):
     def add_private_ip(self):
         """Adds a private IP address to the Linode and returns it."""
         rval = api_handler.linode_ip_addprivate(linodeid=self.api_id)
+        self.forget_related("ipaddresses")
         return IPAddress.find(linode=self.api_id, api_id=rval["IPADDRESSID"])
 
     @keywords_only
@@ -189,6 +210,7 @@ class Linode(Model):
             if type(kwargs['linode']) is not int: kwargs['linode'] = kwargs['linode'].api_id
             if kwargs['linode'] != self.api_id:
                 raise RuntimeError("Received 'linode' argument that differed from the instance")
+        self.forget_related("disks")
         return Disk.create(linode=self.api_id, **kwargs)
 
     def is_up(self):
@@ -197,7 +219,7 @@ class Linode(Model):
 
     @keywords_only
     def boot(self, **kwargs):
-        """Boots the Linode.
+        """Boots the Linode, and returns the boot Job (a handle; see `Model.handle`).
  
            `config` (optional): A Config object or a numerical Config ID."""
         api_args = {"linodeid": self.api_id}
@@ -207,11 +229,11 @@ class Linode(Model):
             else:
                 api_args["configid"] = kwargs["config"]
         rval = api_handler.linode_boot(**api_args)
-        return Job.find(linode=self.api_id, api_id=rval["JobID"], include_finished=True)
+        return Job.handle(rval["JobID"], parent=self.api_id)
 
     @keywords_only
     def reboot(self, **kwargs):
-        """Reboots the Linode.
+        """Reboots the Linode, and returns the reboot Job (a handle; see `Model.handle`).
         
            `config` (optional): A Config object or a numerical Config ID."""
         api_args = {"linodeid": self.api_id}
@@ -221,13 +243,14 @@ class Linode(Model):
             else:
                 api_args["configid"] = kwargs["config"]
         rval = api_handler.linode_reboot(**api_args)
-        return Job.find(linode=self.api_id, api_id=rval["JobID"], include_finished=True)
+        return Job.handle(rval["JobID"], parent=self.api_id)
 
     @keywords_only
     def shutdown(self, **kwargs):
-        """Shuts down the Linode."""
+        """Shuts down the Linode, and returns the shutdown Job (a handle; see
+           `Model.handle`)."""
         rval = api_handler.linode_shutdown(linodeid=self.api_id)
-        return Job.find(linode=self.api_id, api_id=rval["JobID"], include_finished=True)
+        return Job.handle(rval["JobID"], parent=self.api_id)
 
     @RequiresParams("plan", "datacenter", "payment_term")
     @keywords_only
@@ -268,12 +291,21 @@ class IPAddress(Model):
         DirectAttr("is_public", u"ISPUBLIC", bool, int)
     ]
 
+    list_method = "linode_ip_list"
+    list_id_param = "ipaddressid"
+    list_parent = ("linode_id", "linodeid")
+
+    # The IPIndex behind `lookup` and `in_network` (see `fleet_index`), with the API
+    # key and factory it was built for.
+    _fleet_index = None
+    _fleet_index_lock = threading.Lock()
+
     # The `linode` attribute is done with a deferred lookup.
     def _linode_getter(self):
-        return Linode.find(api_id=self.linode_id)
+        return Linode.from_session(self.linode_id) or Linode.find(api_id=self.linode_id)
     def _linode_setter(self, val):
         raise NotImplementedError("Cannot assign IP address to a different Linode")
-    linode = property(_linode_getter, _linode_setter)
+    linode = Related(_linode_getter, _linode_setter)
 
     @classmethod
     @RequiresParams("linode")
@@ -284,12 +316,8 @@ class IPAddress(Model):
            At least `linode` is required. It can be a Linode object or a numeric Linode ID."""
         linode = kwargs["linode"]
         if type(linode) is not int: linode = linode.api_id
-        a = [cls.from_api_dict(d) for d in api_handler.linode_ip_list(linodeid=linode)]
         del kwargs["linode"]
-
-        for k, v in kwargs.items():
-            a = [addr for addr in a if getattr(addr, k) == v]
-        return a
+        return cls._search(kwargs, linodeid=linode)
 
     @classmethod
     @RequiresParams("api_id", "linode")
@@ -305,12 +333,48 @@ class IPAddress(Model):
         a = [cls.from_api_dict(d) for d in api_handler.linode_ip_list(linodeid=linode, ipaddressid=kwargs["api_id"])]
         return a[0]
 
+    @classmethod
+    def fleet_index(cls):
+        """Returns the shared IPIndex of all the account's IP addresses (see
+           `chube.ip_index`), which is built the first time it's used.
+
+           The index belongs to the account `api_handler` talks to: after its
+           `api_key` or `api_factory` changes (as with `replay`), you get a new one."""
+        account = (api_handler.api_key, api_handler.api_factory)
+        cls._fleet_index_lock.acquire()
+        try:
+            if cls._fleet_index is None or cls._fleet_index[0] != account:
+                cls._fleet_index = (account, IPIndex(cls))
+            return cls._fleet_index[1]
+        finally:
+            cls._fleet_index_lock.release()
+
+    @classmethod
+    @RequiresParams("address")
+    @keywords_only
+    def lookup(cls, **kwargs):
+        """Returns the IPAddress instance for the given address, or None if no Linode
+           on the account has it.
+
+           For example, `IPAddress.lookup(address="203.0.113.7").linode_id`.
+
+           It uses the `fleet_index`, so only the first lookup calls the API. Call
+           `IPAddress.fleet_index().refresh()` to pick up changes."""
+        return cls.fleet_index().lookup(kwargs["address"])
+
+    @classmethod
+    @RequiresParams("network")
+    @keywords_only
+    def in_network(cls, **kwargs):
+        """Returns the list of IPAddress instances in an IPv4 network, sorted by address.
+
+           For example, `IPAddress.in_network(network="203.0.113.0/24")`. Like `lookup`,
+           it uses the `fleet_index`."""
+        return cls.fleet_index().in_network(kwargs["network"])
+
     def refresh(self):
         """Refreshes the IPAddress object with a new API call."""
-        new_inst = IPAddress.find(api_id=self.api_id, linode=self.linode_id)
-        for attr in self.direct_attrs:
-            setattr(self, attr.local_name, getattr(new_inst, attr.local_name))
-        del new_inst
+        self._refresh_with(lambda: IPAddress.find(api_id=self.api_id, linode=self.linode_id))
 
     def __repr__(self):
         return "<IPAddress api_id=%d, address='%s'>" % (self.api_id, self.address)
@@ -320,9 +384,9 @@ class Config(Model):
     direct_attrs = [
         # IDs
         DirectAttr("api_id", u"ConfigID", int, int,
-                   update_as="configid"),
+                   update_as="configid", is_key=True),
         DirectAttr("linode_id", u"LinodeID", int, int,
-                   update_as="linodeid"),
+                   update_as="linodeid", is_key=True),
         DirectAttr("kernel_id", u"KernelID", int, int,
                    update_as="kernelid"),
 
@@ -355,23 +419,26 @@ class Config(Model):
                    update_as="helper_disableupdatedb")
     ]
 
+    list_method = "linode_config_list"
+    list_id_param = "configid"
+    list_parent = ("linode_id", "linodeid")
+
     # The `linode` attribute is done with a deferred lookup.
     def _linode_getter(self):
-        return Linode.find(api_id=self.linode_id)
+        return Linode.from_session(self.linode_id) or Linode.find(api_id=self.linode_id)
     def _linode_setter(self, val):
         raise NotImplementedError("Cannot assign Config to a different Linode")
-    linode = property(_linode_getter, _linode_setter)
+    linode = Related(_linode_getter, _linode_setter)
 
     # The `disks` attribute is based on `disk_list`
     def _disks_getter(self):
         """Returns the list of disks associated with the configuration.
 
-           If any slot is empty, `None` will be returned in that slot."""
-        disks = []
-        for disk_id in self.disk_list.split(","):
-            if disk_id == "": disks.append(None)
-            else: disks.append(Disk.find(linode=self.linode_id, api_id=int(disk_id)))
-        return disks
+           If any slot is empty, `None` will be returned in that slot. The disks are
+           looked up with a single call for all the Linode's disks; see `resolve_disks`
+           to do it for many configs at once."""
+        if not self._disk_ids(): return self._disks_from({})
+        return self._disks_from(dict([(disk.api_id, disk) for disk in Disk.search(linode=self.linode_id)]))
     def _disks_setter(self, val):
         """Updates the list of disks associated with the configuration.
 
@@ -385,7 +452,51 @@ class Config(Model):
         if len(disk_ids) != 9:
             raise "A Config must have exactly 9 disks. Use `None` for empty slots."
         self.disk_list = ",".join(map(str, disk_ids))
-    disks = property(_disks_getter, _disks_setter)
+        self._remember_related("disks", list(val), time.time())
+    disks = Related(_disks_getter, _disks_setter, cached=False, derived_from=["disk_list"])
+
+    def _disk_ids(self):
+        """Returns the IDs of the disks in `disk_list`, without the empty slots."""
+        return [int(disk_id) for disk_id in self.disk_list.split(",") if disk_id != ""]
+
+    def _disks_from(self, disks_by_id):
+        """Returns the config's list of disks, taken from a dict of the Linode's disks
+           by ID, with `None` in the empty slots."""
+        disks = []
+        for disk_id in self.disk_list.split(","):
+            if disk_id == "":
+                disks.append(None)
+            elif disks_by_id.has_key(int(disk_id)):
+                disks.append(disks_by_id[int(disk_id)])
+            else:
+                raise RuntimeError("No Disk found with api_id %s on Linode %s" % (disk_id, self.linode_id))
+        return disks
+
+    @classmethod
+    def resolve_disks(cls, configs):
+        """Looks up the disks of many configs at once, and returns the list of each
+           config's `disks`, in the same order as `configs`.
+
+           It makes one `linode_disk_list` call per Linode (in parallel on
+           `api_handler`'s worker pool) rather than one per config, and the configs
+           remember their disks, as if they had been read."""
+        configs = list(configs)
+        cls.prefetch(configs, ["disks"])
+        return [config.disks for config in configs]
+
+    @classmethod
+    def _prefetch_disks(cls, configs):
+        linode_ids, seen = [], set()
+        for config in configs:
+            if config.linode_id in seen or not config._disk_ids(): continue
+            seen.add(config.linode_id)
+            linode_ids.append(config.linode_id)
+        disk_lists = api_handler.map(lambda linode_id: Disk.search(linode=linode_id), linode_ids)
+        disks_by_linode = {}
+        for linode_id, disks in zip(linode_ids, disk_lists):
+            disks_by_linode[linode_id] = dict([(disk.api_id, disk) for disk in disks])
+        return [config._disks_from(disks_by_linode.get(config.linode_id, {})) for config in configs]
+
 
     @classmethod
     @RequiresParams("linode", "kernel", "label", "disks")
@@ -414,6 +525,7 @@ class Config(Model):
         rval = api_handler.linode_config_create(linodeid=linode, kernelid=kernel, label=label,
                                                 disklist=disklist)
         new_config_id = rval[u"ConfigID"]
+        Linode._forget_related_of(kwargs["linode"], "configs")
         return cls.find(api_id=new_config_id, linode=linode)
 
     @classmethod
@@ -422,15 +534,14 @@ class Config(Model):
     def search(cls, **kwargs):
         """Returns the list of Config instances that match the given criteria.
         
-           At least `linode` is required. It can be a Linode object or a numeric Linode ID."""
+           At least `linode` is required. It can be a Linode object or a numeric Linode ID.
+
+           `prefetch` (optional): `["disks"]` to fetch the disks of all the results at
+               once."""
         linode = kwargs["linode"]
         if type(linode) is not int: linode = linode.api_id
-        a = [cls.from_api_dict(d) for d in api_handler.linode_config_list(linodeid=linode)]
         del kwargs["linode"]
-
-        for k, v in kwargs.items():
-            a = [conf for conf in a if getattr(conf, k) == v]
-        return a
+        return cls._search(kwargs, linodeid=linode)
 
     @classmethod
     @RequiresParams("api_id", "linode")
@@ -447,20 +558,19 @@ class Config(Model):
         return a[0]
 
     def save(self):
-        """Saves the Config object to the API."""
-        api_params = self.api_update_params()
-        api_handler.linode_config_update(**api_params)
+        """Saves the changes made to the Config object to the API, if there are any."""
+        if not self.is_dirty: return
+        api_params = self.api_update_params(changed_only=True)
+        self._mark_saved_when_done(api_handler.linode_config_update(**api_params))
 
     def refresh(self):
         """Refreshes the Config object with a new API call."""
-        new_inst = Config.find(api_id=self.api_id, linode=self.linode_id)
-        for attr in self.direct_attrs:
-            setattr(self, attr.local_name, getattr(new_inst, attr.local_name))
-        del new_inst
+        self._refresh_with(lambda: Config.find(api_id=self.api_id, linode=self.linode_id))
 
     def destroy(self):
         """Deletes the Config object."""
-        api_handler.linode_config_delete(linodeid=self.linode.api_id, configid=self.api_id)
+        api_handler.linode_config_delete(linodeid=self.linode_id, configid=self.api_id)
+        Linode._forget_related_of(self._remembered_related("linode") or self.linode_id, "configs")
 
     def __repr__(self):
         return "<Config api_id=%d, label='%s'>" % (self.api_id, self.label)
@@ -470,9 +580,9 @@ class Disk(Model):
     direct_attrs = [
         # IDs
         DirectAttr("api_id", u"DISKID", int, int,
-                   update_as="diskid"),
+                   update_as="diskid", is_key=True),
         DirectAttr("linode_id", u"LINODEID", int, int,
-                   update_as="linodeid"),
+                   update_as="linodeid", is_key=True),
 
         # Properties
         DirectAttr("label", u"LABEL", unicode, unicode,
@@ -486,12 +596,16 @@ class Disk(Model):
         DirectAttr("size", u"SIZE", int, int)
     ]
 
+    list_method = "linode_disk_list"
+    list_id_param = "diskid"
+    list_parent = ("linode_id", "linodeid")
+
     # The `linode` attribute is done with a deferred lookup.
     def _linode_getter(self):
-        return Linode.find(api_id=self.linode_id)
+        return Linode.from_session(self.linode_id) or Linode.find(api_id=self.linode_id)
     def _linode_setter(self, val):
         raise NotImplementedError("Cannot assign Disk to a different Linode")
-    linode = property(_linode_getter, _linode_setter)
+    linode = Related(_linode_getter, _linode_setter)
 
     @classmethod
     @RequiresParams("linode")
@@ -502,12 +616,8 @@ class Disk(Model):
            At least `linode` is required. It can be a Linode object or a numeric Linode ID."""
         linode = kwargs["linode"]
         if type(linode) is not int: linode = linode.api_id
-        a = [cls.from_api_dict(d) for d in api_handler.linode_disk_list(linodeid=linode)]
         del kwargs["linode"]
-
-        for k, v in kwargs.items():
-            a = [addr for addr in a if getattr(addr, k) == v]
-        return a
+        return cls._search(kwargs, linodeid=linode)
 
     @classmethod
     @RequiresParams("api_id", "linode")
@@ -563,6 +673,7 @@ class Disk(Model):
             stackscriptudfresponses=unicode(ss_input), distributionid=distribution,
             label=label, size=size, rootpass=root_pass)
         new_disk_id = rval[u"DiskID"]
+        Linode._forget_related_of(kwargs["linode"], "disks")
         return cls.find(api_id=new_disk_id, linode=linode)
 
     @classmethod
@@ -590,6 +701,7 @@ class Disk(Model):
             linodeid=linode, distributionid=distribution, label=label, size=size,
             rootpass=root_pass, rootsshkey=root_ssh_key)
         new_disk_id = rval[u"DiskID"]
+        Linode._forget_related_of(kwargs["linode"], "disks")
         return cls.find(api_id=new_disk_id, linode=linode)
 
     @classmethod
@@ -608,35 +720,36 @@ class Disk(Model):
         rval = api_handler.linode_disk_create(linodeid=linode, label=label, type=fstype,
                                               size=size)
         new_disk_id = rval[u"DiskID"]
+        Linode._forget_related_of(kwargs["linode"], "disks")
         return cls.find(api_id=new_disk_id, linode=linode)
 
     def save(self):
-        """Saves the Disk object to the API."""
-        api_params = self.api_update_params()
-        api_handler.linode_disk_update(**api_params)
+        """Saves the changes made to the Disk object to the API, if there are any."""
+        if not self.is_dirty: return
+        api_params = self.api_update_params(changed_only=True)
+        self._mark_saved_when_done(api_handler.linode_disk_update(**api_params))
 
     def refresh(self):
         """Refreshes the Disk object with a new API call."""
-        new_inst = Disk.find(api_id=self.api_id, linode=self.linode_id)
-        for attr in self.direct_attrs:
-            setattr(self, attr.local_name, getattr(new_inst, attr.local_name))
-        del new_inst
+        self._refresh_with(lambda: Disk.find(api_id=self.api_id, linode=self.linode_id))
 
     def destroy(self):
         """Deletes the Disk."""
-        api_handler.linode_disk_delete(linodeid=self.linode.api_id, diskid=self.api_id)
+        api_handler.linode_disk_delete(linodeid=self.linode_id, diskid=self.api_id)
+        Linode._forget_related_of(self._remembered_related("linode") or self.linode_id, "disks")
 
     def resize(self, new_size):
         """Resizes the Disk.
 
            `new_size`: The new size of the disk, in MB."""
-        api_handler.linode_disk_resize(linodeid=self.linode.api_id, diskid=self.api_id,
+        api_handler.linode_disk_resize(linodeid=self.linode_id, diskid=self.api_id,
                                        size=new_size)
 
     def duplicate(self):
         """Performs a bit-for-bit copy of a disk image."""
-        rval = api_handler.linode_disk_duplicate(linodeid=self.linode.api_id, diskid=self.api_id)
-        return Disk.find(linode=self.linode.api_id, api_id=rval["DiskID"])
+        rval = api_handler.linode_disk_duplicate(linodeid=self.linode_id, diskid=self.api_id)
+        Linode._forget_related_of(self._remembered_related("linode") or self.linode_id, "disks")
+        return Disk.find(linode=self.linode_id, api_id=rval["DiskID"])
 
     def __repr__(self):
         return "<Disk api_id=%d, label='%s'>" % (self.api_id, self.label)
@@ -664,12 +777,17 @@ class Job(Model):
         DirectAttr("_host_success", u"HOST_SUCCESS", unicode, unicode)
     ]
 
+    list_method = "linode_job_list"
+    list_id_param = "jobid"
+    list_parent = ("linode_id", "linodeid")
+    list_params = {"pendingonly": False}
+
     # The `linode` attribute is done with a deferred lookup.
     def _linode_getter(self):
-        return Linode.find(api_id=self.linode_id)
+        return Linode.from_session(self.linode_id) or Linode.find(api_id=self.linode_id)
     def _linode_setter(self, val):
         raise NotImplementedError("Cannot assign Job to a different Linode")
-    linode = property(_linode_getter, _linode_setter)
+    linode = Related(_linode_getter, _linode_setter)
 
     # The `duration` attribute needs to be massaged before returning it to the
     # user. If the job isn't finished yet, we'll return `None`.
@@ -711,12 +829,8 @@ class Job(Model):
 
         linode = kwargs["linode"]
         if type(linode) is not int: linode = linode.api_id
-        a = [cls.from_api_dict(d) for d in api_handler.linode_job_list(linodeid=linode, pendingonly=(not include_finished))]
         del kwargs["linode"]
-
-        for k, v in kwargs.items():
-            a = [addr for addr in a if getattr(addr, k) == v]
-        return a
+        return cls._search(kwargs, linodeid=linode, pendingonly=(not include_finished))
 
     @classmethod
     @keywords_only
@@ -748,12 +862,44 @@ class Job(Model):
             time.sleep(check_interval)
         raise RuntimeError("Job '%s' on Linode '%s' took longer than %d seconds to complete; aborting." % (self.label, self.linode.label, timeout))
 
+    def wait_async(self, timeout=120, check_interval=5):
+        """Like `wait`, but returns a `concurrent.futures.Future` right away.
+
+           The Future's result is set when the job succeeds, and its exception is set
+           under the same conditions that `wait` raises. The checks run on
+           `async_api_handler`'s worker pool, and the waits between them on its single
+           `scheduler` thread, so it's fine to wait on lots of jobs at once."""
+        future = concurrent.futures.Future()
+        checks_left = [int(math.ceil(float(timeout) / check_interval))]
+
+        def check():
+            if checks_left[0] <= 0:
+                future.set_exception(RuntimeError("Job '%s' on Linode '%s' took longer than %d seconds to complete; aborting." % (self.label, self.linode.label, timeout)))
+                return
+            checks_left[0] -= 1
+            self.refresh_async().add_done_callback(on_refreshed)
+
+        def on_refreshed(refresh_future):
+            try:
+                refresh_future.result()
+                if self.is_fail():
+                    raise ValueError("Job '%s' on Linode '%s' failed" % (self.label, self.linode.label))
+            except Exception, e:
+                future.set_exception(e)
+                return
+            if self.is_success():
+                future.set_result(None)
+                return
+            async_api_handler.scheduler.call_later(check_interval,
+                                                   lambda: async_api_handler.submit(check))
+
+        check()
+        return future
+
     def refresh(self):
         """Refreshes the Job object with a new API call."""
-        new_inst = Job.find(api_id=self.api_id, linode=self.linode_id)
-        for attr in self.direct_attrs:
-            setattr(self, attr.local_name, getattr(new_inst, attr.local_name))
-        del new_inst
+        self._refresh_with(lambda: Job.find(api_id=self.api_id, linode=self.linode_id,
+                                            include_finished=True))
 
     def __repr__(self):
         return "<Job api_id=%d, label='%s'>" % (self.api_id, self.label)
@@ -796,6 +942,22 @@ class LinodeTest:
         linode_a.display_group = chube_display_group
         linode_a.save()
 
+        print "~~~ Saving Linode '%s' without changing it, then changing just `watchdog`" % (linode_a.label,)
+        print
+        calls = []
+        log_call = lambda method_name, kwargs: calls.append((method_name, kwargs))
+        api_handler.metrics.before_hooks.append(log_call)
+        try:
+            linode_a.display_group = chube_display_group
+            linode_a.save()
+            assert calls == []
+            linode_a.watchdog = not linode_a.watchdog
+            linode_a.save()
+            assert calls == [("linode_update", {"linodeid": linode_a.api_id, "watchdog": linode_a.watchdog})]
+            assert not linode_a.is_dirty
+        finally:
+            api_handler.metrics.before_hooks.remove(log_call)
+
         print "~~~ Creating Linode '%s' by specifying Datacenter and Plan objects" % (linode_b_name,)
         print
         plan = Plan.find(label="Linode 1024")
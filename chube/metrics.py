@@ -0,0 +1,158 @@
+"""Module for measuring the API calls chube makes."""
+import bisect
+import threading
+import time
+import BaseHTTPServer
+
+
+# Upper bounds, in seconds, of the latency histogram's buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class MethodStats(object):
+    """Counters for the calls to a single API method."""
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.items = 0
+        # One count per bucket of LATENCY_BUCKETS, plus one for slower calls.
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def as_dict(self):
+        """Returns the counters as a dict. `buckets` is a list of `(bound, count)` pairs
+           giving, for each bucket's upper bound, the number of calls that took at most
+           that long."""
+        buckets, total = [], 0
+        for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), self.bucket_counts):
+            total += count
+            buckets.append((bound, total))
+        return {"calls": self.calls, "errors": self.errors, "seconds": self.seconds,
+                "mean_seconds": self.seconds / self.calls if self.calls else 0.0,
+                "max_seconds": self.max_seconds, "items": self.items,
+                "buckets": buckets}
+
+
+class Metrics(object):
+    """Collects per-method call counts, error counts, latencies and response sizes.
+
+       Every call made through a Handler is measured from the caller's point of view,
+       so calls answered from a cache show up too, just faster. A response's size is
+       the number of records in it (1 for a single object).
+
+       `before_hooks` are called as `hook(method_name, kwargs)` before each call, and
+       `after_hooks` as `hook(method_name, kwargs, response, error, seconds)` after it,
+       where `error` is the exception the call raised or None. Exceptions raised by
+       hooks aren't caught.
+
+       A Metrics object is safe to share between threads."""
+    def __init__(self):
+        self.before_hooks = []
+        self.after_hooks = []
+        self._methods = {}
+        self._lock = threading.Lock()
+
+    def measure(self, method_name, kwargs, func):
+        """Calls `func()`, which makes a call to the given API method, and records it."""
+        for hook in self.before_hooks: hook(method_name, kwargs)
+        start = time.time()
+        try:
+            response = func()
+        except Exception, e:
+            seconds = time.time() - start
+            self.record(method_name, seconds, error=e)
+            for hook in self.after_hooks: hook(method_name, kwargs, None, e, seconds)
+            raise
+        seconds = time.time() - start
+        self.record(method_name, seconds, response=response)
+        for hook in self.after_hooks: hook(method_name, kwargs, response, None, seconds)
+        return response
+
+    def record(self, method_name, seconds, response=None, error=None):
+        """Records a call that took `seconds` seconds."""
+        self._lock.acquire()
+        try:
+            stats = self._methods.get(method_name)
+            if stats is None:
+                stats = self._methods[method_name] = MethodStats()
+            stats.calls += 1
+            if error is not None: stats.errors += 1
+            stats.seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.bucket_counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            stats.items += _response_size(response)
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        """Returns a dict mapping each API method called so far to a dict of its
+           counters (see `MethodStats.as_dict`)."""
+        self._lock.acquire()
+        try:
+            return dict([(name, stats.as_dict()) for name, stats in self._methods.items()])
+        finally:
+            self._lock.release()
+
+    def reset(self):
+        """Forgets everything recorded so far."""
+        self._lock.acquire()
+        try:
+            self._methods = {}
+        finally:
+            self._lock.release()
+
+    def openmetrics(self):
+        """Returns the metrics in the OpenMetrics text format, which Prometheus reads."""
+        stats = sorted(self.stats().items())
+        lines = ["# TYPE chube_api_calls counter",
+                 "# HELP chube_api_calls API calls made, by method."]
+        for name, s in stats:
+            lines.append('chube_api_calls_total{method="%s"} %d' % (name, s["calls"]))
+        lines += ["# TYPE chube_api_errors counter",
+                  "# HELP chube_api_errors API calls that raised an exception, by method."]
+        for name, s in stats:
+            lines.append('chube_api_errors_total{method="%s"} %d' % (name, s["errors"]))
+        lines += ["# TYPE chube_api_response_items counter",
+                  "# HELP chube_api_response_items Records returned by API calls, by method."]
+        for name, s in stats:
+            lines.append('chube_api_response_items_total{method="%s"} %d' % (name, s["items"]))
+        lines += ["# TYPE chube_api_call_seconds histogram",
+                  "# HELP chube_api_call_seconds Latency of API calls, by method.",
+                  "# UNIT chube_api_call_seconds seconds"]
+        for name, s in stats:
+            for bound, count in s["buckets"]:
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                lines.append('chube_api_call_seconds_bucket{method="%s",le="%s"} %d' % (name, le, count))
+            lines.append('chube_api_call_seconds_count{method="%s"} %d' % (name, s["calls"]))
+            lines.append('chube_api_call_seconds_sum{method="%s"} %r' % (name, s["seconds"]))
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+def serve_openmetrics(metrics, port, address=""):
+    """Serves `metrics.openmetrics()` over HTTP from a background thread.
+
+       Returns the server; call its `shutdown()` method to stop it."""
+    class MetricsRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = metrics.openmetrics()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/openmetrics-text; version=1.0.0; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        def log_message(self, format, *args):
+            pass
+
+    server = BaseHTTPServer.HTTPServer((address, port), MetricsRequestHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def _response_size(response):
+    if isinstance(response, (list, tuple)): return len(response)
+    if response is None: return 0
+    return 1
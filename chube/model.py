@@ -1,8 +1,16 @@
+import time
+
+from linode import api as linode_api
+
+from .api import api_handler, async_api_handler, BatchedCall
+from .query import compile_query
+
+
 class DirectAttr:
     """A model attribute that comes straight from the API."""
     def __init__(self, local_name, api_name, local_type, api_type,
                  update_as=None, update_only_if_type=None,
-                 may_be_absent=False, default=None):
+                 may_be_absent=False, default=None, is_key=False):
         """Initializes the DirectAttr instance.
 
            `local_name`: The name we'll use for the attribute locally (e.g. "label" or
@@ -22,7 +30,10 @@ class DirectAttr:
                DirectAttr is absent from an API response, it will be assigned the value
                passed as `default`.
            `default`: Default value for this DirectAttr when `may_be_absent` is True and the
-               attribute is absent from the API response."""
+               attribute is absent from the API response.
+           `is_key`: Whether this attribute identifies the object in `*_update` calls (e.g.
+               Config.linode_id). Key attributes are sent by every `save`, even when they
+               haven't changed."""
         self.local_name = local_name
         self.api_name = api_name
         self.local_type = local_type
@@ -31,6 +42,7 @@ class DirectAttr:
         self.update_only_if_type = update_only_if_type
         self.may_be_absent = may_be_absent
         self.default = default
+        self.is_key = is_key
 
     def __repr__(self):
         return "<DirectAttr local_name='%s'>" % (self.local_name,)
@@ -44,12 +56,554 @@ class DirectAttr:
         return True
 
 
+class Related(object):
+    """A model property for related objects that take API calls to look up (e.g.
+       `Linode.disks` or `Disk.linode`). It's used like `property`:
+
+           linode = Related(_linode_getter, _linode_setter)
+
+       The getter's result is remembered by the object, so reading the attribute again
+       doesn't call the API, until `max_age` seconds (if given) have passed, the object
+       is refreshed, or `forget_related` is called on it. Setting `cache_related` to
+       False on an object or a model makes every read call the getter.
+
+       Lists of child objects that come and go (like `Linode.disks`) are declared with
+       `cached=False`, so that they're looked up on every read, unless they were
+       fetched by `prefetch`; set `cached` to True (e.g. `Linode.disks.cached = True`)
+       to remember them too. Creating or destroying a child object makes its parent
+       forget the list when chube knows the parent object: when the child remembers
+       it, when it was passed to `create`, or when it's in the current Session.
+
+       A property computed from some of the object's own DirectAttrs (like
+       `Config.disks` from `disk_list`) names them in `derived_from`, so that the
+       remembered value is forgotten when one of them is assigned or reloaded."""
+    def __init__(self, fget, fset=None, max_age=None, cached=True, derived_from=()):
+        """Initializes the Related property.
+
+           `fget`: Function that looks up the related objects of a model object.
+           `fset` (optional): Function called when the attribute is assigned to.
+           `max_age` (optional): How many seconds a looked-up value is good for. By
+               default it's good until the object is refreshed.
+           `cached` (optional): If False, only values fetched by `prefetch` (or
+               assigned) are remembered.
+           `derived_from` (optional): The names of the DirectAttrs the value is
+               computed from."""
+        self.fget = fget
+        self.fset = fset
+        self.max_age = max_age
+        self.cached = cached
+        self.derived_from = tuple(derived_from)
+        self.name = None
+        self.__doc__ = fget.__doc__
+
+    def __get__(self, inst, owner):
+        if inst is None: return self
+        return inst._related(self.name, self.fget, self.max_age, self.cached)
+
+    def __set__(self, inst, value):
+        if self.fset is None: raise AttributeError("can't set attribute")
+        self.fset(inst, value)
+
+
+def _compile_hydrator(cls, lazy=False):
+    """Returns a function that builds an instance of `cls` from an API-returned dict.
+
+       It's the equivalent of `cls._hydrate_generic`, with the loop over `direct_attrs`
+       unrolled. If a required value is missing, it lets `_hydrate_generic` raise the
+       error.
+
+       Values are stored with the slots' own setters, so that `Model.__setattr__`
+       doesn't mark them as changed.
+
+       If `lazy` is True, the function only checks that the required values are there
+       and keeps the dict in the instance's `_api_dict`; `Model.__getattr__` converts
+       each value the first time it's read."""
+    namespace = {"cls": cls, "new": object.__new__}
+    if lazy:
+        missing = " or ".join(["%r not in api_dict" % (attr.api_name,)
+                               for attr in cls.direct_attrs if not attr.may_be_absent])
+        source = ("def hydrate_lazy(api_dict):\n"
+                  "    if %s:\n"
+                  "        return cls._hydrate_generic(api_dict)\n"
+                  "    inst = new(cls)\n"
+                  "    inst._api_dict = api_dict\n"
+                  "    return inst\n") % (missing or "False",)
+        exec compile(source, "<%s lazy hydrator>" % (cls.__name__,), "exec") in namespace
+        return namespace["hydrate_lazy"]
+
+    lines = []
+    for i, attr in enumerate(cls.direct_attrs):
+        namespace["type%d" % (i,)] = attr.local_type
+        namespace["set%d" % (i,)] = _attr_setter(cls, attr.local_name)
+        if attr.may_be_absent:
+            namespace["default%d" % (i,)] = attr.default
+            value = "api_dict.get(%r, default%d)" % (attr.api_name, i)
+        else:
+            value = "api_dict[%r]" % (attr.api_name,)
+        lines.append("        set%d(inst, type%d(%s))\n" % (i, i, value))
+    source = ("def hydrate(api_dict):\n"
+              "    inst = new(cls)\n"
+              "    try:\n" +
+              ("".join(lines) or "        pass\n") +
+              "    except KeyError:\n"
+              "        return cls._hydrate_generic(api_dict)\n"
+              "    return inst\n")
+    exec compile(source, "<%s hydrator>" % (cls.__name__,), "exec") in namespace
+    return namespace["hydrate"]
+
+
+def _list_or_nothing(list_call, kwargs):
+    """Makes a list call, returning an empty list if the API says the parent object
+       doesn't exist (error 5, "Object not found")."""
+    try:
+        return list_call(**kwargs)
+    except linode_api.ApiError, e:
+        if _is_not_found(e): return []
+        raise
+
+
+def _is_not_found(error):
+    """Determines whether an ApiError is error 5, "Object not found"."""
+    errors = error.value if isinstance(error.value, list) else []
+    return bool(errors) and errors[0].get(u"ERRORCODE") == 5
+
+
+def _attr_setter(cls, name):
+    """Returns a function that sets attribute `name` on instances of `cls` without going
+       through `cls.__setattr__`."""
+    setter = getattr(getattr(cls, name, None), "__set__", None)
+    if setter is None:
+        setter = lambda inst, value: object.__setattr__(inst, name, value)
+    return setter
+
+
+class ModelType(type):
+    """Metaclass for Model.
+
+       When a Model subclass is created, it compiles a constructor specialized for the
+       subclass's `direct_attrs`, which `from_api_dict` uses. That's several times
+       faster than looping over `direct_attrs` for every object.
+
+       Unless the subclass defines `__slots__` itself, it also gets one slot per
+       DirectAttr, so its instances don't need a `__dict__` to hold their values.
+
+       A lazy variant of the constructor is compiled too; see `Model.lazy_hydration`."""
+    def __new__(mcs, name, bases, namespace):
+        if not namespace.has_key("__slots__"):
+            inherited = set()
+            for base in bases:
+                for klass in base.__mro__:
+                    inherited.update(getattr(klass, "__slots__", ()))
+            direct_attrs = namespace.get("direct_attrs", [])
+            namespace["__slots__"] = tuple([attr.local_name for attr in direct_attrs
+                                            if attr.local_name not in inherited])
+        return super(ModelType, mcs).__new__(mcs, name, bases, namespace)
+
+    def __init__(cls, name, bases, namespace):
+        super(ModelType, cls).__init__(name, bases, namespace)
+        cls._hydrate = staticmethod(_compile_hydrator(cls))
+        cls._hydrate_lazy = staticmethod(_compile_hydrator(cls, lazy=True))
+        cls._direct_attrs_by_name = dict([(attr.local_name, attr) for attr in cls.direct_attrs])
+        cls._tracked_attr_names = frozenset([attr.local_name for attr in cls.direct_attrs
+                                             if attr.update_as is not None and not attr.is_key])
+        derived = {}
+        for base in bases:
+            for attr_name, names in getattr(base, "_derived_related", {}).items():
+                derived[attr_name] = derived.get(attr_name, ()) + names
+        for key, value in namespace.items():
+            if not isinstance(value, Related): continue
+            value.name = key
+            for attr_name in value.derived_from:
+                derived[attr_name] = derived.get(attr_name, ()) + (key,)
+        # The Related properties to forget when each DirectAttr is assigned.
+        cls._derived_related = derived
+
+
 class Model(object):
+    __metaclass__ = ModelType
+    # `__dict__` is only created if something sets an attribute that isn't a DirectAttr,
+    # so it costs nothing otherwise. `_api_dict` holds the API response of an instance
+    # that was hydrated lazily (or None for a handle that hasn't been fetched yet), and
+    # `_changed` the names of the savable DirectAttrs that were changed since it was
+    # fetched or saved. `_related_cache` maps the names of Related properties to the
+    # values they looked up and when.
+    __slots__ = ("__dict__", "__weakref__", "_api_dict", "_changed", "_related_cache")
     direct_attrs = []
 
+    # If False, Related properties (like `Linode.disks`) call the API every time
+    # they're read instead of remembering what they looked up. Set it on an object, a
+    # subclass, or Model.
+    cache_related = True
+
+    # If True, `from_api_dict` keeps a reference to the API-returned dict instead of
+    # converting every value up front, and each DirectAttr is converted the first time
+    # it's read. That's much faster when only a few attributes are used, at the cost of
+    # keeping the whole API response in memory. Set it on Model to use lazy hydration
+    # for every model, or on a subclass (e.g. `Linode.lazy_hydration = True`).
+    lazy_hydration = False
+
+    # The API method that lists this model's objects, and for objects that belong to
+    # another one (like a Disk to a Linode), a `(local_name, api_param)` pair giving
+    # the DirectAttr that holds the parent's ID and the list method's parameter for it.
+    # `list_params` are extra parameters to pass to the list method, and
+    # `list_id_param` is the list method's parameter for fetching a single object by
+    # its ID, if it has one. (The `avail_*` catalogs are small and cached, so their
+    # models don't set it.)
+    list_method = None
+    list_parent = None
+    list_params = {}
+    list_id_param = None
+
+    def __getattr__(self, name):
+        # Only called when normal lookup fails, i.e. for DirectAttrs that haven't been
+        # converted yet on lazily-hydrated instances.
+        attr = type(self)._direct_attrs_by_name.get(name)
+        if attr is None:
+            raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
+        try:
+            api_dict = self._api_dict
+        except AttributeError:
+            raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
+        if api_dict is None:
+            api_dict = self._fetch_api_dict()
+            object.__setattr__(self, "_api_dict", api_dict)
+        if api_dict.has_key(attr.api_name):
+            api_value = api_dict[attr.api_name]
+        elif attr.may_be_absent:
+            api_value = attr.default
+        else:
+            raise KeyError("API did not return required '%s' value for '%s' object" %
+                           (attr.api_name, type(self).__name__))
+        value = attr.local_type(api_value)
+        object.__setattr__(self, name, value)
+        return value
+
+    def __setattr__(self, name, value):
+        # Keeps track of the savable DirectAttrs whose value changes, so that `save` can
+        # send just those.
+        if name in type(self)._tracked_attr_names:
+            changed = getattr(self, "_changed", None)
+            if changed is None or name not in changed:
+                try:
+                    # A handle's unset attributes would have to be fetched to compare
+                    # them, so they count as changed.
+                    if getattr(self, "_api_dict", False) is None: current = object.__getattribute__(self, name)
+                    else: current = getattr(self, name)
+                    unchanged = current == value
+                except AttributeError:
+                    unchanged = False
+                if not unchanged:
+                    if changed is None:
+                        changed = set()
+                        object.__setattr__(self, "_changed", changed)
+                    changed.add(name)
+        object.__setattr__(self, name, value)
+        derived = type(self)._derived_related.get(name)
+        if derived: self.forget_related(*derived)
+
+    @property
+    def is_dirty(self):
+        """Whether any savable attribute was changed since the object was fetched or
+           saved."""
+        return bool(getattr(self, "_changed", None))
+
+    @property
+    def changed_fields(self):
+        """The names of the savable attributes that were changed since the object was
+           fetched or saved, in the order of `direct_attrs`."""
+        changed = getattr(self, "_changed", None) or ()
+        return [attr.local_name for attr in self.direct_attrs if attr.local_name in changed]
+
+    def _mark_clean(self):
+        object.__setattr__(self, "_changed", None)
+
+    def _mark_saved_when_done(self, rval):
+        """Marks the attributes that `save` just sent as unchanged once the update call
+           that returned `rval` has succeeded.
+
+           Inside a Batch, `rval` is a BatchedCall, and that only happens when the
+           batch is flushed; if the call fails or the batch is discarded, the
+           attributes stay changed so that a later `save` sends them again. Attributes
+           changed again in the meantime stay changed too."""
+        sent = [(name, getattr(self, name)) for name in getattr(self, "_changed", None) or ()]
+        def mark_saved():
+            changed = getattr(self, "_changed", None)
+            if changed is None: return
+            for name, value in sent:
+                if getattr(self, name) == value: changed.discard(name)
+        if isinstance(rval, BatchedCall):
+            rval.add_done_callback(lambda call: call.error is None and mark_saved())
+        else:
+            mark_saved()
+
+    def _copy_from(self, other, keep_changes=False):
+        """Replaces the object's DirectAttr values with those of `other`, another
+           instance of the same model, and marks it as unchanged.
+
+           `keep_changes` (optional): If True, leave the attributes that were changed
+               but not saved yet alone, and keep them marked as changed."""
+        changed = getattr(self, "_changed", None) or ()
+        for attr in self.direct_attrs:
+            if keep_changes and attr.local_name in changed: continue
+            object.__setattr__(self, attr.local_name, getattr(other, attr.local_name))
+        if hasattr(self, "_api_dict"): del self._api_dict
+        if not keep_changes: self._mark_clean()
+        for names in type(self)._derived_related.values(): self.forget_related(*names)
+
+    def _refresh_with(self, fetch):
+        """Replaces the object's DirectAttr values with those of the instance returned
+           by `fetch()`, discarding unsaved changes. It's what `refresh` does."""
+        changed = getattr(self, "_changed", None)
+        # Inside a Session, `fetch()` updates this very object in place, and it mustn't
+        # keep the unsaved changes then either.
+        self._mark_clean()
+        try:
+            new_inst = fetch()
+        except:
+            object.__setattr__(self, "_changed", changed)
+            raise
+        if new_inst is not self: self._copy_from(new_inst)
+        self.forget_related()
+
+    def __getstate__(self):
+        state = dict(getattr(self, "__dict__", {}))
+        # A handle that hasn't been fetched yet is pickled as a handle, with just the
+        # attributes it has, rather than fetched.
+        is_handle = getattr(self, "_api_dict", False) is None
+        if is_handle: state["_api_dict"] = None
+        for klass in type(self).__mro__:
+            for name in getattr(klass, "__slots__", ()):
+                if name in ("__dict__", "__weakref__", "_api_dict", "_related_cache"): continue
+                try:
+                    if is_handle: state[name] = object.__getattribute__(self, name)
+                    else: state[name] = getattr(self, name)
+                except AttributeError:
+                    pass
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
+
     @classmethod
     def from_api_dict(cls, api_dict):
-        """Factory method that instantiates Model subclasses from API-returned dicts."""
+        """Factory method that instantiates Model subclasses from API-returned dicts.
+
+           See `lazy_hydration` for a faster way when only a few attributes are used.
+           Inside a Session, the session's instance is returned if it has one."""
+        session = api_handler._current_session()
+        if session is not None: return session.load(cls, api_dict)
+        if cls.lazy_hydration: return cls._hydrate_lazy(api_dict)
+        return cls._hydrate(api_dict)
+
+    @classmethod
+    def handle(cls, api_id, parent=None):
+        """Returns an object standing for the API object with the given ID, without
+           calling the API. The object is fetched, with a call for just that object,
+           the first time one of its other attributes is read.
+
+           `parent`: For objects that belong to another one (e.g. a Job to a Linode),
+               the parent object or its ID.
+
+           Inside a Session, the session's instance is returned if it has one."""
+        inst = cls.from_session(api_id)
+        if inst is not None: return inst
+        if cls.list_method is None:
+            raise TypeError("%s objects can't be fetched by ID" % (cls.__name__,))
+        inst = object.__new__(cls)
+        object.__setattr__(inst, "api_id", api_id)
+        if cls.list_parent is not None:
+            if parent is None: raise ValueError("A parent is required for %s handles" % (cls.__name__,))
+            if type(parent) is not int: parent = parent.api_id
+            object.__setattr__(inst, cls.list_parent[0], parent)
+        object.__setattr__(inst, "_api_dict", None)
+        session = api_handler._current_session()
+        if session is not None: session.add(inst)
+        return inst
+
+    def _fetch_api_dict(self):
+        """Fetches the API dict of a handle (see `handle`)."""
+        cls = type(self)
+        kwargs = dict(cls.list_params)
+        if cls.list_parent is not None: kwargs[cls.list_parent[1]] = getattr(self, cls.list_parent[0])
+        if cls.list_id_param is not None: kwargs[cls.list_id_param] = self.api_id
+        id_attr = cls._direct_attrs_by_name["api_id"]
+        for api_dict in _list_or_nothing(getattr(api_handler, cls.list_method), kwargs):
+            if id_attr.local_type(api_dict[id_attr.api_name]) == self.api_id: return api_dict
+        raise RuntimeError("No %s found with api_id %s" % (cls.__name__, self.api_id))
+
+    @classmethod
+    def from_session(cls, api_id):
+        """Returns the current Session's instance with the given `api_id`, or None if
+           there's no such instance or no Session (see `Handler.session`)."""
+        session = api_handler._current_session()
+        if session is None: return None
+        return session.get(cls, api_id)
+
+    @classmethod
+    def _search(cls, criteria, **list_kwargs):
+        """Calls `list_method` with the given arguments and returns the instances that
+           match the given `search` criteria.
+
+           If the criteria include an `api_id` and the list method can filter on it
+           (see `list_id_param`), it's passed on to the API so that only that object is
+           fetched. The rest of the criteria are tested locally. If there's no such
+           object, the result is empty, but a missing parent raises the API's error
+           either way.
+
+           A `prefetch` criterion is a list of relationships to `prefetch` for the
+           results."""
+        prefetch = criteria.pop("prefetch", None)
+        list_call = getattr(api_handler, cls.list_method)
+        api_id = criteria.get("api_id", criteria.get("api_id__exact"))
+        if cls.list_id_param is not None and isinstance(api_id, (int, long)):
+            try:
+                api_dicts = list_call(**dict(list_kwargs, **{cls.list_id_param: api_id}))
+            except linode_api.ApiError, e:
+                if not _is_not_found(e): raise
+                # The API answers "Object not found" when the object doesn't exist,
+                # but also when its parent doesn't, which should raise just as it
+                # does without an `api_id`. Listing the parent's objects tells which.
+                if cls.list_parent is not None: list_call(**list_kwargs)
+                api_dicts = []
+            result = cls._select(api_dicts, criteria)
+        else:
+            result = cls._select(list_call(**list_kwargs), criteria)
+        if prefetch: cls.prefetch(result, prefetch)
+        return result
+
+    @classmethod
+    def prefetch(cls, instances, names):
+        """Fetches the given relationships (e.g. `["disks", "ipaddresses"]` for
+           Linodes) for all the instances at once, and has the instances remember them
+           (see `Related`), so that reading them later doesn't call the API.
+
+           Each relationship takes either a single API call or one call per instance,
+           made in parallel on `api_handler`'s worker pool. `search(prefetch=[...])`
+           does the same for its results."""
+        instances = list(instances)
+        if not instances: return
+        for name in names:
+            fetch = getattr(cls, "_prefetch_" + name, None)
+            if fetch is None:
+                raise ValueError("%s objects can't prefetch '%s'" % (cls.__name__, name))
+            now = time.time()
+            for inst, value in zip(instances, fetch(instances)):
+                inst._remember_related(name, value, now)
+
+    def _related(self, name, fetch, max_age=None, cached=True):
+        """Returns the value of Related property `name`: the remembered one if there's
+           one that's recent enough, or else the result of `fetch(self)`, which is then
+           remembered if `cached` is True."""
+        if not self.cache_related: return fetch(self)
+        cache = getattr(self, "_related_cache", None)
+        if cache is not None and cache.has_key(name):
+            value, fetched_at = cache[name]
+            if max_age is None or time.time() - fetched_at <= max_age: return value
+        value = fetch(self)
+        if cached: self._remember_related(name, value, time.time())
+        return value
+
+    def _remembered_related(self, name):
+        """Returns the remembered value of Related property `name`, or None, without
+           looking it up."""
+        cache = getattr(self, "_related_cache", None)
+        if cache is None or not cache.has_key(name): return None
+        return cache[name][0]
+
+    @classmethod
+    def _forget_related_of(cls, parent, name):
+        """Makes a parent object forget Related property `name` (e.g. a Linode its
+           "disks") after one of its children was created or destroyed.
+
+           `parent`: The parent object, or its ID. The current Session's instance of
+               this model with the same ID forgets it too."""
+        if isinstance(parent, Model):
+            parent.forget_related(name)
+            parent = parent.api_id
+        in_session = cls.from_session(parent)
+        if in_session is not None: in_session.forget_related(name)
+
+    def _remember_related(self, name, value, fetched_at):
+        cache = getattr(self, "_related_cache", None)
+        if cache is None:
+            cache = {}
+            object.__setattr__(self, "_related_cache", cache)
+        cache[name] = (value, fetched_at)
+
+    def forget_related(self, *names):
+        """Forgets the objects that the given Related properties (e.g. "disks") looked
+           up, or those of all of them if no names are given, so that they're looked up
+           again the next time they're read. `refresh` does this too."""
+        cache = getattr(self, "_related_cache", None)
+        if cache is None: return
+        if not names: cache.clear()
+        for name in names: cache.pop(name, None)
+
+    @classmethod
+    def _select(cls, api_dicts, criteria):
+        """Returns instances for those of the API-returned dicts that match the given
+           `search` criteria (see `chube.query`), in one pass.
+
+           Criteria on DirectAttrs are tested on the dicts themselves, so instances are
+           only built for the dicts that pass them."""
+        if not criteria: return [cls.from_api_dict(d) for d in api_dicts]
+        match_row, match_instance = compile_query(cls, criteria)
+        from_api_dict = cls.from_api_dict
+        result = []
+        for api_dict in api_dicts:
+            if match_row is not None and not match_row(api_dict): continue
+            inst = from_api_dict(api_dict)
+            if match_instance is None or match_instance(inst): result.append(inst)
+        return result
+
+    @classmethod
+    def refresh_many(cls, instances):
+        """Refreshes many objects of this model at once, with one list call per parent
+           object (or a single one for models like Linode that have no parent) instead
+           of one `refresh` call per object. The list calls are made in parallel on
+           `api_handler`'s worker pool. Like `refresh`, it discards unsaved changes.
+
+           Returns the list of the objects that no longer exist (including those whose
+           parent no longer exists), which are left as they were."""
+        if cls.list_method is None:
+            raise TypeError("%s objects can't be refreshed in bulk" % (cls.__name__,))
+        instances = list(instances)
+        parent_ids, seen = [], set()
+        for inst in instances:
+            parent_id = getattr(inst, cls.list_parent[0]) if cls.list_parent else None
+            if parent_id in seen: continue
+            seen.add(parent_id)
+            parent_ids.append(parent_id)
+
+        kwargs_list = []
+        for parent_id in parent_ids:
+            kwargs = dict(cls.list_params)
+            if cls.list_parent: kwargs[cls.list_parent[1]] = parent_id
+            kwargs_list.append(kwargs)
+        id_attr = cls._direct_attrs_by_name["api_id"]
+        found = {}
+        list_call = getattr(api_handler, cls.list_method)
+        responses = api_handler.map(lambda kwargs: _list_or_nothing(list_call, kwargs), kwargs_list)
+        for parent_id, api_dicts in zip(parent_ids, responses):
+            for api_dict in api_dicts:
+                found[(parent_id, id_attr.local_type(api_dict[id_attr.api_name]))] = api_dict
+
+        missing = []
+        for inst in instances:
+            parent_id = getattr(inst, cls.list_parent[0]) if cls.list_parent else None
+            api_dict = found.get((parent_id, inst.api_id))
+            if api_dict is None:
+                missing.append(inst)
+                continue
+            inst._copy_from(cls._hydrate(api_dict))
+            inst.forget_related()
+        return missing
+
+    @classmethod
+    def _hydrate_generic(cls, api_dict):
+        """Does what `from_api_dict` does, one DirectAttr at a time. It's slow, but it
+           raises the right error when a value is missing."""
         inst = cls()
 
         for attr in cls.direct_attrs:
@@ -60,17 +614,332 @@ class Model(object):
             else:
                 raise KeyError("API did not return required '%s' value for '%s' object" %
                                (attr.api_name, cls.__name__))
-            setattr(inst, attr.local_name, attr.local_type(api_value))
+            object.__setattr__(inst, attr.local_name, attr.local_type(api_value))
 
         return inst
 
 
-    def api_update_params(self):
-        """Returns a dict that can be used as the arguments to a `*_update` API call."""
+    def api_update_params(self, changed_only=False):
+        """Returns a dict that can be used as the arguments to a `*_update` API call.
+
+           `changed_only` (optional): If True, leave out the attributes that haven't
+               changed since the object was fetched or saved (but not the key ones)."""
         api_params = {}
+        changed = getattr(self, "_changed", None) or ()
         for attr in self.direct_attrs:
+            if changed_only and not attr.is_key and attr.local_name not in changed: continue
             attr_value = getattr(self, attr.local_name)
             if not attr.is_savable(attr_value): continue
             api_params[attr.update_as] = attr.api_type(attr_value)
 
         return api_params
+
+    # Non-blocking variants of the standard model methods. Each one runs its blocking
+    # counterpart on `async_api_handler`'s worker pool and returns a
+    # `concurrent.futures.Future` for its result.
+    @classmethod
+    def search_async(cls, **kwargs):
+        """Like `search`, but returns a Future for the list of results."""
+        return async_api_handler.submit(cls.search, **kwargs)
+
+    @classmethod
+    def find_async(cls, **kwargs):
+        """Like `find`, but returns a Future for the result."""
+        return async_api_handler.submit(cls.find, **kwargs)
+
+    def save_async(self):
+        """Like `save`, but returns a Future that's done once the save is."""
+        return async_api_handler.submit(self.save)
+
+    def refresh_async(self):
+        """Like `refresh`, but returns a Future that's done once the refresh is."""
+        return async_api_handler.submit(self.refresh)
+
+    def destroy_async(self):
+        """Like `destroy`, but returns a Future that's done once the object is deleted."""
+        return async_api_handler.submit(self.destroy)
+
+
+class SaveTest:
+    """Suite of offline tests to run when `chuber test Save` is called. They run
+       against a FakeAccount, so they don't need an API key."""
+    @classmethod
+    def run(cls):
+        from .fake_api import FakeAccount
+        from .linode_obj import Linode
+        from .dns import Domain
+
+        account = FakeAccount(job_duration=0)
+        account.seed(linodes=3, domains=1, records_per_domain=1)
+        uninstall = account.install(api_handler)
+        try:
+            linode_a, linode_b, linode_c = Linode.search()
+            record = Domain.search()[0].search_records()[0]
+
+            print "~~~ Saving objects that haven't changed"
+            print
+            account.log = []
+            linode_a.save()
+            linode_a.label = linode_a.label
+            linode_a.save()
+            record.save()
+            assert account.log == []
+
+            print "~~~ Saving just the changed attributes"
+            print
+            linode_a.label = u"chube-test-a"
+            assert linode_a.is_dirty and linode_a.changed_fields == ["label"]
+            linode_a.save()
+            assert account.log == [("linode_update", {"linodeid": linode_a.api_id, "label": u"chube-test-a"})]
+            assert not linode_a.is_dirty
+            account.log = []
+            record.ttl_sec = 3600
+            record.save()
+            assert account.log == [("domain_resource_update", {"resourceid": record.api_id,
+                                                               "domainid": record.domain_id,
+                                                               "ttl_sec": 3600})]
+
+            print "~~~ Saving in a Batch"
+            print
+            linode_a.label = u"chube-test-a2"
+            try:
+                with api_handler.batch():
+                    linode_a.save()
+                    assert linode_a.is_dirty
+                    raise KeyError("discard the batch")
+            except KeyError:
+                pass
+            assert linode_a.is_dirty
+            assert Linode.find(api_id=linode_a.api_id).label == u"chube-test-a"
+
+            linode_b.label = u"chube-test-b"
+            linode_c.label = u"chube-test-c"
+            api_handler.linode_delete(linodeid=linode_c.api_id, skipchecks=True)
+            with api_handler.batch(raise_errors=False) as batch:
+                linode_a.save()
+                linode_b.save()
+                linode_c.save()
+            assert not linode_a.is_dirty and not linode_b.is_dirty
+            assert linode_c.is_dirty and batch.calls[2].error is not None
+            assert Linode.find(api_id=linode_a.api_id).label == u"chube-test-a2"
+        finally:
+            uninstall()
+
+        print "~~~ Tests passed!"
+
+
+
+class RelatedTest:
+    """Suite of offline tests to run when `chuber test Related` is called. They run
+       against a FakeAccount, so they don't need an API key."""
+    @classmethod
+    def run(cls):
+        from .fake_api import FakeAccount
+        from .linode_obj import Linode, Disk, Config
+
+        account = FakeAccount(job_duration=0)
+        account.seed(linodes=2, disks_per_linode=2, configs_per_linode=1)
+        uninstall = account.install(api_handler)
+        try:
+            linode_obj = Linode.search()[0]
+            def count_calls(func):
+                account.log = []
+                func()
+                count, account.log = len(account.log), None
+                return count
+
+            print "~~~ Remembering a disk's Linode"
+            print
+            disk = linode_obj.disks[0]
+            assert count_calls(lambda: disk.linode) == 1
+            assert count_calls(lambda: disk.linode) == 0
+            disk.forget_related("linode")
+            assert count_calls(lambda: disk.linode) == 1
+            disk.refresh()
+            assert count_calls(lambda: disk.linode) == 1
+            disk.cache_related = False
+            assert count_calls(lambda: disk.linode) == 1
+            assert count_calls(lambda: disk.linode) == 1
+            disk.cache_related = True
+            Disk.linode.max_age = 0
+            try:
+                disk.linode
+                time.sleep(0.01)
+                assert count_calls(lambda: disk.linode) == 1
+            finally:
+                Disk.linode.max_age = None
+
+            print "~~~ Looking up lists of children on every read"
+            print
+            assert count_calls(lambda: linode_obj.disks) == 1
+            api_handler.linode_disk_create(linodeid=linode_obj.api_id, label=u"new", type="ext3", size=100)
+            assert len(linode_obj.disks) == 3
+
+            print "~~~ Forgetting prefetched lists when children come and go"
+            print
+            Linode.prefetch([linode_obj], ["disks"])
+            assert count_calls(lambda: linode_obj.disks) == 0
+            new_disk = Disk.create(linode=linode_obj, label=u"new2", fstype="ext3", size=100)
+            assert len(linode_obj.disks) == 4
+            parent = new_disk.linode
+            Linode.prefetch([parent], ["disks"])
+            new_disk.destroy()
+            assert len(parent.disks) == 3
+            with api_handler.session():
+                node = Linode.find(api_id=linode_obj.api_id)
+                Linode.prefetch([node], ["disks"])
+                Disk.find(linode=node.api_id, api_id=node.disks[0].api_id).duplicate()
+                assert len(node.disks) == 4
+
+            print "~~~ Prefetching into the current Session"
+            print
+            with api_handler.session():
+                node = [n for n in Linode.search(prefetch=["disks"]) if n.api_id == linode_obj.api_id][0]
+                assert Disk.find(linode=node.api_id, api_id=node.disks[0].api_id) is node.disks[0]
+                assert node.disks[0].linode is node
+
+            print "~~~ Remembering lists of children when asked to"
+            print
+            Linode.disks.cached = True
+            try:
+                linode_obj.disks
+                assert count_calls(lambda: linode_obj.disks) == 0
+                linode_obj.create_disk(label=u"new3", fstype="ext3", size=100)
+                assert len(linode_obj.disks) == 5
+            finally:
+                Linode.disks.cached = False
+
+            print "~~~ Forgetting values derived from attributes that change"
+            print
+            config = linode_obj.configs[0]
+            disk_ids = [disk.api_id for disk in linode_obj.disks]
+            config.disk_list = u"%d,%d,,,,,,," % (disk_ids[0], disk_ids[1])
+            Config.resolve_disks([config])
+            assert count_calls(lambda: config.disks) == 0
+            config.disk_list = u"%d,,,,,,,," % (disk_ids[2],)
+            assert [disk and disk.api_id for disk in config.disks] == [disk_ids[2]] + [None] * 8
+            config.save()
+            with api_handler.session():
+                config = Config.find(linode=linode_obj.api_id, api_id=config.api_id)
+                Config.resolve_disks([config])
+                api_handler.linode_config_update(linodeid=linode_obj.api_id, configid=config.api_id,
+                                                 disklist=u"%d,,,,,,,," % (disk_ids[0],))
+                Config.search(linode=linode_obj)
+                assert config.disks[0].api_id == disk_ids[0]
+        finally:
+            uninstall()
+
+        print "~~~ Tests passed!"
+
+
+class SearchTest:
+    """Suite of offline tests to run when `chuber test Search` is called. They run
+       against a FakeAccount, so they don't need an API key."""
+    @classmethod
+    def run(cls):
+        from .fake_api import FakeAccount
+        from .linode_obj import Linode, Disk
+
+        account = FakeAccount(job_duration=0)
+        account.seed(linodes=3, disks_per_linode=2)
+        uninstall = account.install(api_handler)
+        try:
+            linodes = Linode.search()
+            linode_obj, other = linodes[0], linodes[1]
+            disks = linode_obj.disks
+
+            print "~~~ Passing `api_id` on to the API"
+            print
+            account.log = []
+            found = Linode.search(api_id=other.api_id)
+            assert [l.api_id for l in found] == [other.api_id]
+            assert account.log == [("linode_list", {"linodeid": other.api_id})], account.log
+            account.log = []
+            found = Disk.search(linode=linode_obj, api_id__exact=disks[1].api_id)
+            assert [d.api_id for d in found] == [disks[1].api_id]
+            assert account.log == [("linode_disk_list", {"linodeid": linode_obj.api_id,
+                                                         "diskid": disks[1].api_id})], account.log
+            account.log = None
+            assert Disk.search(linode=linode_obj, api_id=disks[1].api_id, label=u"nope") == []
+            assert len(Linode.search(api_id__in=[linode_obj.api_id, other.api_id])) == 2
+
+            print "~~~ Searching for objects that don't exist"
+            print
+            assert Linode.search(api_id=max([l.api_id for l in linodes]) + 1000) == []
+            assert Disk.search(linode=linode_obj, api_id=other.disks[0].api_id) == []
+            disk = disks[0]
+            disk.destroy()
+            assert Disk.search(linode=linode_obj, api_id=disk.api_id) == []
+
+            print "~~~ Searching under a parent that doesn't exist"
+            print
+            doomed = linodes[2]
+            doomed_disk = doomed.disks[0]
+            api_handler.linode_delete(linodeid=doomed.api_id, skipchecks=True)
+            for criteria in ({}, {"api_id": doomed_disk.api_id}):
+                try:
+                    Disk.search(linode=doomed, **criteria)
+                except linode_api.ApiError, e:
+                    assert _is_not_found(e)
+                else:
+                    raise AssertionError("Searching a deleted Linode's disks (%r) didn't raise" % (criteria,))
+        finally:
+            uninstall()
+
+        print "~~~ Tests passed!"
+
+
+class RefreshTest:
+    """Suite of offline tests to run when `chuber test Refresh` is called. They run
+       against a FakeAccount, so they don't need an API key."""
+    @classmethod
+    def run(cls):
+        from .fake_api import FakeAccount
+        from .linode_obj import Linode, Disk
+        from .plan import Plan
+
+        account = FakeAccount(job_duration=0)
+        account.seed(linodes=3, disks_per_linode=2)
+        uninstall = account.install(api_handler)
+        try:
+            linodes = Linode.search()
+            disks = []
+            for linode_obj in linodes: disks.extend(linode_obj.disks)
+
+            print "~~~ Refreshing many objects with one call per parent"
+            print
+            api_handler.linode_disk_update(linodeid=disks[0].linode_id, diskid=disks[0].api_id,
+                                           label=u"relabeled")
+            disks[1].label = u"unsaved"
+            account.log = []
+            assert Disk.refresh_many(disks) == []
+            assert sorted([kwargs["linodeid"] for method, kwargs in account.log]) == \
+                sorted([linode_obj.api_id for linode_obj in linodes])
+            account.log = None
+            assert disks[0].label == u"relabeled"
+            assert disks[1].label != u"unsaved" and not disks[1].is_dirty
+
+            print "~~~ Returning the objects that no longer exist"
+            print
+            api_handler.linode_disk_delete(linodeid=disks[2].linode_id, diskid=disks[2].api_id)
+            api_handler.linode_delete(linodeid=linodes[2].api_id, skipchecks=True)
+            missing = Disk.refresh_many(disks)
+            expected = [disks[2]] + [disk for disk in disks if disk.linode_id == linodes[2].api_id]
+            assert sorted([disk.api_id for disk in missing]) == sorted([disk.api_id for disk in expected])
+            missing = Linode.refresh_many(linodes)
+            assert [linode_obj.api_id for linode_obj in missing] == [linodes[2].api_id]
+
+            print "~~~ Refusing models that can't be refreshed in bulk"
+            print
+            class Unlisted(Model):
+                direct_attrs = Plan.direct_attrs
+            try:
+                Unlisted.refresh_many([])
+            except TypeError:
+                pass
+            else:
+                raise AssertionError("refresh_many worked on a model without a list method")
+        finally:
+            uninstall()
+
+        print "~~~ Tests passed!"
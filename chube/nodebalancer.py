@@ -8,7 +8,7 @@ class Nodebalancer(Model):
     direct_attrs = [
         # IDs
         DirectAttr("api_id", u"NODEBALANCERID", int, int,
-                   update_as="nodebalancerid"),
+                   update_as="nodebalancerid", is_key=True),
 
         # Properties
         DirectAttr("label", u"LABEL", unicode, unicode,
@@ -22,6 +22,9 @@ class Nodebalancer(Model):
                    may_be_absent=True, default=u"")
     ]
 
+    list_method = "nodebalancer_list"
+    list_id_param = "nodebalancerid"
+
     @classmethod
     @keywords_only
     def search(cls, **kwargs):
@@ -29,15 +32,11 @@ class Nodebalancer(Model):
         
            The special paramater `label_begins` allows you to case-insensitively
            match the beginning of the `label` string. For example,
-           `Nodebalancer.search(label_begins='fremont-')`."""
-        a = [cls.from_api_dict(d) for d in api_handler.nodebalancer_list()]
-        if kwargs.has_key("label_begins"):
-            a = [nodebalancer for nodebalancer in a if
-                 nodebalancer.label.lower().startswith(kwargs["label_begins"].lower())]
-            del kwargs["label_begins"]
-        for k, v in kwargs.items():
-            a = [nodebalancer for nodebalancer in a if getattr(nodebalancer, k) == v]
-        return a
+           `Nodebalancer.search(label_begins='fremont-')`.
+
+           `prefetch` (optional): `["configs"]` to fetch the configs of all the results
+               at once."""
+        return cls._search(kwargs)
 
     @classmethod
     @keywords_only
@@ -73,20 +72,23 @@ class Nodebalancer(Model):
         return NodebalancerConfig.search(nodebalancer=self.api_id)
     def _configs_setter(self, val):
         raise NotImplementedError("Cannot set `configs` directly; use `add_config` instead.")
-    configs = property(_configs_getter, _configs_setter)
+    configs = Related(_configs_getter, _configs_setter, cached=False)
+
+    @classmethod
+    def _prefetch_configs(cls, nodebalancers):
+        return api_handler.map(lambda nodebalancer: NodebalancerConfig.search(nodebalancer=nodebalancer.api_id),
+                               nodebalancers)
 
     @keywords_only
     def add_config(self, **kwargs):
         """Creates a new NodebalancerConfig for the Nodebalancer and returns it."""
+        self.forget_related("configs")
         return NodebalancerConfig.create(nodebalancer=self.api_id)
 
     @keywords_only
     def search_configs(self, **kwargs):
         """Returns the list of NodebalancerConfig instances that match the given criteria."""
-        a = [NodebalancerConfig.from_api_dict(api_dict) for api_dict in api_handler.nodebalancer_config_list(nodebalancerid=self.api_id)]
-        for k, v in kwargs.items():
-            a = [config for config in a if getattr(config, k) == v]
-        return a
+        return NodebalancerConfig._search(kwargs, nodebalancerid=self.api_id)
 
     @keywords_only
     def find_config(self, **kwargs):
@@ -99,16 +101,14 @@ class Nodebalancer(Model):
         return a[0]
 
     def save(self):
-        """Saves the Nodebalancer object to the API."""
-        api_params = self.api_update_params()
-        api_handler.nodebalancer_update(**api_params)
+        """Saves the changes made to the Nodebalancer object to the API, if there are any."""
+        if not self.is_dirty: return
+        api_params = self.api_update_params(changed_only=True)
+        self._mark_saved_when_done(api_handler.nodebalancer_update(**api_params))
 
     def refresh(self):
         """Refreshes the Nodebalancer object with a new API call."""
-        new_inst = Nodebalancer.find(api_id=self.api_id)
-        for attr in self.direct_attrs:
-            setattr(self, attr.local_name, getattr(new_inst, attr.local_name))
-        del new_inst
+        self._refresh_with(lambda: Nodebalancer.find(api_id=self.api_id))
 
     def destroy(self):
         """Deletes the Nodebalancer."""
@@ -122,7 +122,7 @@ class NodebalancerConfig(Model):
     direct_attrs = [
         # IDs
         DirectAttr("api_id", u"CONFIGID", int, int,
-                   update_as="configid"),
+                   update_as="configid", is_key=True),
         DirectAttr("nodebalancer_id", u"NODEBALANCERID", int, int),
 
         # Properties
@@ -148,12 +148,16 @@ class NodebalancerConfig(Model):
                    update_as="stickiness")
     ]
 
+    list_method = "nodebalancer_config_list"
+    list_id_param = "configid"
+    list_parent = ("nodebalancer_id", "nodebalancerid")
+
     # The `nodebalancer` attribute is done with a deferred lookup.
     def _nodebalancer_getter(self):
-        return Nodebalancer.find(api_id=self.nodebalancer_id)
+        return Nodebalancer.from_session(self.nodebalancer_id) or Nodebalancer.find(api_id=self.nodebalancer_id)
     def _nodebalancer_setter(self, val):
         raise NotImplementedError("Cannot assign NodebalancerConfig to a different Nodebalancer")
-    nodebalancer = property(_nodebalancer_getter, _nodebalancer_setter)
+    nodebalancer = Related(_nodebalancer_getter, _nodebalancer_setter)
 
     @classmethod
     @RequiresParams("nodebalancer")
@@ -166,6 +170,7 @@ class NodebalancerConfig(Model):
         if type(nodebalancer) is not int: nodebalancer = nodebalancer.api_id
         rval = api_handler.nodebalancer_config_create(nodebalancerid=nodebalancer)
         new_config_id = rval[u"ConfigID"]
+        Nodebalancer._forget_related_of(kwargs["nodebalancer"], "configs")
         return cls.find(api_id=new_config_id, nodebalancer=nodebalancer)
 
     @classmethod
@@ -175,15 +180,14 @@ class NodebalancerConfig(Model):
         """Returns the list of NodebalancerConfig instances that match the given criteria.
         
            At least `nodebalancer` is required. It can be a Nodebalancer object or a numeric
-           Nodebalancer ID."""
+           Nodebalancer ID.
+
+           `prefetch` (optional): `["nodes"]` to fetch the nodes of all the results at
+               once."""
         nodebalancer = kwargs["nodebalancer"]
         if type(nodebalancer) is not int: nodebalancer = nodebalancer.api_id
-        a = [cls.from_api_dict(d) for d in api_handler.nodebalancer_config_list(nodebalancerid=nodebalancer)]
         del kwargs["nodebalancer"]
-
-        for k, v in kwargs.items():
-            a = [conf for conf in a if getattr(conf, k) == v]
-        return a
+        return cls._search(kwargs, nodebalancerid=nodebalancer)
 
     @classmethod
     @RequiresParams("api_id", "nodebalancer")
@@ -204,7 +208,11 @@ class NodebalancerConfig(Model):
         return NodebalancerNode.search(config=self.api_id)
     def _nodes_setter(self, val):
         raise NotImplementedError("Cannot set `nodes` directly; use `add_node` instead.")
-    nodes = property(_nodes_getter, _nodes_setter)
+    nodes = Related(_nodes_getter, _nodes_setter, cached=False)
+
+    @classmethod
+    def _prefetch_nodes(cls, configs):
+        return api_handler.map(lambda config: NodebalancerNode.search(config=config.api_id), configs)
 
     @RequiresParams("label", "address")
     @keywords_only
@@ -212,15 +220,13 @@ class NodebalancerConfig(Model):
         """Creates a new Node for the Nodebalancer and returns it.
 
            See NodebalancerNode.create.__doc__ for param info."""
+        self.forget_related("nodes")
         return NodebalancerNode.create(config=self.api_id, label=kwargs["label"], address=kwargs["address"])
 
     @keywords_only
     def search_nodes(self, **kwargs):
         """Returns the list of NodebalancerNode instances that match the given criteria."""
-        a = [NodebalancerNode.from_api_dict(api_dict) for api_dict in api_handler.nodebalancer_node_list(configid=self.api_id)]
-        for k, v in kwargs.items():
-            a = [config for config in a if getattr(config, k) == v]
-        return a
+        return NodebalancerNode._search(kwargs, configid=self.api_id)
 
     @keywords_only
     def find_node(self, **kwargs):
@@ -233,20 +239,19 @@ class NodebalancerConfig(Model):
         return a[0]
 
     def save(self):
-        """Saves the NodebalancerConfig object to the API."""
-        api_params = self.api_update_params()
-        api_handler.nodebalancer_config_update(**api_params)
+        """Saves the changes made to the NodebalancerConfig object to the API, if there are any."""
+        if not self.is_dirty: return
+        api_params = self.api_update_params(changed_only=True)
+        self._mark_saved_when_done(api_handler.nodebalancer_config_update(**api_params))
 
     def refresh(self):
         """Refreshes the NodebalancerConfig object with a new API call."""
-        new_inst = NodebalancerConfig.find(api_id=self.api_id, nodebalancer=self.nodebalancer_id)
-        for attr in self.direct_attrs:
-            setattr(self, attr.local_name, getattr(new_inst, attr.local_name))
-        del new_inst
+        self._refresh_with(lambda: NodebalancerConfig.find(api_id=self.api_id, nodebalancer=self.nodebalancer_id))
 
     def destroy(self):
         """Deletes the NodebalancerConfig object."""
         api_handler.nodebalancer_config_delete(configid=self.api_id)
+        Nodebalancer._forget_related_of(self._remembered_related("nodebalancer") or self.nodebalancer_id, "configs")
 
     def __repr__(self):
         return "<NodebalancerConfig api_id=%d, protocol='%s', port='%s'>" % (self.api_id, self.protocol, self.port)
@@ -256,7 +261,7 @@ class NodebalancerNode(Model):
     direct_attrs = [
         # IDs
         DirectAttr("api_id", u"NODEID", int, int,
-                   update_as="nodeid"),
+                   update_as="nodeid", is_key=True),
         DirectAttr("config_id", u"CONFIGID", int, int),
         DirectAttr("nodebalancer_id", u"NODEBALANCERID", int, int),
 
@@ -272,19 +277,23 @@ class NodebalancerNode(Model):
         DirectAttr("status", u"STATUS", unicode, unicode)
     ]
 
+    list_method = "nodebalancer_node_list"
+    list_id_param = "nodeid"
+    list_parent = ("config_id", "configid")
+
     # The `config` attribute is done with a deferred lookup.
     def _config_getter(self):
-        return NodebalancerConfig.find(api_id=self.config_id)
+        return NodebalancerConfig.from_session(self.config_id) or NodebalancerConfig.find(api_id=self.config_id)
     def _config_setter(self, val):
         raise NotImplementedError("Cannot assign NodebalancerNode to a different NodebalancerConfig")
-    config = property(_config_getter, _config_setter)
+    config = Related(_config_getter, _config_setter)
 
     # The `nodebalancer` attribute is done with a deferred lookup.
     def _nodebalancer_getter(self):
-        return Nodebalancer.find(api_id=self.nodebalancer_id)
+        return Nodebalancer.from_session(self.nodebalancer_id) or Nodebalancer.find(api_id=self.nodebalancer_id)
     def _nodebalancer_setter(self, val):
         raise NotImplementedError("Cannot assign NodebalancerNode to a different Nodebalancer")
-    nodebalancer = property(_nodebalancer_getter, _nodebalancer_setter)
+    nodebalancer = Related(_nodebalancer_getter, _nodebalancer_setter)
 
     @classmethod
     @RequiresParams("config", "label", "address")
@@ -299,6 +308,7 @@ class NodebalancerNode(Model):
         if type(config) is not int: config = config.api_id
         rval = api_handler.nodebalancer_node_create(configid=config, label=label, address=address)
         new_node_id = rval[u"NodeID"]
+        NodebalancerConfig._forget_related_of(kwargs["config"], "nodes")
         return cls.find(api_id=new_node_id, config=config)
 
     @classmethod
@@ -315,17 +325,8 @@ class NodebalancerNode(Model):
            `NodebalancerNode.search(config=my_conf, label_begins='web-')`."""
         config = kwargs["config"]
         if type(config) is not int: config = config.api_id
-        a = [cls.from_api_dict(d) for d in api_handler.nodebalancer_node_list(configid=config)]
         del kwargs["config"]
-
-        if kwargs.has_key("label_begins"):
-            a = [linode_obj for linode_obj in a if
-                 linode_obj.label.lower().startswith(kwargs["label_begins"].lower())]
-            del kwargs["label_begins"]
-
-        for k, v in kwargs.items():
-            a = [conf for conf in a if getattr(conf, k) == v]
-        return a
+        return cls._search(kwargs, configid=config)
 
     @classmethod
     @RequiresParams("config")
@@ -342,20 +343,19 @@ class NodebalancerNode(Model):
         return a[0]
 
     def save(self):
-        """Saves the NodebalancerNode object to the API."""
-        api_params = self.api_update_params()
-        api_handler.nodebalancer_node_update(**api_params)
+        """Saves the changes made to the NodebalancerNode object to the API, if there are any."""
+        if not self.is_dirty: return
+        api_params = self.api_update_params(changed_only=True)
+        self._mark_saved_when_done(api_handler.nodebalancer_node_update(**api_params))
 
     def refresh(self):
         """Refreshes the NodebalancerNode object with a new API call."""
-        new_inst = NodebalancerNode.find(api_id=self.api_id, config=self.config_id)
-        for attr in self.direct_attrs:
-            setattr(self, attr.local_name, getattr(new_inst, attr.local_name))
-        del new_inst
+        self._refresh_with(lambda: NodebalancerNode.find(api_id=self.api_id, config=self.config_id))
 
     def destroy(self):
         """Deletes the NodebalancerNode object."""
         api_handler.nodebalancer_node_delete(nodeid=self.api_id)
+        NodebalancerConfig._forget_related_of(self._remembered_related("config") or self.config_id, "nodes")
 
     def __repr__(self):
         return "<NodebalancerNode api_id=%d, label='%s'>" % (self.api_id, self.label)
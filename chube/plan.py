@@ -1,6 +1,5 @@
 from decimal import Decimal
 
-from .api import api_handler
 from .model import *
 from .util import keywords_only
 
@@ -14,14 +13,13 @@ class Plan(Model):
         DirectAttr("xfer", u"XFER", int, int),
     ]
 
+    list_method = "avail_linodeplans"
+
     @classmethod
     @keywords_only
     def search(cls, **kwargs):
         """Returns the list of all Plan instances."""
-        a = [cls.from_api_dict(d) for d in api_handler.avail_linodeplans()]
-        for k, v in kwargs.items():
-            a = [plan for plan in a if getattr(plan, k) == v]
-        return a
+        return cls._search(kwargs)
 
     @classmethod
     @keywords_only
@@ -38,10 +36,7 @@ class Plan(Model):
 
     def refresh(self):
         """Refreshes the plan with a new API call."""
-        new_inst = Plan.find(api_id=self.api_id)
-        for attr in self.direct_attrs:
-            setattr(self, attr.local_name, getattr(new_inst, attr.local_name))
-        del new_inst
+        self._refresh_with(lambda: Plan.find(api_id=self.api_id))
 
     def __repr__(self):
         return "<Plan label='%s'>" % self.label
@@ -0,0 +1,209 @@
+"""Module for the criteria that models' `search` methods accept.
+
+   A criterion is a keyword argument named after an attribute, optionally followed by
+   `__` and an operator:
+
+       Linode.search(label__begins="web-", status__in=(1, 2), total_ram__gte=2048)
+
+   `exact` (the default), `ne`, `in`, `gt`, `gte`, `lt` and `lte` compare the
+   attribute's value; `contains`, `begins`, `ends` and `regex` match strings, and
+   `icontains`, `ibegins` and `iends` do so case-insensitively.
+
+   For compatibility, `<attribute>_begins` and `<attribute>_ends` are the same as
+   `<attribute>__ibegins` and `<attribute>__iends`."""
+import re
+import threading
+
+
+# Python expressions for each operator's test, given the attribute's value `v` and the
+# criterion's (prepared) argument `arg`.
+OPERATORS = {
+    "exact": "v == %(arg)s",
+    "ne": "v != %(arg)s",
+    "in": "v in %(arg)s",
+    "gt": "v > %(arg)s",
+    "gte": "v >= %(arg)s",
+    "lt": "v < %(arg)s",
+    "lte": "v <= %(arg)s",
+    "contains": "%(arg)s in v",
+    "icontains": "%(arg)s in v.lower()",
+    "begins": "v.startswith(%(arg)s)",
+    "ibegins": "v.lower().startswith(%(arg)s)",
+    "ends": "v.endswith(%(arg)s)",
+    "iends": "v.lower().endswith(%(arg)s)",
+    "regex": "%(arg)s.search(v) is not None",
+}
+
+LEGACY_SUFFIXES = {"_begins": "ibegins", "_ends": "iends"}
+
+# Compiled predicate factories, by model class and criteria (without their arguments).
+_factories = {}
+_factories_lock = threading.Lock()
+
+
+def parse_criteria(cls, criteria):
+    """Returns a list of `(attribute, operator, argument)` triples for the given dict of
+       criteria, sorted by attribute and operator."""
+    parsed = []
+    for key, arg in criteria.items():
+        name, op = key, "exact"
+        if "__" in key.lstrip("_"):
+            prefix, suffix = key.rsplit("__", 1)
+            if OPERATORS.has_key(suffix): name, op = prefix, suffix
+        elif not hasattr(cls, key):
+            for legacy_suffix, legacy_op in LEGACY_SUFFIXES.items():
+                if key.endswith(legacy_suffix) and hasattr(cls, key[:-len(legacy_suffix)]):
+                    name, op = key[:-len(legacy_suffix)], legacy_op
+        parsed.append((name, op, _prepare(op, arg)))
+    parsed.sort(key=lambda triple: triple[:2])
+    return parsed
+
+
+def compile_query(cls, criteria):
+    """Compiles criteria into a pair of predicates for `cls`'s search results.
+
+       The first predicate takes an API-returned dict and tests the criteria on the
+       model's DirectAttrs, converting just the values it tests; the second takes a
+       model instance and tests the other criteria (e.g. on properties). Either one is
+       None if there's nothing for it to test."""
+    parsed = parse_criteria(cls, criteria)
+    signature = (cls, tuple([(name, op) for name, op, arg in parsed]))
+    factory = _factories.get(signature)
+    if factory is None:
+        factory = _compile_factory(cls, signature[1])
+        _factories_lock.acquire()
+        try:
+            _factories[signature] = factory
+        finally:
+            _factories_lock.release()
+    return factory([arg for name, op, arg in parsed])
+
+
+def _prepare(op, arg):
+    if op == "in":
+        try:
+            return frozenset(arg)
+        except TypeError:
+            return tuple(arg)
+    if op in ("icontains", "ibegins", "iends"): return arg.lower()
+    if op == "regex" and isinstance(arg, basestring): return re.compile(arg)
+    return arg
+
+
+def _compile_factory(cls, criteria):
+    """Generates the source of a function that takes the criteria's arguments and
+       returns the two predicates, and returns that function."""
+    namespace = {}
+    raw_lines, inst_lines = [], []
+    for i, (name, op) in enumerate(criteria):
+        test = OPERATORS[op] % {"arg": "arg%d" % (i,)}
+        attr = cls._direct_attrs_by_name.get(name)
+        if attr is None:
+            inst_lines.append("        v = inst.%s\n" % (name,))
+            inst_lines.append("        if not (%s): return False\n" % (test,))
+            continue
+        namespace["type%d" % (i,)] = attr.local_type
+        if attr.may_be_absent:
+            namespace["default%d" % (i,)] = attr.default
+            value = "row.get(%r, default%d)" % (attr.api_name, i)
+        else:
+            value = "row[%r]" % (attr.api_name,)
+        raw_lines.append("        v = type%d(%s)\n" % (i, value))
+        raw_lines.append("        if not (%s): return False\n" % (test,))
+
+    source = "def factory(args):\n"
+    for i in range(len(criteria)):
+        source += "    arg%d = args[%d]\n" % (i, i)
+    if raw_lines:
+        # A row that lacks a required value is let through, so that building the
+        # instance raises the usual error.
+        source += ("    def match_row(row):\n"
+                   "      try:\n" + "".join(raw_lines) +
+                   "      except KeyError:\n"
+                   "        return True\n"
+                   "      return True\n")
+    else:
+        source += "    match_row = None\n"
+    if inst_lines:
+        source += ("    def match_instance(inst):\n"
+                   "      if True:\n" + "".join(inst_lines) +
+                   "      return True\n")
+    else:
+        source += "    match_instance = None\n"
+    source += "    return match_row, match_instance\n"
+    exec compile(source, "<%s query>" % (cls.__name__,), "exec") in namespace
+    return namespace["factory"]
+
+
+class QueryTest:
+    """Suite of offline tests to run when `chuber test Query` is called. They run
+       against a FakeAccount, so they don't need an API key."""
+    @classmethod
+    def run(cls):
+        from .api import api_handler
+        from .fake_api import FakeAccount
+        from .linode_obj import Linode
+        from .dns import Domain
+
+        account = FakeAccount(job_duration=0)
+        account.seed(linodes=30, domains=1, records_per_domain=5)
+        uninstall = account.install(api_handler)
+        try:
+            linodes = Linode.search()
+            for n, linode_obj in enumerate(linodes):
+                label = [u"web-%d", u"Web-%d", u"db-%d"][n % 3] % (n,)
+                api_handler.linode_update(linodeid=linode_obj.api_id, label=label,
+                                          lpm_displaygroup=[u"", u"prod"][n % 2])
+            linodes = Linode.search()
+            ids = [linode_obj.api_id for linode_obj in linodes]
+
+            def check(criteria, predicate):
+                expected = [linode_obj.api_id for linode_obj in linodes if predicate(linode_obj)]
+                found = [linode_obj.api_id for linode_obj in Linode.search(**criteria)]
+                assert found == expected, (criteria, found, expected)
+
+            print "~~~ Comparing values"
+            print
+            check({"label": u"web-0"}, lambda l: l.label == u"web-0")
+            check({"label__exact": u"web-0"}, lambda l: l.label == u"web-0")
+            check({"display_group__ne": u"prod"}, lambda l: l.display_group != u"prod")
+            check({"api_id__in": ids[3:7]}, lambda l: l.api_id in ids[3:7])
+            check({"api_id__in": (ids[0],)}, lambda l: l.api_id == ids[0])
+            check({"api_id__gt": ids[10]}, lambda l: l.api_id > ids[10])
+            check({"api_id__gte": ids[10]}, lambda l: l.api_id >= ids[10])
+            check({"api_id__lt": ids[10]}, lambda l: l.api_id < ids[10])
+            check({"api_id__lte": ids[10], "display_group": u"prod"},
+                  lambda l: l.api_id <= ids[10] and l.display_group == u"prod")
+
+            print "~~~ Matching strings"
+            print
+            check({"label__contains": u"eb-1"}, lambda l: u"eb-1" in l.label)
+            check({"label__icontains": u"WEB-1"}, lambda l: u"web-1" in l.label.lower())
+            check({"label__begins": u"web-"}, lambda l: l.label.startswith(u"web-"))
+            check({"label__ibegins": u"WEB-"}, lambda l: l.label.lower().startswith(u"web-"))
+            check({"label__ends": u"-1"}, lambda l: l.label.endswith(u"-1"))
+            check({"label__iends": u"B-1"}, lambda l: l.label.lower().endswith(u"b-1"))
+            check({"label__regex": r"^db-\d*5$"}, lambda l: re.search(r"^db-\d*5$", l.label))
+            check({"label__regex": re.compile(r"^W")}, lambda l: l.label.startswith(u"W"))
+
+            print "~~~ Legacy `_begins` and `_ends` criteria"
+            print
+            check({"label_begins": u"WEB-"}, lambda l: l.label.lower().startswith(u"web-"))
+            check({"label_ends": u"B-2"}, lambda l: l.label.lower().endswith(u"b-2"))
+
+            print "~~~ Criteria on properties"
+            print
+            domain = Domain.search()[0]
+            records = domain.search_records()
+            found = domain.search_records(weight=records[0].weight, name__ne=records[1].name)
+            expected = [r for r in records if r.weight == records[0].weight and r.name != records[1].name]
+            assert [r.api_id for r in found] == [r.api_id for r in expected]
+
+            print "~~~ Parsing criteria"
+            print
+            assert parse_criteria(Linode, {"label__gte": 1, "label_begins": u"A", "api_id": 1}) == \
+                [("api_id", "exact", 1), ("label", "gte", 1), ("label", "ibegins", u"a")]
+        finally:
+            uninstall()
+
+        print "~~~ Tests passed!"
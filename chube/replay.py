@@ -0,0 +1,221 @@
+"""Module for recording API calls and replaying them without the network.
+
+   Record a run by wrapping the Handler's API factory:
+
+       recorder = chube_api_handler.record("linode-test.jsonl.gz")
+       LinodeTest.run()
+       recorder.close()
+
+   Then replay it anywhere, as often as you like:
+
+       chube_api_handler.replay("linode-test.jsonl.gz", latency="recorded")
+       LinodeTest.run()
+
+   Recordings are JSON lines, gzipped if the file name ends with ".gz". Secret
+   arguments (see REDACTED_PARAMS) aren't written to them."""
+import collections
+import gzip
+import json
+import threading
+import time
+from decimal import Decimal
+
+from linode import api as linode_api
+
+from .catalog import _encode_decimal, _decode_decimal
+
+
+# Arguments whose values are replaced with REDACTED in recordings, and ignored when
+# matching replayed calls, since they're secrets.
+REDACTED_PARAMS = ("rootpass", "rootsshkey")
+REDACTED = "<redacted>"
+
+
+class ReplayError(RuntimeError):
+    """Raised when a replayed call doesn't match anything in the recording."""
+
+
+class Recorder(object):
+    """API factory that passes calls on to another factory and records them.
+
+       Each call is written as one line: `[method, kwargs, response, latency, error]`,
+       where `error` is the API's error array (or the exception's message) if the call
+       failed, and `response` is None in that case. Calls sent in an `api.batch`
+       request are recorded as a single "batch" call.
+
+       A Recorder is safe to share between threads."""
+    def __init__(self, path, api_factory=linode_api.Api):
+        """Initializes the Recorder.
+
+           `path`: The file to write the recording to. It's overwritten.
+           `api_factory` (optional): The factory that makes the real API calls."""
+        self.path = path
+        self.api_factory = api_factory
+        self.count = 0
+        self._file = _open(path, "w")
+        self._lock = threading.Lock()
+
+    def api(self, api_key, batching=False):
+        """Returns a recording API connection object (see `Handler.api_factory`)."""
+        return _RecordingApi(self, self.api_factory(api_key, batching=batching), batching)
+
+    def write(self, method_name, kwargs, response, latency, error=None):
+        """Appends a call to the recording, with secret arguments redacted."""
+        kwargs = _redact(method_name, kwargs)
+        line = json.dumps([method_name, kwargs, response, round(latency, 6), error],
+                          separators=(",", ":"), default=_encode_decimal)
+        self._lock.acquire()
+        try:
+            self._file.write(line + "\n")
+            self.count += 1
+        finally:
+            self._lock.release()
+
+    def close(self):
+        """Finishes writing the recording."""
+        self._lock.acquire()
+        try:
+            self._file.close()
+        finally:
+            self._lock.release()
+
+
+class _RecordingApi(object):
+    def __init__(self, recorder, api, batching):
+        self._recorder = recorder
+        self._api = api
+        self._batching = batching
+        self._queued = []
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        api_method = getattr(self._api, name)
+        def call(**kwargs):
+            if self._batching:
+                self._queued.append([name, kwargs])
+                return api_method(**kwargs)
+            return self._record(name, kwargs, lambda: api_method(**kwargs))
+        return call
+
+    def batchFlush(self):
+        queued, self._queued = self._queued, []
+        return self._record("batch", {"calls": queued}, self._api.batchFlush)
+
+    def _record(self, method_name, kwargs, func):
+        start = time.time()
+        try:
+            response = func()
+        except Exception, e:
+            error = getattr(e, "value", None)
+            if not isinstance(error, list): error = unicode(e)
+            self._recorder.write(method_name, kwargs, None, time.time() - start, error)
+            raise
+        self._recorder.write(method_name, kwargs, response, time.time() - start)
+        return response
+
+
+class Replayer(object):
+    """API factory that answers calls from a recording made by a Recorder.
+
+       Calls are matched on method name and arguments. When the same call was recorded
+       several times, the responses are served in the order they were recorded, and
+       the last one keeps being served after that. Recorded errors are raised again:
+       API errors as `linode.api.ApiError`, anything else as a RuntimeError.
+
+       A Replayer is safe to share between threads."""
+    def __init__(self, path, latency=None):
+        """Initializes the Replayer.
+
+           `path`: The recording to replay.
+           `latency` (optional): How long each call should take. `None` means no delay,
+               "recorded" means as long as it took when it was recorded, a number
+               means that many seconds, and a callable is called with the method name
+               and must return a number of seconds."""
+        self.path = path
+        self.latency = latency
+        self._calls = {}
+        self._lock = threading.Lock()
+        f = _open(path, "r")
+        try:
+            for line in f:
+                if not line.strip(): continue
+                method_name, kwargs, response, latency, error = json.loads(line, parse_float=Decimal,
+                                                                          object_hook=_decode_decimal)
+                key = _call_key(method_name, kwargs)
+                self._calls.setdefault(key, collections.deque()).append((response, latency, error))
+        finally:
+            f.close()
+
+    def api(self, api_key, batching=False):
+        """Returns a replaying API connection object (see `Handler.api_factory`)."""
+        return _ReplayApi(self, batching)
+
+    def answer(self, method_name, kwargs):
+        """Returns the recorded response to a call, or raises its recorded error."""
+        self._lock.acquire()
+        try:
+            recorded = self._calls.get(_call_key(method_name, kwargs))
+            if not recorded:
+                raise ReplayError("No recorded call to '%s' with arguments %s" % (method_name, kwargs))
+            response, latency, error = recorded[0]
+            if len(recorded) > 1: recorded.popleft()
+        finally:
+            self._lock.release()
+        delay = self._delay(method_name, latency)
+        if delay > 0: time.sleep(delay)
+        if isinstance(error, list): raise linode_api.ApiError(error)
+        if error is not None: raise RuntimeError(error)
+        return response
+
+    def _delay(self, method_name, recorded_latency):
+        if self.latency is None: return 0
+        if self.latency == "recorded": return float(recorded_latency)
+        if callable(self.latency): return self.latency(method_name)
+        return self.latency
+
+
+class _ReplayApi(object):
+    def __init__(self, replayer, batching):
+        self._replayer = replayer
+        self._batching = batching
+        self._queued = []
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        def call(**kwargs):
+            if self._batching:
+                self._queued.append([name, kwargs])
+                return None
+            return self._replayer.answer(name, kwargs)
+        return call
+
+    def batchFlush(self):
+        queued, self._queued = self._queued, []
+        return self._replayer.answer("batch", {"calls": queued})
+
+
+def _redact(method_name, kwargs):
+    """Returns a copy of a call's arguments with the values of REDACTED_PARAMS
+       replaced, including in the calls of a "batch" call."""
+    if method_name == "batch" and kwargs.has_key("calls"):
+        return dict(kwargs, calls=[[name, _redact(name, call_kwargs)]
+                                   for name, call_kwargs in kwargs["calls"]])
+    redacted = dict(kwargs)
+    for key in kwargs:
+        if key.lower() in REDACTED_PARAMS: redacted[key] = REDACTED
+    return redacted
+
+
+def _call_key(method_name, kwargs):
+    # Round-trip through JSON so that recorded and live arguments compare equal.
+    kwargs = _redact(method_name, kwargs)
+    kwargs = json.loads(json.dumps(kwargs, default=_encode_decimal), parse_float=Decimal,
+                        object_hook=_decode_decimal)
+    return method_name, json.dumps(kwargs, sort_keys=True, default=_encode_decimal)
+
+
+def _open(path, mode):
+    if path.endswith(".gz"): return gzip.open(path, mode + "b")
+    return open(path, mode)
@@ -0,0 +1,149 @@
+"""Module for sharing model instances within a scope."""
+import threading
+import weakref
+
+
+class Session:
+    """An identity map of model instances, keyed by class and `api_id`.
+
+       Get one from `Handler.session` and use it as a context manager:
+
+           with chube_api_handler.session():
+               a = Linode.find(api_id=1234)
+               b = Linode.search(label_begins="web-")[0]   # same Linode
+               a is b                                      # True
+               config.linode                               # no API call
+
+       Inside the `with` block, every model object built from an API response is
+       looked up in the session first. If the session already holds an object for the
+       same API object, that object is updated in place (leaving alone any attributes
+       you've changed but not saved yet) and returned, instead of a new one being
+       built. Relationship attributes like `Config.linode` or `Record.domain` are
+       answered from the session when it has the object, without an API call.
+
+       The session only holds weak references, so objects you no longer use are freed
+       as usual. A Session only affects the thread that entered it, and the functions
+       that thread runs through `Handler.submit` or `Handler.map` (like `prefetch`'s
+       lookups), so those may use it from several threads at once."""
+    def __init__(self, handler):
+        """Initializes the Session.
+
+           `handler`: The Handler whose thread-local state holds the active session."""
+        self.reused = 0
+        self._handler = handler
+        self._instances = weakref.WeakValueDictionary()
+        self._previous = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self._previous = self._handler._current_session()
+        self._handler._local.session = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._handler._local.session = self._previous
+        self._previous = None
+        return False
+
+    def __len__(self):
+        return len(self._instances)
+
+    def get(self, cls, api_id):
+        """Returns the session's instance of `cls` with the given `api_id`, or None."""
+        return self._instances.get((cls, api_id))
+
+    def add(self, inst):
+        """Adds an instance to the session, replacing any other one for the same API
+           object."""
+        self._instances[(type(inst), inst.api_id)] = inst
+
+    def clear(self):
+        """Forgets every instance in the session."""
+        self._instances.clear()
+
+    def load(self, cls, api_dict):
+        """Returns the instance of `cls` for an API-returned dict: the one already in the
+           session, updated in place, or a new one, which is added to the session."""
+        hydrate = cls._hydrate_lazy if cls.lazy_hydration else cls._hydrate
+        id_attr = cls._direct_attrs_by_name.get("api_id")
+        if id_attr is None or not api_dict.has_key(id_attr.api_name):
+            return hydrate(api_dict)
+        key = (cls, id_attr.local_type(api_dict[id_attr.api_name]))
+        self._lock.acquire()
+        try:
+            inst = self._instances.get(key)
+            if inst is None:
+                inst = hydrate(api_dict)
+                self._instances[key] = inst
+            else:
+                inst._copy_from(cls._hydrate(api_dict), keep_changes=True)
+                self.reused += 1
+        finally:
+            self._lock.release()
+        return inst
+
+
+class SessionTest:
+    """Suite of offline tests to run when `chuber test Session` is called. They run
+       against a FakeAccount, so they don't need an API key."""
+    @classmethod
+    def run(cls):
+        import gc
+
+        from .api import api_handler
+        from .fake_api import FakeAccount
+        from .linode_obj import Linode, Config
+
+        account = FakeAccount(job_duration=0)
+        account.seed(linodes=3, disks_per_linode=1, configs_per_linode=1)
+        uninstall = account.install(api_handler)
+        try:
+            api_id = Linode.search()[0].api_id
+
+            print "~~~ Looking up the same Linode twice without a session"
+            print
+            assert Linode.find(api_id=api_id) is not Linode.find(api_id=api_id)
+
+            print "~~~ Looking up the same Linode twice in a session"
+            print
+            with api_handler.session() as session:
+                node = Linode.find(api_id=api_id)
+                assert [l for l in Linode.search() if l.api_id == api_id][0] is node
+                assert Linode.handle(api_id) is node
+                assert session.reused >= 1
+
+                print "~~~ Getting a config's Linode from the session"
+                print
+                account.log = []
+                config = Config.search(linode=node)[0]
+                assert config.linode is node
+                assert [method_name for method_name, kwargs in account.log] == ["linode_config_list"]
+                account.log = None
+
+                print "~~~ Updating the session's Linode in place"
+                print
+                node.label = u"chube-test-local"
+                api_handler.linode_update(linodeid=api_id, lpm_displaygroup=u"chube-test")
+                assert Linode.find(api_id=api_id) is node
+                assert node.display_group == u"chube-test"
+                assert node.label == u"chube-test-local" and node.changed_fields == ["label"]
+                node.refresh()
+                assert node.label != u"chube-test-local" and not node.is_dirty
+
+                print "~~~ Nesting sessions"
+                print
+                with api_handler.session():
+                    assert Linode.find(api_id=api_id) is not node
+                assert api_handler._current_session() is session
+
+                print "~~~ Forgetting objects that aren't used anymore"
+                print
+                count = len(session)
+                del node, config
+                gc.collect()
+                assert len(session) < count
+            assert api_handler._current_session() is None
+        finally:
+            uninstall()
+
+        print "~~~ Tests passed!"
@@ -1,5 +1,6 @@
 """Module for the Stackscript model."""
 import json
+import time
 
 from .api import api_handler
 from .util import RequiresParams, keywords_only
@@ -26,7 +27,7 @@ class Stackscript(Model):
     direct_attrs = [
         # IDs
         DirectAttr("api_id", u"STACKSCRIPTID", int, int,
-                   update_as="stackscriptid"),
+                   update_as="stackscriptid", is_key=True),
         DirectAttr("distribution_id_list", u"DISTRIBUTIONIDLIST", unicode, unicode,
                    update_as="distributionidlist"),
 
@@ -51,12 +52,23 @@ class Stackscript(Model):
         DirectAttr("deployments_total", u"DEPLOYMENTSTOTAL", int, int)
     ]
 
+    list_method = "stackscript_list"
+    list_id_param = "stackscriptid"
+
     # The `distributions` attribute is based on `distribution_id_list`
     def _distributions_getter(self):
-        """Returns the list of distributions associated with the Stackscript."""
+        """Returns the list of distributions associated with the Stackscript.
+
+           They're all taken from a single `avail_distributions` call."""
+        distribution_ids = [int(distribution_id) for distribution_id in self.distribution_id_list.split(",")
+                            if distribution_id != ""]
+        if not distribution_ids: return []
+        distributions_by_id = dict([(distribution.api_id, distribution) for distribution in Distribution.search()])
         distributions = []
-        for distribution_id in self.distribution_id_list.split(","):
-            distributions.append(Distribution.find(linode=self.linode_id, api_id=int(distribution_id)))
+        for distribution_id in distribution_ids:
+            if not distributions_by_id.has_key(distribution_id):
+                raise RuntimeError("No Distribution found with api_id %s" % (distribution_id,))
+            distributions.append(distributions_by_id[distribution_id])
         return distributions
     def _distributions_setter(self, val):
         """Updates the list of distributions associated with the configuration.
@@ -66,7 +78,9 @@ class Stackscript(Model):
         for distribution in val:
             distribution_ids.append(distribution.api_id)
         self.distribution_id_list = ",".join(map(str, distribution_ids))
-    distributions = property(_distributions_getter, _distributions_setter)
+        self._remember_related("distributions", list(val), time.time())
+    distributions = Related(_distributions_getter, _distributions_setter, cached=False,
+                            derived_from=["distribution_id_list"])
 
     @classmethod
     @keywords_only
@@ -76,14 +90,7 @@ class Stackscript(Model):
            The special paramater `label_begins` allows you to case-insensitively
            match the beginning of the label string. For example,
            `Stackscript.search(label_begins='web-')`."""
-        a = [cls.from_api_dict(d) for d in api_handler.stackscript_list()]
-        if kwargs.has_key("label_begins"):
-            a = [stackscript for stackscript in a if
-                 stackscript.label.lower().startswith(kwargs["label_begins"].lower())]
-            del kwargs["label_begins"]
-        for k, v in kwargs.items():
-            a = [stackscript for stackscript in a if getattr(stackscript, k) == v]
-        return a
+        return cls._search(kwargs)
 
     @classmethod
     @keywords_only
@@ -130,16 +137,14 @@ class Stackscript(Model):
         return cls.find(api_id=new_stackscript_id)
 
     def save(self):
-        """Saves the Stackscript object to the API."""
-        api_params = self.api_update_params()
-        api_handler.stackscript_update(**api_params)
+        """Saves the changes made to the Stackscript object to the API, if there are any."""
+        if not self.is_dirty: return
+        api_params = self.api_update_params(changed_only=True)
+        self._mark_saved_when_done(api_handler.stackscript_update(**api_params))
 
     def refresh(self):
         """Refreshes the Stackscript object with a new API call."""
-        new_inst = Stackscript.find(api_id=self.api_id)
-        for attr in self.direct_attrs:
-            setattr(self, attr.local_name, getattr(new_inst, attr.local_name))
-        del new_inst
+        self._refresh_with(lambda: Stackscript.find(api_id=self.api_id))
 
     def destroy(self):
         """Deletes the Stackscript."""
@@ -0,0 +1,270 @@
+"""Module for rate-limit-aware throttling of API calls."""
+import collections
+import random
+import threading
+import time
+
+
+# Substrings of error messages that mean the API is rate-limiting us.
+RATE_LIMIT_MESSAGES = ("rate limit", "rate-limit", "too many requests", "throttl")
+
+
+def is_rate_limit_error(error):
+    """Determines whether an exception raised by an API call means we're being rate-limited.
+
+       Recognizes HTTP 429 responses (which come with a `code` attribute, as on
+       `urllib2.HTTPError` and `chube.transport.HTTPError`) and API errors whose
+       messages talk about rate limits."""
+    if getattr(error, "code", None) == 429:
+        return True
+    messages = [_text(error)]
+    value = getattr(error, "value", None)
+    if isinstance(value, list):
+        messages.extend([_text(e.get(u"ERRORMESSAGE", u"")) for e in value if isinstance(e, dict)])
+    for message in messages:
+        message = message.lower()
+        for fragment in RATE_LIMIT_MESSAGES:
+            if fragment in message: return True
+    return False
+
+
+def _text(value):
+    """Returns `value` as unicode, even if it holds undecodable bytes."""
+    try:
+        return unicode(value)
+    except UnicodeError:
+        try:
+            return str(value).decode("utf-8", "replace")
+        except UnicodeError:
+            return u""
+
+
+def is_idempotent(method_name):
+    """Determines whether an API method can safely be retried."""
+    return method_name.endswith("_list") or method_name.startswith("avail_")
+
+
+class AdaptiveThrottle(object):
+    """Token-bucket throttle that adapts its rate to the API's rate limit.
+
+       The throttle starts out unlimited. The first time a call is rate-limited, it
+       sets its rate a bit below the fastest rate it has seen calls go through at
+       (measured over `window` seconds), or `burst` calls/second if that's higher.
+       After that, a rate-limited call shrinks the rate again (at most once every
+       `decrease_interval` seconds, since the API keeps rejecting calls for a little
+       while after it starts), and every successful call grows it by `recovery_step`
+       calls/second. The rate settles just under what the API will sustain.
+
+       Rate-limited calls to idempotent methods (`*_list` and `avail_*`) are retried
+       up to `max_retries` times, after a jittered exponential backoff. Other calls
+       are never retried, since they might already have taken effect.
+
+       An AdaptiveThrottle is safe to share between threads."""
+    def __init__(self, rate=None, burst=10, min_rate=0.5, max_rate=None, window=10,
+                 backoff_factor=0.8, decrease_interval=1.0, recovery_step=0.05,
+                 max_retries=5, base_delay=0.5, max_delay=30):
+        """Initializes the AdaptiveThrottle.
+
+           `rate` (optional): Initial rate limit, in calls per second. `None` means no
+               limit until the API pushes back.
+           `burst` (optional): Number of calls that may go through back-to-back.
+           `min_rate`, `max_rate` (optional): Bounds for the adapted rate.
+           `window` (optional): Number of seconds of history to use when measuring
+               the observed rate.
+           `backoff_factor` (optional): The rate is multiplied by this when a call is
+               rate-limited.
+           `decrease_interval` (optional): Minimum number of seconds between two
+               reductions of the rate.
+           `recovery_step` (optional): Calls/second added to the rate after each
+               successful call.
+           `max_retries` (optional): How many times to retry an idempotent call.
+           `base_delay`, `max_delay` (optional): Bounds, in seconds, for the exponential
+               backoff between retries."""
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.window = window
+        self.backoff_factor = backoff_factor
+        self.decrease_interval = decrease_interval
+        self.recovery_step = recovery_step
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rate_limited_count = 0
+        self.retry_count = 0
+        self._tokens = burst
+        self._last_refill = time.time()
+        self._last_decrease = 0
+        self._peak = 0.0
+        self._recent = collections.deque()
+        self._lock = threading.Lock()
+
+    def call(self, method_name, func, kwargs):
+        """Calls `func(**kwargs)` under the throttle, retrying if appropriate.
+
+           `method_name` is the name of the API method `func` calls."""
+        attempt = 0
+        while True:
+            self.acquire()
+            try:
+                result = func(**kwargs)
+            except Exception, e:
+                if not is_rate_limit_error(e): raise
+                self.record_rate_limited()
+                if attempt >= self.max_retries or not is_idempotent(method_name): raise
+                self._lock.acquire()
+                try:
+                    self.retry_count += 1
+                finally:
+                    self._lock.release()
+                time.sleep(self.backoff_delay(attempt))
+                attempt += 1
+                continue
+            self.record_success()
+            return result
+
+    def acquire(self):
+        """Blocks until the throttle lets another call through."""
+        self._lock.acquire()
+        try:
+            if self.rate is None: return
+            now = time.time()
+            self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+            # Reserve a token even if we have to wait for it, so that waiting callers
+            # are let through in order.
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        finally:
+            self._lock.release()
+        if wait > 0: time.sleep(wait)
+
+    def record_success(self):
+        """Notes that a call went through."""
+        self._lock.acquire()
+        try:
+            now = time.time()
+            self._recent.append(now)
+            self._trim(now)
+            self._peak = max(self._peak, self._observed(now))
+            if self.rate is not None:
+                self.rate += self.recovery_step
+                if self.max_rate is not None: self.rate = min(self.rate, self.max_rate)
+        finally:
+            self._lock.release()
+
+    def record_rate_limited(self):
+        """Notes that a call was rate-limited, and shrinks the rate accordingly."""
+        self._lock.acquire()
+        try:
+            now = time.time()
+            self._trim(now)
+            self.rate_limited_count += 1
+            if now - self._last_decrease < self.decrease_interval:
+                return
+            self._last_decrease = now
+            if self.rate is None:
+                # The last window may have seen only a call or two, so it doesn't say
+                # much about the rate the API allows.
+                new_rate = max(self._peak, self.burst)
+            else:
+                new_rate = self.rate
+            # Only a window with a good run of calls in it is a useful measurement.
+            if len(self._recent) >= self.burst:
+                new_rate = min(new_rate, self._observed(now))
+            self.rate = max(self.min_rate, new_rate * self.backoff_factor)
+            self._tokens = min(self._tokens, 0)
+            self._last_refill = now
+        finally:
+            self._lock.release()
+
+    def backoff_delay(self, attempt):
+        """Returns how long to wait before retry number `attempt` (counting from 0)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _observed(self, now):
+        if not self._recent: return 0.0
+        return len(self._recent) / max(now - self._recent[0], 1.0)
+
+    def _trim(self, now):
+        while self._recent and self._recent[0] < now - self.window:
+            self._recent.popleft()
+
+
+class ThrottleTest:
+    """Suite of offline tests to run when `chuber test Throttle` is called. They run
+       against a FakeAccount, so they don't need an API key."""
+    @classmethod
+    def run(cls):
+        from linode import api as linode_api
+
+        from .api import api_handler
+        from .fake_api import FakeAccount
+
+        def rate_limit_error():
+            return linode_api.ApiError([{u"ERRORCODE": 8, u"ERRORMESSAGE": u"Rate limit exceeded"}])
+
+        account = FakeAccount(job_duration=0)
+        account.seed(linodes=2)
+        uninstall = account.install(api_handler)
+        saved_throttle = api_handler.throttle
+        throttle = api_handler.throttle = AdaptiveThrottle(decrease_interval=0, base_delay=0.001,
+                                                           max_delay=0.01)
+        try:
+            linode_id = api_handler.linode_list()[0][u"LINODEID"]
+
+            print "~~~ Recognizing rate-limit errors"
+            print
+            assert is_rate_limit_error(rate_limit_error())
+            assert is_rate_limit_error(Exception("429 Too Many Requests \xff"))
+            assert not is_rate_limit_error(Exception(u"Object not found"))
+
+            print "~~~ Retrying rate-limited list calls"
+            print
+            assert throttle.rate is None
+            account.log = []
+            account.inject_error("linode_list", rate_limit_error(), count=2)
+            assert len(api_handler.linode_list()) == 2
+            assert [method for method, kwargs in account.log] == ["linode_list"] * 3
+            account.log = None
+            assert throttle.retry_count == 2 and throttle.rate_limited_count == 2
+            assert throttle.rate is not None and throttle.rate >= throttle.min_rate
+
+            print "~~~ Shrinking the rate when rate-limited again"
+            print
+            rate = throttle.rate
+            account.inject_error("linode_list", rate_limit_error())
+            api_handler.linode_list()
+            assert throttle.rate < rate, (throttle.rate, rate)
+
+            print "~~~ Not retrying other calls"
+            print
+            retries = throttle.retry_count
+            account.log = []
+            account.inject_error("linode_update", rate_limit_error())
+            try:
+                api_handler.linode_update(linodeid=linode_id, label=u"renamed")
+            except linode_api.ApiError:
+                pass
+            else:
+                raise AssertionError("A rate-limited linode_update didn't raise")
+            assert [method for method, kwargs in account.log] == ["linode_update"]
+            account.log = None
+            assert throttle.retry_count == retries
+
+            print "~~~ Giving up after max_retries"
+            print
+            throttle.max_retries = 1
+            account.inject_error("linode_list", rate_limit_error(), count=2)
+            try:
+                api_handler.linode_list()
+            except linode_api.ApiError:
+                pass
+            else:
+                raise AssertionError("linode_list was retried more than max_retries times")
+        finally:
+            api_handler.throttle = saved_throttle
+            uninstall()
+
+        print "~~~ Tests passed!"
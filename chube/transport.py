@@ -0,0 +1,241 @@
+"""Module for the pooled HTTP transport.
+
+   By default, chube talks to the API through linode-python, which opens a new
+   connection (and does a new TLS handshake) for most calls. A PooledTransport keeps
+   connections open between calls and hands them out again. To use one:
+
+       from chube.transport import PooledTransport
+       chube_api_handler.api_factory = PooledTransport(pool_size=8).api"""
+import json
+import socket
+import ssl
+import threading
+import time
+import httplib
+import urllib
+import urlparse
+from decimal import Decimal
+
+from linode import api as linode_api
+
+
+LINODE_API_URL = "https://api.linode.com/api/"
+USER_AGENT = "chube (pooled transport)"
+
+
+class HTTPError(IOError):
+    """Raised when the API responds with an HTTP error status.
+
+       `code` is the HTTP status code, as with `urllib2.HTTPError`."""
+    def __init__(self, code, reason, body):
+        IOError.__init__(self, "HTTP %d %s" % (code, reason))
+        self.code = code
+        self.reason = reason
+        self.body = body
+
+
+class PooledTransport(object):
+    """Sends HTTP(S) POST requests over a pool of keep-alive connections.
+
+       A PooledTransport is safe to share between threads."""
+    # Errors that mean a kept-alive connection was closed under us. When we see
+    # one of these on a reused connection, we retry once on a fresh connection.
+    STALE_CONNECTION_ERRORS = (httplib.BadStatusLine, httplib.CannotSendRequest,
+                               httplib.ResponseNotReady, socket.error)
+
+    def __init__(self, pool_size=4, per_host_limit=None, idle_timeout=60, timeout=30,
+                 ssl_context=None):
+        """Initializes the PooledTransport.
+
+           `pool_size` (optional): Maximum number of idle connections to keep open,
+               across all hosts.
+           `per_host_limit` (optional): Maximum number of requests to a single host that
+               may be in flight at once. Callers wait for a connection to free up once the
+               limit is reached. `None` means no limit.
+           `idle_timeout` (optional): Idle connections older than this many seconds are
+               closed instead of reused.
+           `timeout` (optional): Socket timeout, in seconds, for each request.
+           `ssl_context` (optional): An `ssl.SSLContext` to use for HTTPS connections.
+               Defaults to `ssl.create_default_context()`, which verifies certificates."""
+        self.pool_size = pool_size
+        self.per_host_limit = per_host_limit
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        if ssl_context is None:
+            ssl_context = ssl.create_default_context()
+        self.ssl_context = ssl_context
+        self.connections_opened = 0
+        self._idle = {}
+        self._in_use = {}
+        self._cond = threading.Condition()
+
+    def api(self, api_key, batching=False):
+        """Returns a TransportApi that sends its requests through this transport.
+
+           This method has the same signature as `linode.api.Api`, so it can be assigned
+           to `Handler.api_factory`."""
+        return TransportApi(api_key, batching=batching, transport=self)
+
+    def post(self, url, fields, headers=None):
+        """POSTs the given dict of form fields to `url` and returns the response body.
+
+           Raises an HTTPError if the response has an error status."""
+        parsed = urlparse.urlsplit(url)
+        host_key = (parsed.scheme, parsed.hostname,
+                    parsed.port or (443 if parsed.scheme == "https" else 80))
+        path = parsed.path or "/"
+        if parsed.query: path += "?" + parsed.query
+        body = urllib.urlencode([(k, _utf8(v)) for k, v in fields.items()])
+        all_headers = {"Content-Type": "application/x-www-form-urlencoded",
+                       "User-Agent": USER_AGENT,
+                       "Connection": "keep-alive"}
+        if headers: all_headers.update(headers)
+
+        conn, reused = self._checkout(host_key)
+        try:
+            try:
+                status, reason, data, reusable = self._request(conn, path, body, all_headers)
+            except self.STALE_CONNECTION_ERRORS:
+                if not reused: raise
+                conn.close()
+                conn = self._connect(host_key)
+                status, reason, data, reusable = self._request(conn, path, body, all_headers)
+        except:
+            self._checkin(host_key, conn, False)
+            raise
+        self._checkin(host_key, conn, reusable)
+
+        if status >= 400:
+            raise HTTPError(status, reason, data)
+        return data
+
+    def close(self):
+        """Closes all idle connections."""
+        self._cond.acquire()
+        try:
+            for conns in self._idle.values():
+                for conn, last_used in conns: conn.close()
+            self._idle = {}
+        finally:
+            self._cond.release()
+
+    def idle_count(self):
+        """Returns the number of idle connections in the pool."""
+        self._cond.acquire()
+        try:
+            return self._idle_total()
+        finally:
+            self._cond.release()
+
+    def _idle_total(self):
+        return sum([len(conns) for conns in self._idle.values()])
+
+    def _request(self, conn, path, body, headers):
+        conn.request("POST", path, body, headers)
+        resp = conn.getresponse()
+        data = resp.read()
+        return resp.status, resp.reason, data, not resp.will_close
+
+    def _connect(self, host_key):
+        scheme, host, port = host_key
+        if scheme == "https":
+            conn = httplib.HTTPSConnection(host, port, timeout=self.timeout,
+                                           context=self.ssl_context)
+        else:
+            conn = httplib.HTTPConnection(host, port, timeout=self.timeout)
+        conn.connect()
+        # Requests are small, so don't let Nagle's algorithm hold them back.
+        conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connections_opened += 1
+        return conn
+
+    def _checkout(self, host_key):
+        """Returns a `(connection, reused)` tuple for the given host."""
+        self._cond.acquire()
+        try:
+            while True:
+                idle = self._idle.get(host_key, [])
+                now = time.time()
+                while idle:
+                    conn, last_used = idle.pop()
+                    if now - last_used <= self.idle_timeout:
+                        self._in_use[host_key] = self._in_use.get(host_key, 0) + 1
+                        return conn, True
+                    conn.close()
+                in_use = self._in_use.get(host_key, 0)
+                if self.per_host_limit is None or in_use < self.per_host_limit:
+                    self._in_use[host_key] = in_use + 1
+                    break
+                self._cond.wait()
+        finally:
+            self._cond.release()
+        try:
+            return self._connect(host_key), False
+        except:
+            self._checkin(host_key, None, False)
+            raise
+
+    def _checkin(self, host_key, conn, reusable):
+        self._cond.acquire()
+        try:
+            self._in_use[host_key] -= 1
+            if conn is not None:
+                if reusable and self._idle_total() < self.pool_size:
+                    self._idle.setdefault(host_key, []).append((conn, time.time()))
+                else:
+                    conn.close()
+            self._cond.notify()
+        finally:
+            self._cond.release()
+
+
+class TransportApi:
+    """Stand-in for `linode.api.Api` that sends its requests through a transport.
+
+       Requests and responses are handled the same way linode-python handles them:
+       method names like `linode_disk_list` become `linode.disk.list` actions, and
+       error responses are raised as `linode.api.ApiError`."""
+    def __init__(self, key, batching=False, transport=None, url=LINODE_API_URL):
+        if transport is None: transport = PooledTransport()
+        self.batching = batching
+        self._key = key
+        self._transport = transport
+        self._url = url
+        self._batch_cache = []
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        def api_method(**kwargs):
+            request = dict([(k.lower(), v) for k, v in kwargs.items()])
+            request["api_action"] = name.replace("_", ".")
+            if self.batching:
+                self._batch_cache.append(request)
+                return None
+            return self._send(request)
+        api_method.__name__ = name
+        return api_method
+
+    def batchFlush(self):
+        """Sends all batched requests and returns the list of their responses."""
+        if not self.batching:
+            raise RuntimeError("Cannot flush requests when not batching")
+        request_array, self._batch_cache = json.dumps(self._batch_cache), []
+        return self._send({"api_action": "batch", "api_requestArray": request_array})
+
+    def _send(self, request):
+        request["api_key"] = self._key
+        request["api_responseFormat"] = "json"
+        body = self._transport.post(self._url, request)
+        response = json.loads(body, parse_float=Decimal)
+        if isinstance(response, dict):
+            errors = response.get(u"ERRORARRAY", [])
+            if errors and errors[0].get(u"ERRORCODE") != 0:
+                raise linode_api.ApiError(errors)
+            return response[u"DATA"]
+        return response
+
+
+def _utf8(val):
+    if isinstance(val, unicode): return val.encode("utf-8")
+    return str(val)
@@ -14,6 +14,7 @@ setup(
         install_requires=[
             "linode-python >= 1.0",
             "PyYAML >= 3.10",
-            "pycurl >= 7.10"
+            "pycurl >= 7.10",
+            "futures >= 2.1.3"
         ],
 )